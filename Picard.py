@@ -1,13 +1,29 @@
+import argparse
+import json
 import logging
+import multiprocessing
+import os
+import time
+from collections import deque
 from services.okta_service import OktaService
-from services.coupa_service import CoupaService
-from services.brex_service import BrexService
-from services.jira_service import JiraService
-from services.servicenow_service import ServiceNowService
-from services.workday_service import WorkdayService
+from services.service_registry import ServiceRegistry
 from services.slack_service import SlackService
+from services.approval_collector import ApprovalCollector
+from services.approval_index import ApprovalIndex
+from services.slack_delivery import SlackDeliveryQueue
+from services.digest_tracker import DigestTracker, keep_numbering, FULL, DELTA, SKIP, PARTIAL
+from services.identity_resolver import IdentityResolver
+from services.approval_cache import ApprovalCache
 from utils.logger import setup_logging
 from utils.database import Database
+from utils.http_session import SessionPool
+from utils.state_store import SQLiteStateStore, CachedStateStore
+from utils.run_ledger import RunLedger, DONE, FAILED, UNDELIVERED
+from utils.sharding import HashRing, parse_shard
+from utils.resilience import ResilientService, OPEN
+from utils.metrics import metrics
+from utils.profiler import SamplingProfiler
+from utils.scheduler import DeliverySchedule, SCHEDULE_NAMESPACE
 from config.settings import Config
 from datetime import datetime
 
@@ -17,48 +33,515 @@ class Picard:
     """
     def __init__(self):
         self.config = Config()
-        self.db = Database(self.config.database_uri)
+        # The daily run needs every integration, so fetch all their secrets in one batch.
+        self.config.preload_secrets()
+        self.db = Database(self.config.database_uri, **self.config.audit)
         self.logger = setup_logging(self.config.log_level)
-        self.okta_service = OktaService(self.config.okta)
-        self.coupa_service = CoupaService(self.config.coupa)
-        self.brex_service = BrexService(self.config.brex)
-        self.jira_service = JiraService(self.config.jira)
-        self.servicenow_service = ServiceNowService(self.config.servicenow)
-        self.workday_service = WorkdayService(self.config.workday)
-        self.slack_service = SlackService(self.config.slack)
+        self.session_pool = SessionPool(**self.config.http)
+        self.state_store = CachedStateStore(SQLiteStateStore(self.config.state_store_uri))
+        self.okta_service = OktaService(self.config.okta, self.session_pool)
+        self.services = ServiceRegistry(self.config, self.session_pool)
+        # Approval fetches go through per-system timeouts, retries and circuit breakers,
+        # so one failing system only leaves its items out of the digests.
+        self.approval_services = {
+            name: ResilientService(name, self.services.get(name), timeout=self.config.system_timeouts.get(name),
+                                   **self.config.resilience)
+            for name in self.services.names()
+        }
+        self.slack_service = SlackService(self.config.slack, self.session_pool, self.state_store,
+                                          api_url=self.config.slack.get('api_url'), services=self.approval_services)
+        self.slack_service.delivery = SlackDeliveryQueue(self.slack_service,
+                                                         workers=self.config.slack_delivery_workers,
+                                                         rate_limits=self.config.slack_rate_limits)
+        self.slack_service.identities = IdentityResolver(self.state_store, self.slack_service,
+                                                         ttl=self.config.identity_ttl)
+        # The run fills the approval cache, so a user's first 'list' after their digest needs no fetches.
+        self.approval_cache = ApprovalCache(self.state_store, self.approval_services, self.approval_services,
+                                            **self.config.approval_cache)
+        self.slack_service.approval_cache = self.approval_cache
+        self.digest_tracker = DigestTracker(self.db, mode=self.config.digest_mode)
+        self.ledger = RunLedger(self.db, batch_size=self.config.ledger_batch_size)
+        self.collector = ApprovalCollector(self.approval_services,
+                                           max_concurrency=self.config.max_concurrency,
+                                           max_users_in_flight=self.config.max_users_in_flight)
 
-    def run(self, test_user_id=None):
+    def run(self, test_user_id=None, resume=False, shard=None, user_ids=None, index=None):
         """
-        Starts the daily process of fetching pending approvals.
+        Starts the daily process of fetching pending approvals and returns the run statistics.
         If test_user_id is provided, runs the bot for a single user ID instead of retrieving the full list from Okta.
+        If resume is True, picks up the last unfinished run: completed users are skipped and only failed systems are retried.
+        If shard is given as (index, count), only processes the users that the hash ring assigns to that shard.
+        user_ids and index, if given, are the shard's users and its part of the bulk approval index, handed over by
+        the sharded coordinator so that shards do not list Okta or fetch the bulk systems themselves.
         """
-        self.logger.info("Starting daily run...")
+        run_prefix = f"shard{shard[0]}of{shard[1]}-" if shard else 'run-'
+        run_id, resumed = self.ledger.start(resume, run_prefix)
+        self.logger.info(f"{'Resuming' if resumed else 'Starting'} daily run {run_id}...")
+        start_time = time.monotonic()
+        owns_user = None
+        if shard:
+            ring = HashRing(shard[1])
+            owns_user = lambda user_id: ring.shard_for(user_id) == shard[0]
         if test_user_id:
             user_ids = [test_user_id]
+            bulk_systems = []
             self.logger.info(f"Running in test mode for user ID: {test_user_id}")
+        elif user_ids is not None:
+            bulk_systems = []
+            self.logger.info(f"Running for {len(user_ids)} users assigned by the coordinator")
         else:
-            user_ids = self.okta_service.get_active_users()
-            self.logger.info(f"Retrieved {len(user_ids)} users from Okta")
-        for user_id in user_ids:
-            self.process_user_approvals(user_id)
+            # Users without a Slack account cannot be sent a digest, so their approvals are not fetched.
+            user_ids = (user_id for user_id in self.active_users() if not owns_user or owns_user(user_id))
+            bulk_systems = self.bulk_systems()
+            self.logger.info("Streaming active users from Okta")
 
-    def process_user_approvals(self, user_id):
+        stats = self.process_users(user_ids, bulk_systems, owns_user, index)
+        stats['run_id'] = run_id
+        stats['elapsed'] = time.monotonic() - start_time
+        self.finish_run(stats)
+        return stats
+
+    def process_users(self, user_ids, bulk_systems=(), owns_user=None, index=None):
+        """
+        Fetches the pending approvals of the given users and sends their digests, checkpointing each user in the
+        current ledger run. Returns the user, failure, digest and Slack delivery counts.
+        Approvals from the bulk systems come from index if given, or from a bulk fetch of bulk_systems.
+        """
+        if index is None:
+            index = self.build_approval_index(bulk_systems, owns_user)
+        # A bulk system whose bulk fetch failed falls back to per-user fetches.
+        per_user_systems = [name for name in self.approval_services if name not in index.systems]
+
+        def previous_results(user_id):
+            # Items of the indexed systems come from the index, even if an earlier attempt fetched them per user.
+            previous = self.ledger.previous_results(user_id)
+            if previous is None:
+                return None
+            return {system: approvals for system, approvals in previous.items() if system not in index.systems}
+
+        def systems_for_user(user_id):
+            previous = previous_results(user_id)
+            if previous is None:
+                return per_user_systems
+            return [name for name in per_user_systems if name not in previous]
+
+        remaining_user_ids = (user_id for user_id in user_ids if not self.ledger.is_completed(user_id))
+        processed = 0
+        failed = 0
+        digest_counts = {FULL: 0, DELTA: 0, SKIP: 0, PARTIAL: 0}
+        for user_id, results, failures in self.collector.collect_many(remaining_user_ids,
+                                                                      systems_for_user=systems_for_user):
+            results = dict(previous_results(user_id) or {}, **results)
+            self.ledger.record_fetches(user_id, results, failures)
+            for system, error in failures.items():
+                self.logger.error(f"Failed to fetch {system} approvals for {user_id}: {error}")
+            if failures:
+                failed += 1
+            approvals = [approval for system_approvals in results.values() for approval in system_approvals]
+            approvals.extend(index.get(user_id))
+            self.cache_approvals(user_id, results, index)
+            with metrics.timer('picard_user_digest_seconds'):
+                digest_counts[self.send_digest(user_id, approvals, unavailable=sorted(failures))] += 1
+            processed += 1
+            self.ledger.flush(force=False)
+            self.digest_tracker.flush(force=False)
+        delivery_stats = self.slack_service.delivery.flush()
+        self.digest_tracker.flush()
+        self.ledger.flush()
+        return {'users': processed, 'failed': failed, 'digests': digest_counts, 'delivery': delivery_stats}
+
+    def finish_run(self, stats, since=None):
+        """
+        Closes the current ledger run and reports it: the run report, the adaptive limits and the run summary.
+        A run with failed users or undelivered digests is left open so that a resumed run retries what is left.
+        since is the metrics snapshot taken when the run started, if the process did more than this run.
+        """
+        if not stats['failed'] and not stats['delivery'].get('failed'):
+            self.ledger.finish()
+        stats['system_calls'] = self.count_system_calls(since)
+        stats['unavailable_systems'] = [name for name, service in self.approval_services.items()
+                                        if service.breaker.state == OPEN]
+        metrics.observe('picard_run_seconds', stats['elapsed'])
+        self.log_run_report(stats)
+        limits = {name: service.session.limiter.limit for name, service in self.approval_services.items()
+                  if getattr(service.session, 'limiter', None)}
+        if limits:
+            self.logger.info("Adaptive concurrency limits: " +
+                             ', '.join(f"{name} {limit:.1f}" for name, limit in limits.items()))
+        self.write_run_summary(stats, since)
+
+    def write_run_summary(self, stats, since=None):
+        """
+        Logs outbound call counts, errors and p50/p95/p99 latency per system for the run, and saves them with the
+        run statistics to <run_summary_dir>/<run_id>.json so that runs can be compared over time.
+        If since is a metrics snapshot, only the calls made after it are summarized.
+        """
+        systems = metrics.summary('picard_http_request_seconds', 'system', errors_name='picard_http_errors_total',
+                                  since=since)
+        for system, summary in sorted(systems.items()):
+            self.logger.info(f"{system}: {summary['count']} calls, {summary['errors']} errors, "
+                             f"p50 {format_seconds(summary['p50'])}, p95 {format_seconds(summary['p95'])}, "
+                             f"p99 {format_seconds(summary['p99'])}")
+        if not self.config.run_summary_dir:
+            return
+        try:
+            os.makedirs(self.config.run_summary_dir, exist_ok=True)
+            path = os.path.join(self.config.run_summary_dir, f"{stats['run_id']}.json")
+            collect = metrics.summary('picard_user_collect_seconds', None, since=since).get(None)
+            with open(path, 'w') as f:
+                json.dump(dict(stats, systems=systems, collect=collect), f, indent=2, default=str)
+        except OSError as e:
+            self.logger.error(f"Failed to write run summary: {e}")
+
+    def count_system_calls(self, since=None):
+        """
+        Returns the number of HTTP requests made to the approval systems, bulk fetches and retries included,
+        since a metrics snapshot or since the process started.
+        """
+        calls = metrics.totals('picard_http_requests_total', 'system', since=since)
+        return sum(count for system, count in calls.items() if system in self.approval_services)
+
+    def log_run_report(self, stats):
+        """
+        Logs throughput, wall-clock time, digest counts and Slack delivery statistics for a run.
+        """
+        elapsed = stats['elapsed']
+        users_per_second = stats['users'] / elapsed if elapsed else 0.0
+        calls_per_second = stats['system_calls'] / elapsed if elapsed else 0.0
+        digests = stats['digests']
+        delivery = stats['delivery']
+        self.logger.info(f"Processed {stats['users']} users in {elapsed:.2f}s "
+                         f"({users_per_second:.2f} users/s, {calls_per_second:.2f} system calls/s)")
+        if stats['failed']:
+            self.logger.info(f"{stats['failed']} users got partial digests after failed fetches; "
+                             f"run with --resume to retry the missing systems")
+        if stats['unavailable_systems']:
+            self.logger.warning(f"Circuit open at the end of the run for: {', '.join(stats['unavailable_systems'])}")
+        self.logger.info(f"Digests: {digests[FULL]} full, {digests[DELTA]} delta, {digests[PARTIAL]} partial, "
+                         f"{digests[SKIP]} skipped as unchanged")
+        self.logger.info(f"Slack delivery: {delivery['sent']} sent, {delivery['coalesced']} coalesced, "
+                         f"{delivery['rate_limited']} rate limited, {delivery['failed']} failed")
+
+    def run_sharded(self, shard_count, resume=False):
+        """
+        Coordinates a run split into shard_count shards, each processed by its own worker process,
+        and merges the per-shard statistics into one report.
+        Okta is listed and the bulk systems are fetched once, here; each shard is handed its users and its part of
+        the approval index, so adding shards does not add load on Okta, Jira or ServiceNow.
+        """
+        self.logger.info(f"Starting sharded run across {shard_count} processes...")
+        start_time = time.monotonic()
+        since = metrics.snapshot()
+        ring = HashRing(shard_count)
+        shard_user_ids = [[] for _ in range(shard_count)]
+        for user_id in self.active_users():
+            shard_user_ids[ring.shard_for(user_id)].append(user_id)
+        indexes = self.build_approval_index(self.bulk_systems()).split(ring.shard_for, shard_count)
+        with multiprocessing.get_context('spawn').Pool(processes=shard_count) as pool:
+            shard_stats = pool.starmap(run_shard, [(shard, shard_count, resume, shard_user_ids[shard], indexes[shard])
+                                                   for shard in range(shard_count)])
+        stats = merge_run_stats(shard_stats)
+        stats['elapsed'] = time.monotonic() - start_time
+        # The shards count their own calls; the bulk fetches were made here.
+        stats['system_calls'] += self.count_system_calls(since)
+        self.log_run_report(stats)
+        return stats
+
+    def run_scheduler(self, shard=None):
+        """
+        Runs as a long-lived daemon that sends each user their digest once a day at their local delivery time,
+        spreading users across the delivery window and sending the due users in small batches.
+        All the batches of one UTC day share one ledger run, reported and summarized once when the day is over
+        (or the daemon stops), with only that day's calls in its summary.
+        If shard is given as (index, count), only schedules the users that the hash ring assigns to that shard.
+        """
+        schedule = DeliverySchedule(**self.config.schedule)
+        self.logger.info(f"Scheduler started: digests at {self.config.schedule['local_time']} local time, "
+                         f"spread over {self.config.schedule['window_minutes']} minutes")
+        run_prefix = (f"shard{shard[0]}of{shard[1]}-" if shard else '') + 'sched-'
+        plan = deque()
+        planned_at = None
+        day_run = None
+        try:
+            while True:
+                now = time.time()
+                today = time.strftime('%Y-%m-%d', time.gmtime(now))
+                if day_run and day_run['day'] != today:
+                    self.finish_run(day_run['stats'], since=day_run['since'])
+                    day_run = None
+                if planned_at is None or now - planned_at >= self.config.scheduler_replan_seconds:
+                    plan = deque(self.plan_deliveries(schedule, now, shard))
+                    planned_at = now
+                due = []
+                while plan and plan[0][0] <= now:
+                    due.append(plan.popleft())
+                if due:
+                    if day_run is None:
+                        day_run = self.start_scheduled_run(run_prefix, today)
+                    self.run_scheduled_batch(day_run, [user_id for _, user_id, _ in due])
+                    # Recorded even after a failure, so the batch is not repeated; failed users stay open in the
+                    # day's ledger run and get their next digest tomorrow.
+                    for _, user_id, local_date in due:
+                        self.state_store.set(SCHEDULE_NAMESPACE, user_id, local_date)
+                # Users due within the same tick are sent as one batch.
+                replan_at = planned_at + self.config.scheduler_replan_seconds
+                next_due = plan[0][0] if plan else replan_at
+                wake_at = min(max(next_due, now + self.config.scheduler_tick_seconds), replan_at)
+                time.sleep(max(0.0, wake_at - time.time()))
+        finally:
+            if day_run:
+                self.finish_run(day_run['stats'], since=day_run['since'])
+
+    def start_scheduled_run(self, run_prefix, day):
+        """
+        Starts the ledger run that the scheduler's batches of one day are checkpointed in. Returns its state:
+        the running totals, and the metrics snapshot and delivery statistics the day's report is measured from.
+        """
+        run_id, _ = self.ledger.start(prefix=run_prefix)
+        self.logger.info(f"Starting scheduled run {run_id} for {day}")
+        delivery = self.slack_service.delivery.flush()
+        return {
+            'day': day,
+            'since': metrics.snapshot(),
+            'delivery': delivery,
+            'stats': {'run_id': run_id, 'users': 0, 'failed': 0, 'elapsed': 0.0,
+                      'digests': {FULL: 0, DELTA: 0, SKIP: 0, PARTIAL: 0}, 'delivery': {key: 0 for key in delivery}}
+        }
+
+    def run_scheduled_batch(self, day_run, user_ids):
+        """
+        Sends the digests of one batch of due users and adds the outcome to the day's totals.
+        Batches are small, so their approvals are fetched per user rather than in bulk.
+        """
+        stats = day_run['stats']
+        start_time = time.monotonic()
+        try:
+            batch = self.process_users(user_ids)
+        except Exception as e:
+            self.logger.error(f"Scheduled batch of {len(user_ids)} users failed: {e}")
+            stats['failed'] += len(user_ids)
+        else:
+            stats['users'] += batch['users']
+            stats['failed'] += batch['failed']
+            for action, count in batch['digests'].items():
+                stats['digests'][action] += count
+            # Delivery statistics are cumulative for the process, so the day's are measured from its start.
+            stats['delivery'] = {key: value - day_run['delivery'].get(key, 0) for key, value in batch['delivery'].items()}
+            self.logger.info(f"Sent scheduled digests to {batch['users']} users ({batch['failed']} partial)")
+        stats['elapsed'] += time.monotonic() - start_time
+
+    def plan_deliveries(self, schedule, now, shard=None):
+        """
+        Builds the delivery plan for every user with a Slack account who has not had today's digest yet,
+        ordered by due time. With schedule_priority 'pending_items', users with more items in their last digest
+        get earlier slots.
         """
-        Processes approvals for a specific user by retrieving pending approvals from multiple systems
-        and sending the list to the user via Slack.
+        self.refresh_identities()
+        identities = self.slack_service.identities.all()
+        if shard:
+            ring = HashRing(shard[1])
+            identities = {user_id: identity for user_id, identity in identities.items()
+                          if ring.shard_for(user_id) == shard[0]}
+        priorities = self.db.get_digest_sizes() if self.config.schedule_priority == 'pending_items' else {}
+        last_sent = dict(self.state_store.items(SCHEDULE_NAMESPACE))
+        plan = schedule.plan(((user_id, identity.get('time_zone')) for user_id, identity in identities.items()),
+                             now, priorities, last_sent)
+        if plan:
+            self.logger.info(f"Planned {len(plan)} digests, the first at "
+                             f"{datetime.fromtimestamp(plan[0][0]):%Y-%m-%d %H:%M:%S}")
+        return plan
+
+    def active_users(self):
+        """
+        Returns an iterator over the IDs of the active Okta users who have a Slack account, streamed from Okta.
+        If the identity cache is older than its TTL, it is rebuilt on the way: Slack's users.list is read first, then
+        each Okta user is joined against it as their page arrives, so the run starts before the last page is fetched
+        and the Okta directory is never held in memory.
+        Raises RuntimeError if there is no identity cache and it cannot be built, rather than sending nothing.
+        """
+        identities = self.slack_service.identities
+        if identities.is_stale():
+            try:
+                slack_ids_by_email = identities.list_slack_users()
+            except Exception as e:
+                self.logger.error(f"Failed to list Slack users, using the cached identities: {e}")
+            else:
+                return self.join_identities(slack_ids_by_email)
+        if not identities.all():
+            raise RuntimeError("The identity cache is empty and could not be built, so no user can be sent a digest")
+        return (user_id for user_id in self.okta_service.get_active_users() if identities.get(user_id))
+
+    def join_identities(self, slack_ids_by_email):
+        """
+        Rebuilds the identity cache from the Okta users streamed from Okta, yielding the IDs of those who have
+        a Slack account as they are joined.
+        """
+        total = 0
+        matched = 0
+        okta_users = self.okta_service.get_active_user_profiles()
+        for user_id, identity in self.slack_service.identities.join(okta_users, slack_ids_by_email):
+            total += 1
+            if identity:
+                matched += 1
+                yield user_id
+        self.logger.info(f"Refreshed identity cache: {matched} of {total} active Okta users have a Slack account")
+        if not matched:
+            self.logger.error("No active Okta user has a Slack account; check the Okta and Slack configuration")
+
+    def refresh_identities(self):
+        """
+        Rebuilds the Okta-to-Slack identity cache if it is older than its TTL, keeping the cached identities if
+        the rebuild fails.
+        """
+        identities = self.slack_service.identities
+        if not identities.is_stale():
+            return
+        try:
+            for _ in self.join_identities(identities.list_slack_users()):
+                pass
+        except Exception as e:
+            self.logger.error(f"Failed to refresh the identity cache, using the cached identities: {e}")
+        if not identities.all():
+            self.logger.error("The identity cache is empty, so no user can be sent a digest")
+
+    def bulk_systems(self):
+        """
+        Returns the configured bulk fetch systems whose client supports bulk retrieval.
+        """
+        return [name for name in self.config.bulk_fetch_systems
+                if hasattr(self.approval_services[name], 'get_all_pending_approvals')]
+
+    def build_approval_index(self, system_names, owns_user=None):
+        """
+        Pulls the full pending set of each bulk-capable system once and indexes it by assignee.
+        If owns_user is given, only the approvals of users it accepts are kept.
+        Systems whose bulk fetch fails are left out of the index.
+        """
+        index = ApprovalIndex()
+        for name in system_names:
+            try:
+                records = self.approval_services[name].get_all_pending_approvals()
+            except Exception as e:
+                self.logger.error(f"Bulk fetch from {name} failed, falling back to per-user fetches: {e}")
+                continue
+            if owns_user:
+                records = ((assignee, approval) for assignee, approval in records if owns_user(assignee))
+            count = index.add_system(name, records)
+            self.logger.info(f"Indexed {count} pending approvals from {name} in bulk")
+        return index
+
+    def cache_approvals(self, user_id, results, index):
+        """
+        Stores the approvals fetched for a user in the approval cache, per system, including those from the bulk index.
         """
-        approvals = []
-        approvals.extend(self.coupa_service.get_pending_approvals(user_id))
-        approvals.extend(self.brex_service.get_pending_approvals(user_id))
-        approvals.extend(self.jira_service.get_pending_approvals(user_id))
-        approvals.extend(self.servicenow_service.get_pending_approvals(user_id))
-        approvals.extend(self.workday_service.get_pending_approvals(user_id))
-        
-        self.slack_service.send_approval_list(user_id, approvals)
+        for system, approvals in results.items():
+            self.approval_cache.put(user_id, system, approvals)
+        indexed = {system: [] for system in index.systems}
+        for approval in index.get(user_id):
+            indexed[approval.system].append(approval)
+        for system, approvals in indexed.items():
+            self.approval_cache.put(user_id, system, approvals)
+
+    def send_digest(self, user_id, approvals, unavailable=None):
+        """
+        Sends the user a full digest, only the new items, or nothing if their pending set is unchanged.
+        The user is marked done in the run ledger, and the digest fingerprint recorded, once Slack has the message.
+        If some systems were unavailable, the user gets the full list of what was fetched, naming the missing systems.
+        Such a partial digest leaves the user failed in the ledger and its fingerprint unrecorded, so a resumed run
+        or the next run compares against the last complete digest. Items keep the numbers the user last saw, with new
+        ones added at the end; when an item was removed, the full list is sent so the numbers are never silently off.
+        Returns the action taken.
+        """
+        if unavailable:
+            on_failed = lambda delivered: self.ledger.mark_user(user_id, FAILED)
+            self.slack_service.send_approval_list(user_id, approvals, on_failed, unavailable=unavailable)
+            return PARTIAL
+
+        def on_done(delivered):
+            if delivered:
+                self.digest_tracker.record(user_id, approvals)
+            self.ledger.mark_user(user_id, DONE if delivered else UNDELIVERED)
+
+        action, added, removed = self.digest_tracker.plan(user_id, approvals)
+        if action != FULL:
+            # A delta or a skipped digest leaves the user with the numbers of the list they last saw, so those must
+            # still point at the same items. If an item was removed they cannot, and the user gets the full list.
+            arranged = keep_numbering(approvals, self.slack_service.pending_approvals.get(user_id, []))
+            if arranged is None:
+                action = FULL
+            else:
+                approvals = arranged
+        if action == FULL:
+            self.slack_service.send_approval_list(user_id, approvals, on_done)
+        elif action == DELTA:
+            self.slack_service.send_approval_delta(user_id, approvals, added, removed, on_done)
+        else:
+            # Nothing to send, but the stored list still backs 'approve N' and 'list'.
+            self.slack_service.pending_approvals[user_id] = approvals
+            on_done(True)
+        return action
+
+def format_seconds(seconds):
+    """
+    Formats a bucketed latency for the run summary.
+    """
+    if seconds is None:
+        return '-'
+    if seconds == float('inf'):
+        return 'over 30s'
+    return f"<={seconds * 1000:.0f}ms"
+
+def run_shard(shard_index, shard_count, resume=False, user_ids=None, index=None):
+    """
+    Runs one shard of the daily run in a worker process and returns its statistics.
+    """
+    return Picard().run(resume=resume, shard=(shard_index, shard_count), user_ids=user_ids, index=index)
+
+def merge_run_stats(shard_stats):
+    """
+    Merges the statistics of several shard runs into one.
+    """
+    merged = {
+        'run_id': ','.join(stats['run_id'] for stats in shard_stats),
+        'users': sum(stats['users'] for stats in shard_stats),
+        'failed': sum(stats['failed'] for stats in shard_stats),
+        'system_calls': sum(stats['system_calls'] for stats in shard_stats),
+        'elapsed': max((stats['elapsed'] for stats in shard_stats), default=0.0),
+        'digests': {},
+        'delivery': {},
+        'unavailable_systems': sorted({name for stats in shard_stats for name in stats['unavailable_systems']})
+    }
+    for stats in shard_stats:
+        for section in ['digests', 'delivery']:
+            for key, value in stats[section].items():
+                merged[section][key] = merged[section].get(key, 0) + value
+    return merged
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sends each active user their pending approvals.")
+    parser.add_argument('--test-user', help="Run for a single user ID instead of every active Okta user")
+    parser.add_argument('--resume', action='store_true', help="Resume the last unfinished run")
+    parser.add_argument('--shard', type=parse_shard, help="Process only shard i of N, given as 'i/N'")
+    parser.add_argument('--shards', type=int, help="Split the run into N shards processed by local worker processes")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Run as a scheduler that sends each user their digest at their local delivery time")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Sample the run's stacks and write them to FILE in collapsed (flamegraph) format")
+    args = parser.parse_args()
+    profiler = SamplingProfiler() if args.profile else None
+    if profiler:
+        profiler.start()
     bot = Picard()
-    # Uncomment for test mode
-    # single_user_id = 'user_id_here'
-    # bot.run(test_user_id=single_user_id)
-    bot.run()
+    try:
+        if args.daemon:
+            bot.run_scheduler(shard=args.shard)
+        elif args.shards:
+            bot.run_sharded(args.shards, resume=args.resume)
+        else:
+            bot.run(test_user_id=args.test_user, resume=args.resume, shard=args.shard)
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.write(args.profile)
+            bot.logger.info("Profile hot spots: " +
+                            ', '.join(f"{function} {share:.0%}" for function, share in profiler.top(5)))
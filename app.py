@@ -1,47 +1,180 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, abort
 from services.slack_service import SlackService
+from services.service_registry import ServiceRegistry
+from services.identity_resolver import IdentityResolver
+from services.approval_cache import ApprovalCache
 from config.settings import Config
+from utils.http_session import SessionPool
+from utils.job_queue import JobQueue
+from utils.state_store import SQLiteStateStore, CachedStateStore
+from utils.database import Database
+from utils.metrics import metrics
+import hashlib
+import hmac
 import json
+import logging
+import time
 
 app = Flask(__name__)
 config = Config()
-slack_service = SlackService(config)
+session_pool = SessionPool(**config.http)
+state_store = CachedStateStore(SQLiteStateStore(config.state_store_uri))
+# Approval system clients are created on the first action that needs them and reused after that.
+services = ServiceRegistry(config, session_pool)
+slack_service = SlackService(config.slack, session_pool, state_store,
+                             api_url=config.slack.get('api_url'), services=services)
+slack_service.identities = IdentityResolver(state_store, slack_service, ttl=config.identity_ttl)
+slack_service.audit = Database(config.database_uri, **config.audit)
+slack_service.approval_cache = ApprovalCache(state_store, services, services.names(), **config.approval_cache)
+# Dedupe keys are shared through the state store, so a Slack retry sent to another worker process is dropped too.
+jobs = JobQueue(workers=config.webhook_workers, store=state_store, dedupe_ttl=config.webhook_dedupe_ttl)
+
+# Slack signs each request; requests older than this many seconds are rejected as replays.
+SIGNATURE_MAX_AGE = 60 * 5
+
+def resolve_user(slack_user_id):
+    """
+    Returns the Okta user ID that the daily run keys a Slack user's approvals by, falling back to the Slack user ID.
+    """
+    return slack_service.identities.okta_user_id(slack_user_id) or slack_user_id
+
+def slack_signature_valid(timestamp, signature, body):
+    """
+    Returns True if a request carries a valid, recent Slack signature, or if no signing secret is configured.
+    Shared by this Flask app and the ASGI server in asgi_app.py.
+    """
+    signing_secret = config.slack.get('signing_secret')
+    if not signing_secret:
+        return True
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE:
+        return False
+    basestring = f"v0:{timestamp}:".encode() + body
+    expected = 'v0=' + hmac.new(signing_secret.encode(), basestring, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def verify_slack_request():
+    """
+    Verifies the Slack request signature when a signing secret is configured.
+    """
+    if not slack_signature_valid(request.headers.get('X-Slack-Request-Timestamp', ''),
+                                 request.headers.get('X-Slack-Signature', ''), request.get_data()):
+        abort(403)
+
+def queue_event(data):
+    """
+    Queues the handling of a Slack event callback. Messages are handled in order per user, and retried
+    deliveries are dropped by event_id.
+    """
+    event = data.get('event', {})
+    if event.get('type') == 'message' and 'subtype' not in event:
+        slack_user_id = event.get('user')
+        if event.get('channel_type') == 'im' and event.get('channel'):
+            slack_service.identities.remember_channel(slack_user_id, event['channel'])
+        user_id = resolve_user(slack_user_id)
+        text = event.get('text')
+        jobs.submit(slack_service.handle_user_commands, user_id, text,
+                    dedupe_key=data.get('event_id'), order_key=user_id)
+
+def queue_interaction(data):
+    """
+    Queues the handling of a Slack interactive message payload (a button click).
+    """
+    user_id = resolve_user(data['user']['id'])
+    actions = data['actions']
+    if actions:
+        action = actions[0]
+        action_id = action['action_id']
+        value = action['value']
+        dedupe_key = f"{user_id}:{action.get('action_ts')}" if action.get('action_ts') else None
+        jobs.submit(slack_service.handle_interactive_message, user_id, action_id, value,
+                    dedupe_key=dedupe_key, order_key=user_id)
 
 @app.route('/slack/events', methods=['POST'])
 def slack_events():
     """
     Endpoint to handle Slack events.
+    Acknowledges immediately and handles the event in the background; retried deliveries are dropped by event_id.
     """
+    verify_slack_request()
     data = request.json
 
     if 'challenge' in data:
         return jsonify({'challenge': data['challenge']})
 
-    event = data.get('event', {})
-    if event.get('type') == 'message' and 'subtype' not in event:
-        user_id = event.get('user')
-        text = event.get('text')
-        slack_service.handle_user_commands(user_id, text)
-
+    queue_event(data)
     return jsonify({'status': 'ok'})
 
 @app.route('/slack/interactive', methods=['POST'])
 def slack_interactive():
     """
     Endpoint to handle Slack interactive messages.
+    Acknowledges immediately and handles the action in the background.
     """
+    verify_slack_request()
     payload = request.form.get('payload')
     data = json.loads(payload)
 
-    user_id = data['user']['id']
-    actions = data['actions']
-    if actions:
-        action = actions[0]
-        action_id = action['action_id']
-        value = action['value']
-        slack_service.handle_interactive_message(user_id, action_id, value)
+    queue_interaction(data)
+    return jsonify({'status': 'ok'})
+
+def verify_webhook_request(system):
+    """
+    Verifies the HMAC-SHA256 signature (X-Hub-Signature: sha256=<hex>) of a Jira or ServiceNow webhook against
+    the webhook_secret in the system's secret. Webhooks trigger cache refreshes and vendor fetches, so without
+    a webhook_secret every request is rejected.
+    """
+    webhook_secret = getattr(config, system).get('webhook_secret')
+    if not webhook_secret:
+        logging.getLogger('Picard').warning(f"Rejected a {system} webhook: no webhook_secret is configured")
+        abort(403)
+    expected = 'sha256=' + hmac.new(webhook_secret.encode(), request.get_data(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, request.headers.get('X-Hub-Signature', '')):
+        abort(403)
 
+@app.route('/webhooks/jira', methods=['POST'])
+def jira_webhook():
+    """
+    Endpoint for Jira issue webhooks. Refreshes the cached approvals of the issue's current and previous assignees
+    in the background.
+    """
+    verify_webhook_request('jira')
+    data = request.json or {}
+    issue = data.get('issue', {})
+    assignee = issue.get('fields', {}).get('assignee') or {}
+    user_ids = [assignee.get('name')]
+    user_ids.extend(item.get('from') for item in data.get('changelog', {}).get('items', [])
+                    if item.get('field') == 'assignee')
+    if issue.get('id'):
+        jobs.submit(slack_service.approval_cache.item_changed, 'jira', issue['id'], user_ids,
+                    dedupe_key=request.headers.get('X-Atlassian-Webhook-Identifier'))
+    return jsonify({'status': 'ok'})
+
+@app.route('/webhooks/servicenow', methods=['POST'])
+def servicenow_webhook():
+    """
+    Endpoint for ServiceNow approval webhooks, sent by a business rule with the record's sys_id, assigned_to and,
+    on reassignment, previous_assigned_to. Refreshes the cached approvals of those users in the background.
+    """
+    verify_webhook_request('servicenow')
+    data = request.json or {}
+    if data.get('sys_id'):
+        jobs.submit(slack_service.approval_cache.item_changed, 'servicenow', data['sys_id'],
+                    [data.get('assigned_to'), data.get('previous_assigned_to')])
     return jsonify({'status': 'ok'})
 
+@app.route('/health', methods=['GET'])
+def health():
+    """
+    Endpoint reporting the background job queue depth, counts and latency.
+    """
+    return jsonify({'status': 'ok', 'jobs': jobs.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Endpoint exposing request, job and queue metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(port=3000, debug=True)
@@ -0,0 +1,131 @@
+from app import config, slack_service, jobs, slack_signature_valid, queue_event, queue_interaction
+from services.slack_delivery import AsyncSlackDelivery
+from utils.metrics import metrics
+from urllib.parse import parse_qs
+import asyncio
+import json
+
+# Async alternative to app.py for the post-digest burst: requests are acknowledged on the event loop without a
+# thread each, and replies to Slack go out through one async HTTP client, in order per user. Command handling
+# still runs on the job queue shared with app.py, with the same synchronous vendor clients, so the number of
+# commands processed per second is the same as with app.py; what changes is the number of open connections
+# served and the cost of sending replies. Run with `python asgi_app.py` or `uvicorn asgi_app:app --port 3000`.
+
+def attach_delivery():
+    """
+    Routes Slack replies through an AsyncSlackDelivery on the running event loop, once per process.
+    """
+    if not isinstance(slack_service.delivery, AsyncSlackDelivery):
+        slack_service.delivery = AsyncSlackDelivery(slack_service, asyncio.get_running_loop(),
+                                                    rate_limits=config.slack_rate_limits)
+
+async def read_body(receive):
+    """
+    Reads the full request body from the ASGI receive channel.
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def respond(send, status, body, content_type='application/json'):
+    """
+    Sends a complete response.
+    """
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def slack_events(headers, body):
+    """
+    Endpoint to handle Slack events.
+    Acknowledges immediately and handles the event in the background; retried deliveries are dropped by event_id.
+    Queueing reads and writes the state store, so it runs in a thread rather than blocking the event loop.
+    """
+    data = json.loads(body)
+    if 'challenge' in data:
+        return 200, {'challenge': data['challenge']}
+    await asyncio.get_running_loop().run_in_executor(None, queue_event, data)
+    return 200, {'status': 'ok'}
+
+async def slack_interactive(headers, body):
+    """
+    Endpoint to handle Slack interactive messages.
+    Acknowledges immediately and handles the action in the background.
+    """
+    data = json.loads(parse_qs(body.decode())['payload'][0])
+    await asyncio.get_running_loop().run_in_executor(None, queue_interaction, data)
+    return 200, {'status': 'ok'}
+
+async def health(headers, body):
+    """
+    Endpoint reporting the background job queue and the async Slack delivery statistics.
+    """
+    delivery = slack_service.delivery.stats if isinstance(slack_service.delivery, AsyncSlackDelivery) else None
+    return 200, {'status': 'ok', 'jobs': jobs.stats(), 'delivery': delivery}
+
+async def metrics_endpoint(headers, body):
+    """
+    Endpoint exposing request, job and queue metrics in the Prometheus text format.
+    """
+    return 200, metrics.render().encode()
+
+# (method, path): (handler, whether the request must carry a Slack signature)
+ROUTES = {
+    ('POST', '/slack/events'): (slack_events, True),
+    ('POST', '/slack/interactive'): (slack_interactive, True),
+    ('GET', '/health'): (health, False),
+    ('GET', '/metrics'): (metrics_endpoint, False)
+}
+
+async def lifespan(receive, send):
+    """
+    Attaches the async Slack delivery on startup and closes its HTTP client on shutdown.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            attach_delivery()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if isinstance(slack_service.delivery, AsyncSlackDelivery):
+                await slack_service.delivery.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """
+    ASGI application serving the Slack endpoints of app.py.
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    attach_delivery()
+    route = ROUTES.get((scope['method'], scope['path']))
+    if route is None:
+        await respond(send, 404, {'error': 'not found'})
+        return
+    handler, signed = route
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    body = await read_body(receive)
+    if signed and not slack_signature_valid(headers.get('x-slack-request-timestamp', ''),
+                                            headers.get('x-slack-signature', ''), body):
+        await respond(send, 403, {'error': 'invalid signature'})
+        return
+    try:
+        status, payload = await handler(headers, body)
+    except (ValueError, KeyError):
+        await respond(send, 400, {'error': 'bad request'})
+        return
+    content_type = 'text/plain; version=0.0.4' if isinstance(payload, bytes) else 'application/json'
+    await respond(send, status, payload, content_type)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=3000)
@@ -0,0 +1,256 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-ins for every integration the bot talks to, used to benchmark the bot without production systems.
+SYSTEMS = ['okta', 'coupa', 'brex', 'jira', 'servicenow', 'workday', 'slack']
+
+DEFAULT_PROFILE = {
+    'users': 1000,
+    'approvals_per_user': 20,
+    'latency_ms': 20,
+    'error_rate': 0.0,
+    'rate_limit_rate': 0.0,
+    'retry_after': 1
+}
+
+def user_id_for(index):
+    """
+    Returns the fake Okta user ID for a user index.
+    """
+    return f"00u{index:07d}"
+
+def slack_user_id_for(index):
+    """
+    Returns the fake Slack user ID of the user with the same index, whose email matches their Okta profile.
+    """
+    return f"U{index:07d}"
+
+def make_approval(system, user_id, n):
+    """
+    Returns one fake pending approval for a user, shaped like the vendor's record, including fields the bot ignores.
+    """
+    approval_id = f"{system}-{user_id}-{n}"
+    summary = f"{system.title()} request {n} for {user_id}"
+    person = {'id': user_id, 'login': user_id, 'email': f"{user_id}@example.com", 'fullname': f"User {user_id}"}
+    if system == 'coupa':
+        return {
+            'id': approval_id, 'status': 'pending_approval', 'approval-date': None, 'note': None,
+            'created-at': '2024-01-01T09:30:00-08:00', 'updated-at': '2024-01-01T09:30:00-08:00',
+            'approvable-type': 'RequisitionHeader', 'approvable-id': n, 'approver': person, 'created-by': person,
+            'approvable': {'id': n, 'description': summary, 'total': '1250.00', 'currency': {'code': 'USD'},
+                           'requested-by': person, 'ship-to-address': {'street1': '1 Main St', 'city': 'Springfield'}}
+        }
+    if system == 'brex':
+        return {
+            'id': approval_id, 'memo': summary, 'status': 'PENDING_APPROVAL', 'category': 'SOFTWARE',
+            'amount': {'amount': 125000, 'currency': 'USD'}, 'original_amount': {'amount': 125000, 'currency': 'USD'},
+            'merchant': {'raw_descriptor': 'ACME SOFTWARE', 'mcc': '5734', 'country': 'USA'},
+            'created_at': '2024-01-01T09:30:00Z', 'updated_at': '2024-01-01T09:30:00Z', 'user': person,
+            'receipts': [{'id': f"receipt-{approval_id}", 'download_uris': [f"https://brex.example.com/r/{approval_id}"]}]
+        }
+    if system == 'workday':
+        return {
+            'id': approval_id, 'descriptor': summary, 'assigned': '2024-01-01T09:30:00.000Z', 'due': '2024-01-08',
+            'status': {'id': 'awaiting_action', 'descriptor': 'Awaiting Action'}, 'subject': person, 'initiator': person,
+            'href': f"https://workday.example.com/tasks/{approval_id}", 'stepType': {'descriptor': 'Approval'}
+        }
+    if system == 'jira':
+        return {
+            'id': approval_id, 'key': f"APR-{n}", 'self': f"https://jira.example.com/rest/api/2/issue/{approval_id}",
+            'fields': {'summary': summary, 'created': '2024-01-01T09:30:00.000-0800', 'assignee': {'name': user_id},
+                       'reporter': person, 'status': {'name': 'Pending Approval'}, 'labels': ['approval'],
+                       'description': f"Please review {summary}."}
+        }
+    # ServiceNow approval records, as returned with sysparm_display_value=all.
+    base_url = 'https://servicenow.example.com/api/now/table'
+    return {
+        'sys_id': {'display_value': approval_id, 'value': approval_id},
+        'sys_created_on': {'display_value': '01/01/2024 09:30:00', 'value': '2024-01-01 17:30:00'},
+        'sys_updated_on': {'display_value': '01/01/2024 09:30:00', 'value': '2024-01-01 17:30:00'},
+        'assigned_to': {'display_value': f"User {user_id}", 'value': user_id, 'link': f"{base_url}/sys_user/{user_id}"},
+        'state': {'display_value': 'Requested', 'value': 'requested'},
+        'source_table': {'display_value': 'sc_req_item', 'value': 'sc_req_item'},
+        'sysapproval': {'display_value': summary, 'value': f"RITM-{approval_id}",
+                        'link': f"{base_url}/task/RITM-{approval_id}"},
+        'approval_source': {'display_value': 'Flow', 'value': 'Flow'}
+    }
+
+class FakeIntegrationHandler(BaseHTTPRequestHandler):
+    """
+    Serves the endpoints the service classes call, with the latency, error rate and 429 behavior of the server's profile.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PATCH(self):
+        self.handle_request('PATCH')
+
+    def handle_request(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/__stats':
+            return self.respond(200, server.snapshot())
+        profile = server.profile
+        time.sleep(profile['latency_ms'] / 1000.0 * random.uniform(0.5, 1.5))
+        if random.random() < profile['rate_limit_rate']:
+            server.count('rate_limited')
+            return self.respond(429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': str(profile['retry_after'])})
+        if random.random() < profile['error_rate']:
+            server.count('errors')
+            return self.respond(500, {'error': 'injected failure'})
+        server.count('requests')
+        handler = getattr(self, f"handle_{server.system}")
+        handler(method, url.path, params, body)
+
+    def respond(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_okta(self, method, path, params, body):
+        profile = self.server.profile
+        limit = int(params.get('limit', 200))
+        start = int(params.get('after', 0))
+        end = min(start + limit, profile['users'])
+        users = [{'id': user_id_for(i), 'status': 'ACTIVE',
+                  'profile': {'email': f"{user_id_for(i)}@example.com", 'timeZone': 'America/Los_Angeles'}}
+                 for i in range(start, end)]
+        headers = {}
+        if end < profile['users']:
+            headers['Link'] = f'<{self.server.url}/api/v1/users?after={end}&limit={limit}>; rel="next"'
+        self.respond(200, users, headers)
+
+    def handle_simple(self, method, path, params, body):
+        system = self.server.system
+        if method == 'GET':
+            count = self.server.profile['approvals_per_user']
+            return self.respond(200, [make_approval(system, params.get('user_id'), n) for n in range(count)])
+        self.server.count('actions')
+        self.respond(200, {'status': 'success'})
+
+    handle_coupa = handle_simple
+    handle_brex = handle_simple
+    handle_workday = handle_simple
+
+    def handle_jira(self, method, path, params, body):
+        profile = self.server.profile
+        if method != 'GET':
+            self.server.count('actions')
+            return self.respond(200, {'status': 'success'})
+        per_user = profile['approvals_per_user']
+        match = re.search(r"assignee=(\S+)", params.get('jql', ''))
+        if match:
+            issues = [make_approval('jira', match.group(1), n) for n in range(per_user)]
+            return self.respond(200, {'startAt': 0, 'maxResults': len(issues), 'total': len(issues), 'issues': issues})
+        total = profile['users'] * per_user
+        start = int(params.get('startAt', 0))
+        end = min(start + int(params.get('maxResults', 50)), total)
+        issues = [make_approval('jira', user_id_for(i // per_user), i % per_user) for i in range(start, end)]
+        self.respond(200, {'startAt': start, 'maxResults': end - start, 'total': total, 'issues': issues})
+
+    def handle_servicenow(self, method, path, params, body):
+        profile = self.server.profile
+        if path.endswith('/api/now/v1/batch'):
+            requests = body['rest_requests']
+            for _ in requests:
+                self.server.count('actions')
+            return self.respond(200, {'batch_request_id': body.get('batch_request_id'), 'unserviced_requests': [],
+                                      'serviced_requests': [{'id': r['id'], 'status_code': 200, 'body': ''}
+                                                            for r in requests]})
+        if method != 'GET':
+            self.server.count('actions')
+            return self.respond(200, {'status': 'success', 'result': {'state': 'approved'}})
+        per_user = profile['approvals_per_user']
+        if 'assigned_to' in params:
+            records = [make_approval('servicenow', params['assigned_to'], n) for n in range(per_user)]
+            return self.respond(200, {'result': records})
+        total = profile['users'] * per_user
+        start = int(params.get('sysparm_offset', 0))
+        end = min(start + int(params.get('sysparm_limit', 1000)), total)
+        records = [make_approval('servicenow', user_id_for(i // per_user), i % per_user) for i in range(start, end)]
+        if params.get('sysparm_exclude_reference_link') == 'true':
+            for record in records:
+                for value in record.values():
+                    value.pop('link', None)
+        self.respond(200, {'result': records})
+
+    def handle_slack(self, method, path, params, body):
+        if path.endswith('/users.list'):
+            return self.handle_slack_users(params)
+        self.server.count('messages')
+        self.server.record_message()
+        self.respond(200, {'ok': True, 'channel': (body or {}).get('channel'), 'ts': f"{time.time():.6f}"})
+
+    def handle_slack_users(self, params):
+        profile = self.server.profile
+        limit = int(params.get('limit', 200))
+        start = int(params.get('cursor') or 0)
+        end = min(start + limit, profile['users'])
+        members = [{'id': slack_user_id_for(i), 'profile': {'email': f"{user_id_for(i)}@example.com"}}
+                   for i in range(start, end)]
+        cursor = str(end) if end < profile['users'] else ''
+        self.respond(200, {'ok': True, 'members': members, 'response_metadata': {'next_cursor': cursor}})
+
+class FakeIntegrationServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server standing in for one integration, with request counters exposed at /__stats.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, system, profile):
+        super().__init__(('127.0.0.1', 0), FakeIntegrationHandler)
+        self.system = system
+        self.profile = dict(DEFAULT_PROFILE, **profile)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.first_message_at = None
+        self.last_message_at = None
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def record_message(self):
+        now = time.time()
+        with self.lock:
+            self.first_message_at = self.first_message_at or now
+            self.last_message_at = now
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters, first_message_at=self.first_message_at, last_message_at=self.last_message_at)
+
+def serve(profiles, connection):
+    """
+    Starts one fake server per system, sends their URLs back over the connection and serves until killed.
+    Meant to run in its own process so the servers do not compete with the bot for the GIL.
+    """
+    servers = {system: FakeIntegrationServer(system, profiles.get(system, {})) for system in SYSTEMS}
+    for server in servers.values():
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection.send({system: server.url for system, server in servers.items()})
+    threading.Event().wait()
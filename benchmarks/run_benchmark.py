@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_servers import SYSTEMS, serve, slack_user_id_for
+
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+# Secret names read by config.settings.Config for each system.
+SECRET_NAMES = {system: f"{system}_secret" for system in SYSTEMS}
+
+def percentiles(samples):
+    """
+    Returns p50/p95/p99 of a list of samples in milliseconds.
+    """
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None, 'count': 0}
+    ordered = sorted(samples)
+    pick = lambda fraction: round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 2)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'count': len(ordered)}
+
+def start_servers(args):
+    """
+    Starts the fake servers in a separate process and returns (process, urls).
+    """
+    profile = {
+        'users': args.users,
+        'approvals_per_user': args.approvals,
+        'latency_ms': args.latency_ms,
+        'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate
+    }
+    profiles = {system: dict(profile) for system in SYSTEMS}
+    profiles['slack']['latency_ms'] = args.slack_latency_ms
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context('spawn').Process(target=serve, args=(profiles, child), daemon=True)
+    process.start()
+    return process, parent.recv()
+
+def write_secrets(urls, directory):
+    """
+    Writes a local secrets file pointing every service at its fake server.
+    """
+    secrets = {SECRET_NAMES[system]: {'base_url': url, 'api_token': 'benchmark'} for system, url in urls.items()}
+    secrets['slack_secret']['api_url'] = f"{urls['slack']}/api"
+    path = os.path.join(directory, 'secrets.json')
+    with open(path, 'w') as f:
+        json.dump(secrets, f)
+    return path
+
+def server_stats(url):
+    """
+    Reads the request counters of a fake server.
+    """
+    import requests
+    return requests.get(f"{url}/__stats").json()
+
+def attach_latency_hooks(session_pool, urls, latencies):
+    """
+    Records the latency of every response per system through requests response hooks.
+    """
+    systems_by_url = {url: system for system, url in urls.items()}
+    systems_by_url[f"{urls['slack']}/api"] = 'slack'
+    for base_url, session in session_pool.sessions.items():
+        system = systems_by_url.get(base_url, base_url)
+        samples = latencies.setdefault(system, [])
+        session.hooks['response'].append(lambda response, *args, samples=samples, **kwargs: samples.append(response.elapsed.total_seconds()))
+
+def benchmark_run(args, urls):
+    """
+    Drives one full Picard.run against the fake servers and returns its measurements.
+    """
+    from Picard import Picard
+    picard = Picard()
+    # Create the Slack session up front so it gets a latency hook too.
+    picard.slack_service.session
+    latencies = {}
+    attach_latency_hooks(picard.session_pool, urls, latencies)
+
+    start = time.monotonic()
+    stats = picard.run()
+    elapsed = time.monotonic() - start
+    slack = server_stats(urls['slack'])
+    slack_window = (slack['last_message_at'] or 0) - (slack['first_message_at'] or 0)
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'runs_per_minute': round(60.0 / elapsed, 3) if elapsed else None,
+        'users': stats['users'],
+        'users_per_second': round(stats['users'] / elapsed, 2) if elapsed else None,
+        'digests': stats['digests'],
+        'delivery': stats['delivery'],
+        'slack_messages': slack.get('messages', 0),
+        'slack_messages_per_second': round(slack.get('messages', 0) / slack_window, 2) if slack_window else None,
+        'latency_ms': {system: percentiles(samples) for system, samples in latencies.items()}
+    }
+
+# Each user works through the commands in order, ending with a bulk approve/confirm/comment exchange.
+WEBHOOK_COMMANDS = ['list', 'help', 'approve all', 'yes', 'looks good']
+
+def webhook_event(args, i):
+    """
+    Returns the i-th Slack message event of the webhook benchmark.
+    """
+    user_id = slack_user_id_for(i % args.users)
+    return {
+        'event_id': f"Ev{i:08d}",
+        'event': {'type': 'message', 'channel_type': 'im', 'channel': f"D{user_id}", 'user': user_id,
+                  'text': WEBHOOK_COMMANDS[(i // args.users) % len(WEBHOOK_COMMANDS)]}
+    }
+
+def benchmark_webhooks(args, urls):
+    """
+    Posts Slack events to app.py's /slack/events at scale and measures acknowledgement latency and job latency.
+    """
+    import app as webhook_app
+    client = webhook_app.app.test_client()
+    ack_latencies = []
+
+    def post_event(i):
+        started = time.monotonic()
+        client.post('/slack/events', json=webhook_event(args, i))
+        ack_latencies.append(time.monotonic() - started)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.webhook_concurrency) as executor:
+        list(executor.map(post_event, range(args.webhook_requests)))
+    acked = time.monotonic() - start
+    while True:
+        stats = webhook_app.jobs.stats()
+        if stats['depth'] == 0 and stats['in_flight'] == 0:
+            break
+        time.sleep(0.05)
+    drained = time.monotonic() - start
+    return {
+        'requests': args.webhook_requests,
+        'acks_per_second': round(args.webhook_requests / acked, 2) if acked else None,
+        'drain_seconds': round(drained, 3),
+        'ack_latency_ms': percentiles(ack_latencies),
+        'jobs': webhook_app.jobs.stats()
+    }
+
+def benchmark_asgi_webhooks(args, urls):
+    """
+    Same as benchmark_webhooks, against the ASGI server in asgi_app.py, called in-process with webhook_concurrency
+    concurrent requests on one event loop. Also waits for the async Slack delivery to drain.
+    """
+    import asgi_app
+
+    async def post_event(i, limit, ack_latencies):
+        body = json.dumps(webhook_event(args, i)).encode()
+        scope = {'type': 'http', 'method': 'POST', 'path': '/slack/events',
+                 'headers': [(b'content-type', b'application/json')]}
+        responses = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            responses.append(message)
+
+        async with limit:
+            started = time.monotonic()
+            await asgi_app.app(scope, receive, send)
+            ack_latencies.append(time.monotonic() - started)
+
+    async def run():
+        limit = asyncio.Semaphore(args.webhook_concurrency)
+        ack_latencies = []
+        start = time.monotonic()
+        await asyncio.gather(*(post_event(i, limit, ack_latencies) for i in range(args.webhook_requests)))
+        acked = time.monotonic() - start
+        delivery = asgi_app.slack_service.delivery
+        while True:
+            stats = asgi_app.jobs.stats()
+            if stats['depth'] == 0 and stats['in_flight'] == 0 and not delivery.pending \
+                    and delivery.stats['sent'] + delivery.stats['failed'] >= delivery.stats['queued']:
+                break
+            await asyncio.sleep(0.05)
+        drained = time.monotonic() - start
+        await delivery.close()
+        return {
+            'server': 'asgi',
+            'requests': args.webhook_requests,
+            'acks_per_second': round(args.webhook_requests / acked, 2) if acked else None,
+            'drain_seconds': round(drained, 3),
+            'ack_latency_ms': percentiles(ack_latencies),
+            'jobs': asgi_app.jobs.stats(),
+            'delivery': dict(delivery.stats)
+        }
+
+    return asyncio.run(run())
+
+def git_revision():
+    """
+    Returns the current git commit, if available.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+def compare(current, previous):
+    """
+    Prints the change in headline numbers between two benchmark results.
+    """
+    print(f"Compared with {previous.get('revision')} ({previous.get('timestamp')}):")
+    for section, key in [('run', 'elapsed_seconds'), ('run', 'users_per_second'), ('run', 'slack_messages_per_second'),
+                         ('webhooks', 'acks_per_second'), ('process', 'peak_rss_mb')]:
+        old = (previous.get(section) or {}).get(key)
+        new = (current.get(section) or {}).get(key)
+        if old and new:
+            print(f"  {section}.{key}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks Picard against local stand-in servers for every integration.")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--approvals', type=int, default=20, help="Pending approvals per user per system")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Mean latency of the fake vendor APIs")
+    parser.add_argument('--slack-latency-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument('--webhook-requests', type=int, default=1000)
+    parser.add_argument('--webhook-concurrency', type=int, default=50)
+    parser.add_argument('--skip-webhooks', action='store_true')
+    parser.add_argument('--asgi', action='store_true', help="Benchmark the webhooks against asgi_app.py instead of app.py")
+    parser.add_argument('--compare', help="Result file to compare against (defaults to the latest saved result)")
+    args = parser.parse_args()
+
+    process, urls = start_servers(args)
+    workdir = tempfile.mkdtemp(prefix='picard-benchmark-')
+    os.environ['PICARD_SECRETS_FILE'] = write_secrets(urls, workdir)
+    os.chdir(workdir)
+    try:
+        result = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'parameters': vars(args),
+            'run': benchmark_run(args, urls)
+        }
+        if not args.skip_webhooks:
+            result['webhooks'] = (benchmark_asgi_webhooks if args.asgi else benchmark_webhooks)(args, urls)
+        result['process'] = {'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)}
+        result['servers'] = {system: server_stats(url) for system, url in urls.items()}
+    finally:
+        process.terminate()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    previous_files = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+    output = os.path.join(RESULTS_DIR, f"{result['timestamp'].replace(':', '')}-{result['revision'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"Results written to {output}")
+
+    baseline = args.compare or (previous_files[-1] if previous_files else None)
+    if baseline:
+        with open(baseline) as f:
+            compare(result, json.load(f))
+
+if __name__ == '__main__':
+    main()
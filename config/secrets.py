@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# BatchGetSecretValue accepts at most this many secret IDs per call.
+BATCH_SIZE = 20
+
+class AWSSecretsProvider:
+    """
+    Reads secrets from AWS Secrets Manager with a single, lazily created boto3 client.
+    Several secrets are fetched with BatchGetSecretValue, falling back to concurrent GetSecretValue calls
+    where the batch API is not available.
+    """
+    def __init__(self, region_name=None, max_workers=8):
+        self.region_name = region_name
+        self.max_workers = max_workers
+        self._client = None
+        self.lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        Returns the shared Secrets Manager client, created on first use.
+        """
+        with self.lock:
+            if self._client is None:
+                import boto3
+                self._client = boto3.session.Session().client('secretsmanager', region_name=self.region_name)
+            return self._client
+
+    def get(self, secret_name):
+        """
+        Retrieves one secret.
+        """
+        try:
+            response = self.client.get_secret_value(SecretId=secret_name)
+        except Exception as e:
+            raise Exception(f"Error retrieving secret {secret_name}: {e}")
+        # Decrypts secret using the associated KMS key.
+        return json.loads(response['SecretString'])
+
+    def get_many(self, secret_names):
+        """
+        Retrieves several secrets and returns them keyed by name.
+        """
+        secret_names = list(secret_names)
+        if len(secret_names) == 1:
+            return {secret_names[0]: self.get(secret_names[0])}
+        if hasattr(self.client, 'batch_get_secret_value'):
+            try:
+                return self.batch_get(secret_names)
+            except Exception:
+                # e.g. no secretsmanager:BatchGetSecretValue permission; the per-secret calls report real errors.
+                pass
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(secret_names) or 1)) as executor:
+            return dict(zip(secret_names, executor.map(self.get, secret_names)))
+
+    def batch_get(self, secret_names):
+        """
+        Retrieves secrets with BatchGetSecretValue, BATCH_SIZE at a time.
+        """
+        secrets = {}
+        for start in range(0, len(secret_names), BATCH_SIZE):
+            request = {'SecretIdList': secret_names[start:start + BATCH_SIZE]}
+            while True:
+                response = self.client.batch_get_secret_value(**request)
+                if response.get('Errors'):
+                    error = response['Errors'][0]
+                    raise Exception(f"Error retrieving secret {error.get('SecretId')}: {error.get('Message')}")
+                for value in response.get('SecretValues', []):
+                    secrets[value['Name']] = json.loads(value['SecretString'])
+                if not response.get('NextToken'):
+                    break
+                request['NextToken'] = response['NextToken']
+        return secrets
+
+class LocalFileProvider:
+    """
+    Reads secrets from a local JSON file of {secret_name: value}, so tests and benchmarks need no AWS access.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.secrets = None
+
+    def get(self, secret_name):
+        """
+        Retrieves one secret.
+        """
+        if self.secrets is None:
+            with open(self.path) as f:
+                self.secrets = json.load(f)
+        return self.secrets[secret_name]
+
+    def get_many(self, secret_names):
+        """
+        Retrieves several secrets and returns them keyed by name.
+        """
+        return {name: self.get(name) for name in secret_names}
+
+class EncryptedFileCache:
+    """
+    Optional on-disk cache of fetched secrets, encrypted with Fernet (requires the cryptography package),
+    so a restarted worker can skip Secrets Manager while the cached values are still within their TTL.
+    """
+    def __init__(self, path, key):
+        from cryptography.fernet import Fernet
+        self.path = path
+        self.fernet = Fernet(key)
+
+    def load(self):
+        """
+        Returns the cached {secret_name: [value, fetched_at]} entries, or {} if the file is missing or unreadable.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(self.fernet.decrypt(f.read()))
+        except Exception:
+            return {}
+
+    def save(self, entries):
+        """
+        Writes the entries atomically, readable only by the current user.
+        """
+        data = self.fernet.encrypt(json.dumps(entries).encode())
+        temp_path = f"{self.path}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+class SecretsLoader:
+    """
+    Caches secrets in memory for ttl seconds in front of a provider, optionally backed by an encrypted file cache.
+    Secrets are fetched on first use, and prefetch loads several of them in one batch.
+    """
+    def __init__(self, provider, ttl=3600, file_cache=None):
+        self.provider = provider
+        self.ttl = ttl
+        self.file_cache = file_cache
+        self.entries = file_cache.load() if file_cache else {}
+        self.lock = threading.Lock()
+
+    def is_fresh(self, secret_name):
+        """
+        Returns True if a secret is cached and within its TTL. Called with the lock held.
+        """
+        entry = self.entries.get(secret_name)
+        return entry is not None and time.time() - entry[1] < self.ttl
+
+    def get(self, secret_name):
+        """
+        Returns a secret, fetching it if it is not cached or its TTL has passed.
+        """
+        with self.lock:
+            if self.is_fresh(secret_name):
+                return self.entries[secret_name][0]
+        self.prefetch([secret_name])
+        return self.entries[secret_name][0]
+
+    def prefetch(self, secret_names):
+        """
+        Fetches every secret that is not cached, or whose TTL has passed, in one batch.
+        """
+        with self.lock:
+            missing = [name for name in secret_names if not self.is_fresh(name)]
+        if not missing:
+            return
+        secrets = self.provider.get_many(missing)
+        now = time.time()
+        with self.lock:
+            for name, value in secrets.items():
+                self.entries[name] = [value, now]
+            if self.file_cache:
+                self.file_cache.save(self.entries)
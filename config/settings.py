@@ -1,35 +1,151 @@
-import boto3
-import json
+import os
+from config.secrets import AWSSecretsProvider, LocalFileProvider, EncryptedFileCache, SecretsLoader
 
 class Config:
     """
     Contains configuration settings for the bot, including service account credentials, API endpoints, etc.
-    Retrieves secrets from AWS Secrets Manager.
+    Retrieves secrets from AWS Secrets Manager. Each integration's secret (config.okta, config.slack, ...)
+    is loaded on first use, so building a Config makes no network calls.
     """
     def __init__(self):
         self.database_uri = 'database.db'
+        # Audit log of user actions: rows per group-committed transaction and the longest a row waits to be written.
+        self.audit = {
+            'batch_size': 500,
+            'flush_interval': 0.5
+        }
+        # Shared state (approval lists, conversations) read by the daily run and every webhook worker.
+        self.state_store_uri = 'state.db'
         self.log_level = 'INFO'
-        self.okta = self.get_secret("okta_secret")
-        self.coupa = self.get_secret("coupa_secret")
-        self.brex = self.get_secret("brex_secret")
-        self.jira = self.get_secret("jira_secret")
-        self.servicenow = self.get_secret("servicenow_secret")
-        self.workday = self.get_secret("workday_secret")
-        self.slack = self.get_secret("slack_secret")
+        # Approval systems by name and the client class that talks to each. Adding an entry (and its secret)
+        # plugs a new system into the daily run and the Slack commands.
+        self.approval_systems = {
+            'coupa': 'services.coupa_service.CoupaService',
+            'brex': 'services.brex_service.BrexService',
+            'jira': 'services.jira_service.JiraService',
+            'servicenow': 'services.servicenow_service.ServiceNowService',
+            'workday': 'services.workday_service.WorkdayService'
+        }
+        # Concurrency for the daily run: global cap on in-flight requests and the number of users collected
+        # at the same time. Each system's own limit adapts at runtime (see http['adaptive_concurrency']).
+        self.max_concurrency = 32
+        self.max_users_in_flight = 32
+        # Systems whose full pending set is fetched once per run and indexed by assignee,
+        # instead of being queried once per user.
+        self.bulk_fetch_systems = ['jira', 'servicenow']
+        # 'full' sends every user their full list each run, 'skip' skips users whose pending set is unchanged,
+        # and 'delta' also sends changed users only their new items.
+        self.digest_mode = 'delta'
+        # Users per bulk transaction in the run ledger; at most this many users are re-sent after a crash.
+        self.ledger_batch_size = 100
+        # Outbound Slack delivery: worker threads and per-method limits in requests per minute.
+        self.slack_delivery_workers = 4
+        self.slack_rate_limits = {
+            'chat.postMessage': 300
+        }
+        # Seconds before the Okta-to-Slack identity cache is rebuilt from Okta and Slack's users.list.
+        self.identity_ttl = 24 * 60 * 60
+        # Worker threads running Slack webhook jobs in app.py.
+        self.webhook_workers = 8
+        # Seconds a webhook's event ID is remembered in the state store, so retries to any worker are dropped.
+        self.webhook_dedupe_ttl = 60 * 60
+        # Scheduler mode (Picard.py --daemon): each user's digest is sent at local_time in their Okta time zone, with the
+        # users of a time zone spread across window_minutes. Users with the most pending items go first when
+        # schedule_priority is 'pending_items'. The plan is rebuilt every scheduler_replan_seconds.
+        self.schedule = {
+            'local_time': '15:00',
+            'window_minutes': 60,
+            'default_timezone': 'America/Los_Angeles'
+        }
+        self.schedule_priority = 'pending_items'
+        self.scheduler_tick_seconds = 30
+        self.scheduler_replan_seconds = 60 * 60
+        # Directory where each run writes <run_id>.json with per-system call counts, errors and latency
+        # percentiles. None disables the file; the summary is still logged.
+        self.run_summary_dir = 'run_summaries'
+        # Cache of each user's pending approvals per system, served to 'list'. Entries are fresh for their system's TTL
+        # in seconds and then served for up to max_stale seconds while being refreshed in the background. Jira and
+        # ServiceNow push changes through webhooks, so their entries can live longer.
+        self.approval_cache = {
+            'ttls': {
+                'coupa': 5 * 60,
+                'brex': 5 * 60,
+                'jira': 30 * 60,
+                'servicenow': 30 * 60,
+                'workday': 5 * 60
+            },
+            'max_stale': 4 * 60 * 60
+        }
+        # Per-system (connect, read) timeouts in seconds for fetching approvals.
+        self.system_timeouts = {
+            'coupa': (5, 15),
+            'brex': (5, 15),
+            'jira': (5, 30),
+            'servicenow': (5, 30),
+            'workday': (5, 15)
+        }
+        # Retries with jittered backoff for transient fetch errors, and the circuit breaker that stops calling
+        # a system after failure_threshold consecutive failures until reset_timeout seconds have passed.
+        self.resilience = {
+            'retries': 2,
+            'backoff': 0.5,
+            'max_backoff': 5.0,
+            'failure_threshold': 5,
+            'reset_timeout': 60
+        }
+        # Shared HTTP transport: keep-alive pool size per base URL and request timeouts in seconds.
+        self.http = {
+            'pool_connections': 10,
+            'pool_maxsize': 32,
+            'connect_timeout': 5,
+            'read_timeout': 30,
+            # Per-system adaptive in-flight limit: starts at initial_limit and moves between min_limit and max_limit
+            # from observed latency and 429/503 responses.
+            'adaptive_concurrency': {
+                'initial_limit': 4,
+                'min_limit': 1,
+                'max_limit': 32
+            }
+        }
+        # Integrations whose '<name>_secret' secret is exposed as config.<name>.
+        self.secret_sections = ['okta', 'slack'] + list(self.approval_systems)
+        # Secrets are cached in memory for this many seconds. If PICARD_SECRETS_CACHE_FILE and
+        # PICARD_SECRETS_CACHE_KEY (a Fernet key) are set, they are also cached in that encrypted file.
+        # If PICARD_SECRETS_FILE names a JSON file of secrets (e.g. for tests and benchmarks), no AWS calls are made.
+        self.secrets_ttl = 60 * 60
+        self.secrets = SecretsLoader(self.secrets_provider(), ttl=self.secrets_ttl, file_cache=self.secrets_file_cache())
 
-    def get_secret(self, secret_name):
+    def secrets_provider(self):
+        """
+        Returns the local file provider when PICARD_SECRETS_FILE is set, otherwise AWS Secrets Manager.
         """
-        Retrieves a secret from AWS Secrets Manager.
+        secrets_file = os.environ.get('PICARD_SECRETS_FILE')
+        if secrets_file:
+            return LocalFileProvider(secrets_file)
+        return AWSSecretsProvider(region_name=os.environ.get('AWS_REGION'))
+
+    def secrets_file_cache(self):
         """
-        client = boto3.client('secretsmanager')
+        Returns the encrypted local secrets cache, if one is configured.
+        """
+        path = os.environ.get('PICARD_SECRETS_CACHE_FILE')
+        key = os.environ.get('PICARD_SECRETS_CACHE_KEY')
+        return EncryptedFileCache(path, key) if path and key else None
+
+    def __getattr__(self, name):
+        # Only called for attributes not set in __init__, i.e. the lazily loaded integration secrets.
+        if name in self.__dict__.get('secret_sections', ()):
+            return self.get_secret(f"{name}_secret")
+        raise AttributeError(name)
 
-        try:
-            get_secret_value_response = client.get_secret_value(
-                SecretId=secret_name
-            )
-        except Exception as e:
-            raise Exception(f"Error retrieving secret {secret_name}: {e}")
+    def get_secret(self, secret_name):
+        """
+        Retrieves a secret through the cached secrets loader.
+        """
+        return self.secrets.get(secret_name)
 
-        # Decrypts secret using the associated KMS key.
-        secret = get_secret_value_response['SecretString']
-        return json.loads(secret)
+    def preload_secrets(self, names=None):
+        """
+        Fetches the secrets of the given integrations (all of them by default) in one batch.
+        """
+        self.secrets.prefetch(f"{name}_secret" for name in (names or self.secret_sections))
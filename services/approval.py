@@ -0,0 +1,50 @@
+class Approval:
+    """
+    One pending approval in the bot's own schema: the system it belongs to, its ID there, a one-line summary,
+    its date and a link to it. Every service normalizes its vendor records into these as the response is parsed,
+    so the rest of the bot never sees vendor JSON and only these fields are kept in memory.
+    """
+    __slots__ = ('system', 'id', 'summary', 'date', 'link')
+
+    def __init__(self, system, id, summary, date, link):
+        self.system = system
+        self.id = str(id)
+        self.summary = summary or ''
+        self.date = date or ''
+        self.link = link or ''
+
+    def to_dict(self):
+        """
+        Returns the approval as a JSON-serializable dict, for the state store and the run ledger.
+        """
+        return {'system': self.system, 'id': self.id, 'summary': self.summary, 'date': self.date, 'link': self.link}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds an approval from to_dict output.
+        """
+        return cls(data['system'], data['id'], data.get('summary'), data.get('date'), data.get('link'))
+
+    def __eq__(self, other):
+        if not isinstance(other, Approval):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __hash__(self):
+        return hash((self.system, self.id))
+
+    def __repr__(self):
+        return f"Approval({self.system!r}, {self.id!r}, {self.summary!r})"
+
+def approvals_to_dicts(approvals):
+    """
+    Converts approvals to dicts for storage.
+    """
+    return [approval.to_dict() for approval in approvals]
+
+def approvals_from_dicts(rows):
+    """
+    Converts stored dicts back to approvals.
+    """
+    return [Approval.from_dict(row) for row in rows]
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.approval import approvals_to_dicts, approvals_from_dicts
+
+CACHE_NAMESPACE = 'approval_cache'
+DEFAULT_TTL = 5 * 60
+MAX_STALE = 4 * 60 * 60
+
+class ApprovalCache:
+    """
+    Per-(user, system) cache of pending approvals, kept in the state store so the daily run and every webhook
+    worker share it. An entry is fresh for its system's TTL. After that it is still served, for up to max_stale
+    seconds, while a background refresh fetches the current list (stale-while-revalidate).
+    Entries are invalidated when a user acts on an item, and when a Jira or ServiceNow webhook reports a change.
+    """
+    def __init__(self, store, services, systems, ttls=None, default_ttl=DEFAULT_TTL, max_stale=MAX_STALE,
+                 max_workers=4):
+        self.store = store
+        self.services = services
+        self.systems = list(systems)
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='picard-cache')
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('Picard')
+
+    @staticmethod
+    def key(user_id, system):
+        """
+        Returns the state store key of a (user, system) entry.
+        """
+        return f"{user_id}|{system}"
+
+    def get(self, user_id):
+        """
+        Returns a user's pending approvals across every system, in system order, and the systems that could not
+        be reached. Fresh and recently stale entries are served from the cache; missing or expired ones are
+        fetched now, in parallel.
+        """
+        now = time.time()
+        entries = {}
+        missing = []
+        for system in self.systems:
+            entry = self.store.get(CACHE_NAMESPACE, self.key(user_id, system))
+            age = now - entry['fetched_at'] if entry else None
+            if entry is None or age > self.max_stale:
+                missing.append(system)
+                continue
+            entries[system] = approvals_from_dicts(entry['approvals'])
+            if entry.get('stale') or age > self.ttls.get(system, self.default_ttl):
+                self.refresh_in_background(user_id, system)
+        futures = {system: self.executor.submit(self.refresh, user_id, system) for system in missing}
+        unavailable = []
+        for system, future in futures.items():
+            try:
+                entries[system] = future.result()
+            except Exception as e:
+                self.logger.error(f"Failed to fetch {system} approvals for {user_id}: {e}")
+                unavailable.append(system)
+        approvals = [approval for system in self.systems for approval in entries.get(system, [])]
+        return approvals, unavailable
+
+    def put(self, user_id, system, approvals):
+        """
+        Stores a freshly fetched list of a user's approvals in one system.
+        """
+        self.store.set(CACHE_NAMESPACE, self.key(user_id, system),
+                       {'approvals': approvals_to_dicts(approvals), 'fetched_at': time.time()})
+
+    def refresh(self, user_id, system):
+        """
+        Fetches a user's approvals in one system, stores them and returns them.
+        """
+        approvals = self.services[system].get_pending_approvals(user_id)
+        self.put(user_id, system, approvals)
+        return approvals
+
+    def refresh_in_background(self, user_id, system):
+        """
+        Schedules a refresh of an entry, unless one is already running.
+        """
+        key = self.key(user_id, system)
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        self.executor.submit(self.background_refresh, user_id, system)
+
+    def background_refresh(self, user_id, system):
+        """
+        Refreshes an entry, keeping the stale one if the system cannot be reached.
+        """
+        try:
+            self.refresh(user_id, system)
+        except Exception as e:
+            self.logger.warning(f"Background refresh of {system} approvals for {user_id} failed: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(self.key(user_id, system))
+
+    def invalidate(self, user_id, system, approval_id=None):
+        """
+        Marks an entry stale so the next read revalidates it. If approval_id is given, that item is also dropped
+        from the cached list right away, e.g. after the user approved or rejected it.
+        """
+        key = self.key(user_id, system)
+        entry = self.store.get(CACHE_NAMESPACE, key)
+        if entry is None:
+            return
+        approvals = [approval for approval in entry['approvals']
+                     if approval_id is None or approval['id'] != approval_id]
+        self.store.set(CACHE_NAMESPACE, key, {'approvals': approvals, 'fetched_at': entry['fetched_at'], 'stale': True})
+
+    def item_changed(self, system, approval_id, user_ids):
+        """
+        Handles a webhook reporting that an item changed in a system: the cached entries of the users it was or is
+        assigned to are refreshed now, so their next 'list' is both fast and current. Users with nothing cached are
+        skipped; their first 'list' fetches anyway.
+        """
+        for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id):
+            if self.store.get(CACHE_NAMESPACE, self.key(user_id, system)) is None:
+                continue
+            self.invalidate(user_id, system)
+            try:
+                self.refresh(user_id, system)
+            except Exception as e:
+                self.logger.warning(f"Refresh of {system} approvals for {user_id} after {approval_id} changed failed: {e}")
@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from utils.metrics import metrics
+
+class ApprovalCollector:
+    """
+    Collects pending approvals for users from multiple systems concurrently.
+    A global cap bounds the number of requests in flight across all systems. Each system has its own worker pool,
+    so a slow system cannot starve the others; how many of its requests are actually in flight is left to the
+    adaptive limiter on that system's HTTP session. The cap is enforced by the sessions themselves, after the
+    system's own limiter slot is held, so requests queued behind a throttled system hold none of its slots.
+    """
+    def __init__(self, services, max_concurrency=32, max_users_in_flight=None):
+        self.services = services
+        self.max_concurrency = max_concurrency
+        self.max_users_in_flight = max_users_in_flight or max_concurrency
+        self.global_limit = threading.BoundedSemaphore(max_concurrency)
+        for service in services.values():
+            session = getattr(service, 'session', None)
+            if session is not None:
+                session.global_limit = self.global_limit
+        self.executors = {
+            name: ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"picard-{name}")
+            for name in services
+        }
+
+    def fetch(self, system_name, user_id):
+        """
+        Fetches pending approvals for a user from one system.
+        """
+        with metrics.timer('picard_fetch_seconds', system=system_name):
+            return self.services[system_name].get_pending_approvals(user_id)
+
+    def collect(self, user_id, systems=None):
+        """
+        Queries all systems (or only the given systems) for a user in parallel.
+        Returns (results, failures): the approvals from each system that answered, and the error from each system that did not.
+        """
+        systems = self.services if systems is None else systems
+        with metrics.timer('picard_user_collect_seconds'):
+            futures = {name: self.executors[name].submit(self.fetch, name, user_id) for name in systems}
+            results = {}
+            failures = {}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    failures[name] = e
+                    metrics.increment('picard_fetch_failures_total', system=name, error=type(e).__name__)
+        return results, failures
+
+    def collect_many(self, user_ids, systems=None, systems_for_user=None):
+        """
+        Collects approvals for many users at once and yields (user_id, results, failures) as each user completes.
+        User IDs are consumed lazily, so at most max_users_in_flight users are held in memory.
+        systems_for_user, if given, picks the systems to query for each user instead of systems.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_users_in_flight, thread_name_prefix='picard-user') as executor:
+            pending = {}
+            for user_id in user_ids:
+                if len(pending) >= self.max_users_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield (pending.pop(future),) + future.result()
+                user_systems = systems_for_user(user_id) if systems_for_user else systems
+                pending[executor.submit(self.collect, user_id, user_systems)] = user_id
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield (pending.pop(future),) + future.result()
+
+    def close(self):
+        """
+        Shuts down the per-system worker pools.
+        """
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
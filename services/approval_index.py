@@ -0,0 +1,39 @@
+from collections import defaultdict
+
+class ApprovalIndex:
+    """
+    In-memory index from assignee to pending approvals, built from the bulk retrieval mode of the service classes.
+    """
+    def __init__(self):
+        self.approvals_by_assignee = defaultdict(list)
+        self.systems = []
+
+    def add_system(self, system_name, records):
+        """
+        Adds every (assignee, approval) pair yielded by a system's bulk fetch to the index.
+        Records are consumed as they stream in, so only the index itself is kept in memory.
+        """
+        count = 0
+        for assignee, approval in records:
+            self.approvals_by_assignee[assignee].append(approval)
+            count += 1
+        self.systems.append(system_name)
+        return count
+
+    def split(self, shard_for, shard_count):
+        """
+        Splits the index into shard_count indexes, one per shard, each holding the approvals of the assignees
+        shard_for assigns to it. Every part covers the same systems.
+        """
+        parts = [ApprovalIndex() for _ in range(shard_count)]
+        for part in parts:
+            part.systems = list(self.systems)
+        for assignee, approvals in self.approvals_by_assignee.items():
+            parts[shard_for(assignee)].approvals_by_assignee[assignee] = approvals
+        return parts
+
+    def get(self, user_id):
+        """
+        Returns the indexed approvals assigned to a user.
+        """
+        return self.approvals_by_assignee.get(user_id, [])
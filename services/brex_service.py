@@ -1,38 +1,60 @@
-import requests
+from services.approval import Approval
+from utils.http_session import default_pool
 
 class BrexService:
     """
     Service class for interacting with Brex to retrieve pending expense approvals and budget change requests,
     and to send approvals back to Brex.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None):
         self.config = config
+        self.session = (session_pool or default_pool).get_session(config['base_url'], {
+            "Authorization": f"Bearer {config['api_token']}"
+        }, name='brex')
 
     def get_pending_approvals(self, user_id):
         """
         Fetches pending approvals for a specific user from Brex.
         """
         url = f"{self.config['base_url']}/api/pending_approvals"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}"
-        }
-        response = requests.get(url, headers=headers, params={"user_id": user_id})
+        response = self.session.get(url, params={"user_id": user_id})
         response.raise_for_status()
-        return response.json()
+        return [self.normalize(record) for record in response.json()]
+
+    def normalize(self, record):
+        """
+        Converts a Brex expense record into an Approval. Amounts are in cents.
+        """
+        amount = record.get('amount') or {}
+        merchant = (record.get('merchant') or {}).get('raw_descriptor', 'Expense')
+        summary = f"{merchant} {amount.get('amount', 0) / 100:.2f} {amount.get('currency', 'USD')}"
+        if record.get('memo'):
+            summary += f": {record['memo']}"
+        return Approval('brex', record['id'], summary, (record.get('created_at') or '')[:10],
+                        f"{self.config['base_url']}/expenses/{record['id']}")
 
     def send_approval(self, user_id, approval, comments):
         """
         Sends an approval back to Brex.
         """
         url = f"{self.config['base_url']}/api/approve"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}",
-            "Content-Type": "application/json"
+        data = {
+            "user_id": user_id,
+            "approval_id": approval.id,
+            "comments": comments
         }
+        response = self.session.post(url, json=data)
+        return response.json()
+
+    def send_rejection(self, user_id, approval, comments):
+        """
+        Sends a rejection back to Brex.
+        """
+        url = f"{self.config['base_url']}/api/reject"
         data = {
             "user_id": user_id,
-            "approval_id": approval['id'],
+            "approval_id": approval.id,
             "comments": comments
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = self.session.post(url, json=data)
         return response.json()
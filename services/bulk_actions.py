@@ -0,0 +1,74 @@
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# 'all', 'all jira', or a comma-separated list of item numbers and ranges such as '1-10' or '3,5,7'.
+SELECTION_PATTERN = re.compile(r"^(all(\s+\w+)?|\d+(-\d+)?(\s*,\s*\d+(-\d+)?)*)$")
+BULK_ACTION_WORKERS = 8
+
+def parse_item_selection(selector, approvals):
+    """
+    Returns the item numbers a selector picks out of a user's approvals, in order and without duplicates,
+    or None if the selector is not valid. Reversed ranges such as '5-3' pick the same items as '3-5'.
+    A range with a bound outside the list is not expanded: its bounds are returned as they are, for the caller
+    to reject, so a selector like '1-300000000' never builds a huge list.
+    """
+    selector = selector.strip().lower()
+    if not SELECTION_PATTERN.match(selector):
+        return None
+    if selector.startswith('all'):
+        system = selector[3:].strip()
+        return [number for number, approval in enumerate(approvals, 1) if not system or approval.system == system]
+    numbers = []
+    for part in selector.split(','):
+        first, _, last = part.strip().partition('-')
+        low, high = sorted([int(first), int(last or first)])
+        if low < 1 or high > len(approvals):
+            numbers.extend([low, high])
+        else:
+            numbers.extend(range(low, high + 1))
+    return list(dict.fromkeys(numbers))
+
+class BulkActionRunner:
+    """
+    Sends one approve/reject action on many approvals to their downstream systems concurrently.
+    Approvals are grouped per system. Systems with a send_batch method get one batched call per group;
+    for the others, each approval is sent as its own concurrent call.
+    """
+    def __init__(self, services, max_workers=BULK_ACTION_WORKERS):
+        self.services = services
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='picard-bulk')
+
+    def run(self, user_id, action, approvals, comment):
+        """
+        Applies the action to every approval and returns (approval, succeeded) pairs in the original order.
+        """
+        by_system = defaultdict(list)
+        for approval in approvals:
+            by_system[approval.system].append(approval)
+        futures = []
+        for system, system_approvals in by_system.items():
+            service = self.services[system]
+            if len(system_approvals) > 1 and hasattr(service, 'send_batch'):
+                futures.append((system_approvals, self.executor.submit(
+                    service.send_batch, user_id, system_approvals, action, comment)))
+            else:
+                send = service.send_approval if action == 'approve' else service.send_rejection
+                for approval in system_approvals:
+                    futures.append(([approval], self.executor.submit(self.send_one, send, user_id, approval, comment)))
+        outcomes = {}
+        for group, future in futures:
+            try:
+                responses = future.result()
+            except Exception:
+                responses = [{'status': 'failed'}] * len(group)
+            for approval, response in zip(group, responses):
+                outcomes[id(approval)] = response.get('status') == 'success'
+        return [(approval, outcomes.get(id(approval), False)) for approval in approvals]
+
+    @staticmethod
+    def send_one(send, user_id, approval, comment):
+        """
+        Sends one action and wraps the response in a list, like send_batch.
+        """
+        return [send(user_id, approval, comment)]
@@ -0,0 +1,75 @@
+import time
+from services.approval import Approval, approvals_to_dicts, approvals_from_dicts
+
+AWAITING_CONFIRMATION = 'awaiting_confirmation'
+AWAITING_COMMENT = 'awaiting_comment'
+EXPIRED = 'expired'
+
+# Seconds a user has to answer each step before the pending action expires.
+CONVERSATION_TIMEOUT = 15 * 60
+
+class ConversationManager:
+    """
+    Tracks each user's in-progress approve/reject action as a sequence of persisted steps:
+    confirmation, then comment. Steps are advanced when the user's reply arrives, so no thread waits on a human.
+    """
+    def __init__(self, store, timeout=CONVERSATION_TIMEOUT):
+        self.store = store
+        self.timeout = timeout
+
+    def start(self, user_id, action, approval, state, approvals=None):
+        """
+        Starts a conversation for an action on an approval at the given step.
+        A bulk action passes its approvals instead, and approval is None.
+        """
+        conversation = {
+            'action': action,
+            'approval': approval,
+            'state': state,
+            'expires_at': time.time() + self.timeout
+        }
+        if approvals:
+            conversation['approvals'] = approvals
+        self.save(user_id, conversation)
+
+    def get(self, user_id):
+        """
+        Returns the user's conversation, or None if there is none.
+        A conversation past its deadline is removed and returned with the expired state.
+        """
+        conversation = self.store.get(user_id)
+        if conversation:
+            conversation = dict(conversation)
+            if conversation['approval']:
+                conversation['approval'] = Approval.from_dict(conversation['approval'])
+            if conversation.get('approvals'):
+                conversation['approvals'] = approvals_from_dicts(conversation['approvals'])
+        if conversation and conversation['expires_at'] < time.time():
+            self.finish(user_id)
+            conversation['state'] = EXPIRED
+        return conversation
+
+    def advance(self, user_id, conversation, state):
+        """
+        Moves the conversation to the next step and resets its deadline.
+        """
+        conversation['state'] = state
+        conversation['expires_at'] = time.time() + self.timeout
+        self.save(user_id, conversation)
+
+    def save(self, user_id, conversation):
+        """
+        Stores a conversation, with its approvals converted to dicts.
+        """
+        conversation = dict(conversation)
+        if conversation['approval']:
+            conversation['approval'] = conversation['approval'].to_dict()
+        if conversation.get('approvals'):
+            conversation['approvals'] = approvals_to_dicts(conversation['approvals'])
+        self.store[user_id] = conversation
+
+    def finish(self, user_id):
+        """
+        Ends the user's conversation.
+        """
+        self.store.pop(user_id, None)
@@ -1,38 +1,59 @@
-import requests
+from services.approval import Approval
+from utils.http_session import default_pool
 
 class CoupaService:
     """
     Service class for interacting with Coupa to retrieve pending purchase requests and invoices,
     and to send approvals back to Coupa.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None):
         self.config = config
+        self.session = (session_pool or default_pool).get_session(config['base_url'], {
+            "Authorization": f"Bearer {config['api_token']}"
+        }, name='coupa')
 
     def get_pending_approvals(self, user_id):
         """
         Fetches pending approvals for a specific user from Coupa.
         """
         url = f"{self.config['base_url']}/api/pending_approvals"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}"
-        }
-        response = requests.get(url, headers=headers, params={"user_id": user_id})
+        response = self.session.get(url, params={"user_id": user_id})
         response.raise_for_status()
-        return response.json()
+        return [self.normalize(record) for record in response.json()]
+
+    def normalize(self, record):
+        """
+        Converts a Coupa approval record into an Approval.
+        """
+        approvable_type = record.get('approvable-type', 'Request')
+        approvable_id = record.get('approvable-id', record['id'])
+        description = (record.get('approvable') or {}).get('description')
+        summary = f"{approvable_type} #{approvable_id}" + (f": {description}" if description else '')
+        return Approval('coupa', record['id'], summary, (record.get('created-at') or '')[:10],
+                        f"{self.config['base_url']}/approvals/{record['id']}")
 
     def send_approval(self, user_id, approval, comments):
         """
         Sends an approval back to Coupa.
         """
         url = f"{self.config['base_url']}/api/approve"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}",
-            "Content-Type": "application/json"
+        data = {
+            "user_id": user_id,
+            "approval_id": approval.id,
+            "comments": comments
         }
+        response = self.session.post(url, json=data)
+        return response.json()
+
+    def send_rejection(self, user_id, approval, comments):
+        """
+        Sends a rejection back to Coupa.
+        """
+        url = f"{self.config['base_url']}/api/reject"
         data = {
             "user_id": user_id,
-            "approval_id": approval['id'],
+            "approval_id": approval.id,
             "comments": comments
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = self.session.post(url, json=data)
         return response.json()
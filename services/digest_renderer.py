@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+from services.digest_tracker import approval_key, fingerprint
+
+# Slack allows 50 blocks per message; each item takes two (its text and its buttons), leaving room for the
+# header, the notices and the navigation.
+ITEMS_PER_PAGE = 20
+# Slack truncates section text above 3000 characters; summaries are cut well before that.
+MAX_SUMMARY_LENGTH = 300
+COMMANDS_HELP = ("Commands: 'list' to see your pending approvals, 'help' for help, "
+                 "'approve N' or 'reject N' for item N, or 'approve 1-10', 'reject 3,5,7', 'approve all jira' "
+                 "for several items at once.")
+
+def escape_mrkdwn(text):
+    """
+    Escapes the characters Slack gives a meaning in mrkdwn text, so vendor-supplied text is shown as it is.
+    """
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+class DigestRenderer:
+    """
+    Renders approval lists as Block Kit messages with approve/reject buttons on every item, split into pages
+    that stay within Slack's message limits. Rendered pages are cached per user until their approval list
+    (or the set of unavailable systems) changes, so repeated 'list' commands do not render again.
+    """
+    def __init__(self, system_names=None, cache_size=1024):
+        self.system_names = system_names or {}
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def render(self, user_id, approvals, unavailable=None):
+        """
+        Returns the pages of a user's digest, each a dict with the fallback 'text' and the 'blocks'.
+        """
+        key = fingerprint([f"{approval_key(approval)}|{approval.summary}|{approval.date}|{approval.link}"
+                           for approval in approvals] + [f"unavailable:{name}" for name in unavailable or []])
+        with self.lock:
+            cached = self.cache.get(user_id)
+            if cached and cached[0] == key:
+                self.cache.move_to_end(user_id)
+                return cached[1]
+        pages = self.render_pages(approvals, unavailable)
+        with self.lock:
+            self.cache[user_id] = (key, pages)
+            self.cache.move_to_end(user_id)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return pages
+
+    def render_pages(self, approvals, unavailable=None):
+        """
+        Renders every page of a digest in one pass over the approvals.
+        """
+        page_count = max(1, -(-len(approvals) // ITEMS_PER_PAGE))
+        pages = []
+        for page in range(1, page_count + 1):
+            start = (page - 1) * ITEMS_PER_PAGE
+            items = list(enumerate(approvals[start:start + ITEMS_PER_PAGE], start + 1))
+            if approvals:
+                title = f"You have {len(approvals)} pending approvals"
+                if page_count > 1:
+                    title += f" (page {page} of {page_count})"
+            else:
+                title = "You have no pending approvals"
+            blocks = [self.text_block(f"*{title}*")]
+            blocks.extend(block for number, approval in items for block in self.item_blocks(number, approval))
+            if unavailable:
+                blocks.append(self.context_block(self.unavailable_text(unavailable)))
+            if page_count > 1:
+                blocks.append(self.navigation_block(page, page_count))
+            blocks.append(self.context_block(COMMANDS_HELP))
+            pages.append({'text': title, 'blocks': blocks})
+        return pages
+
+    def render_delta(self, approvals, added_keys, removed_count):
+        """
+        Renders a message listing only the new approvals, numbered by their place in the full list.
+        At most one page of new items is shown; the rest are reachable through 'list'.
+        """
+        added = set(added_keys)
+        items = [(number, approval) for number, approval in enumerate(approvals, 1) if approval_key(approval) in added]
+        title = f"You have {len(items)} new pending approvals since your last digest"
+        blocks = [self.text_block(f"*{title}*")]
+        blocks.extend(block for number, approval in items[:ITEMS_PER_PAGE] for block in self.item_blocks(number, approval))
+        notes = []
+        if len(items) > ITEMS_PER_PAGE:
+            notes.append(f"{len(items) - ITEMS_PER_PAGE} more new items are not shown.")
+        if removed_count:
+            notes.append(f"{removed_count} items from your last digest are no longer pending.")
+        notes.append(f"Type 'list' to see all {len(approvals)} pending approvals.")
+        blocks.append(self.context_block(' '.join(notes)))
+        return {'text': title, 'blocks': blocks}
+
+    def item_blocks(self, number, approval):
+        """
+        Returns the blocks of one item: its description and its approve/reject buttons. The buttons carry the
+        item's stable key rather than its number, so a button in an old digest still acts on the item it was shown
+        next to after the user's list has been renumbered. The summary links to the item when it has a link;
+        a '|' would end the link text early, so it is left out there.
+        """
+        summary = approval.summary
+        if len(summary) > MAX_SUMMARY_LENGTH:
+            summary = summary[:MAX_SUMMARY_LENGTH - 1] + '…'
+        summary = escape_mrkdwn(summary)
+        if approval.link:
+            link = escape_mrkdwn(approval.link).replace('|', '%7C')
+            summary = f"<{link}|{summary.replace('|', '')}>"
+        system = self.system_names.get(approval.system, approval.system)
+        text = f"*{number}.* {summary}\n{system} · {escape_mrkdwn(approval.date)}"
+        return [
+            self.text_block(text, block_id=f"item-{number}"),
+            {
+                'type': 'actions',
+                'block_id': f"item-{number}-actions",
+                'elements': [
+                    self.button('Approve', 'approve', approval_key(approval), style='primary'),
+                    self.button('Reject', 'reject', approval_key(approval), style='danger')
+                ]
+            }
+        ]
+
+    def navigation_block(self, page, page_count):
+        """
+        Returns the previous/next page buttons.
+        """
+        elements = []
+        if page > 1:
+            elements.append(self.button('Previous page', 'page_previous', str(page - 1)))
+        if page < page_count:
+            elements.append(self.button('Next page', 'page_next', str(page + 1)))
+        return {'type': 'actions', 'block_id': 'navigation', 'elements': elements}
+
+    def unavailable_text(self, unavailable):
+        """
+        Returns the notice naming the systems that could not be reached.
+        """
+        names = ', '.join(self.system_names.get(name, name) for name in unavailable)
+        return f"Could not reach {names} right now; approvals from there are not included in this list."
+
+    @staticmethod
+    def text_block(text, block_id=None):
+        """
+        Returns a section block with mrkdwn text.
+        """
+        block = {'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}
+        if block_id:
+            block['block_id'] = block_id
+        return block
+
+    @staticmethod
+    def context_block(text):
+        """
+        Returns a context block with mrkdwn text.
+        """
+        return {'type': 'context', 'elements': [{'type': 'mrkdwn', 'text': text}]}
+
+    @staticmethod
+    def button(text, action_id, value, style=None):
+        """
+        Returns a button element.
+        """
+        button = {'type': 'button', 'text': {'type': 'plain_text', 'text': text}, 'action_id': action_id, 'value': value}
+        if style:
+            button['style'] = style
+        return button
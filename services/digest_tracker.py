@@ -0,0 +1,87 @@
+import hashlib
+import json
+import threading
+
+FULL = 'full'
+DELTA = 'delta'
+SKIP = 'skip'
+# A digest sent with some systems unavailable; never recorded as the user's last digest.
+PARTIAL = 'partial'
+
+def approval_key(approval):
+    """
+    Returns the stable key identifying an approval across runs.
+    """
+    return f"{approval.system}:{approval.id}"
+
+def keep_numbering(approvals, numbered):
+    """
+    Returns the approvals arranged so every item of numbered, the list the user's item numbers currently refer to,
+    keeps its number: those items first in their old order, then the new ones. Returns None if an item of numbered
+    is no longer pending, since the numbers after it cannot be kept.
+    """
+    current = {approval_key(approval): approval for approval in approvals}
+    if any(approval_key(approval) not in current for approval in numbered):
+        return None
+    kept = [current.pop(approval_key(approval)) for approval in numbered]
+    return kept + list(current.values())
+
+def fingerprint(keys):
+    """
+    Returns a compact hash of a sorted list of approval keys.
+    """
+    return hashlib.sha1('\n'.join(keys).encode()).hexdigest()
+
+class DigestTracker:
+    """
+    Decides whether each user needs a full digest, only the new items, or nothing at all,
+    by comparing their pending set with a fingerprint of the last digest sent to them.
+    Modes: 'full' always sends the full list, 'skip' skips unchanged users, and 'delta' also sends only new items to changed users.
+    """
+    def __init__(self, db, mode=DELTA, batch_size=100):
+        self.db = db
+        self.mode = mode
+        self.batch_size = batch_size
+        self.pending_writes = []
+        self.lock = threading.Lock()
+
+    def plan(self, user_id, approvals):
+        """
+        Returns (action, added_keys, removed_keys) for a user's current approvals.
+        """
+        keys = sorted(approval_key(approval) for approval in approvals)
+        current = fingerprint(keys)
+        previous = self.db.get_digest(user_id)
+
+        if self.mode == FULL or previous is None:
+            return FULL, keys, []
+        if previous[0] == current:
+            return SKIP, [], []
+        if self.mode == SKIP:
+            return FULL, keys, []
+        previous_keys = set(json.loads(previous[1]))
+        current_keys = set(keys)
+        added = [key for key in keys if key not in previous_keys]
+        removed = sorted(previous_keys - current_keys)
+        # Items that only disappeared do not need a message by themselves, but they renumber the list; send_digest
+        # sends a full digest instead when the user's numbers cannot be kept.
+        return (DELTA if added else SKIP), added, removed
+
+    def record(self, user_id, approvals):
+        """
+        Buffers the fingerprint of a digest once it has been delivered. Safe to call from Slack delivery worker threads.
+        """
+        keys = sorted(approval_key(approval) for approval in approvals)
+        with self.lock:
+            self.pending_writes.append((user_id, fingerprint(keys), json.dumps(keys)))
+
+    def flush(self, force=True):
+        """
+        Writes buffered fingerprints in one transaction. Without force, only writes once a full batch is buffered.
+        """
+        with self.lock:
+            if not force and len(self.pending_writes) < self.batch_size:
+                return
+            pending_writes, self.pending_writes = self.pending_writes, []
+        if pending_writes:
+            self.db.save_digests(pending_writes)
@@ -0,0 +1,141 @@
+import threading
+import time
+
+IDENTITY_NAMESPACE = 'identities'
+META_NAMESPACE = 'identity_meta'
+IDENTITY_TTL = 24 * 60 * 60
+
+class IdentityResolver:
+    """
+    Maps Okta user IDs to Slack user IDs and DM channels, and Slack user IDs back to Okta user IDs.
+    The mapping is built in bulk by joining Slack's users.list with Okta profiles on email, persisted in the
+    state store so Picard.py and app.py share it, and held in memory, so per-message lookups make no network calls.
+    """
+    def __init__(self, store, slack_service, ttl=IDENTITY_TTL):
+        self.store = store
+        self.slack_service = slack_service
+        self.ttl = ttl
+        self.by_okta = None
+        self.by_slack = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def is_stale(self):
+        """
+        Returns True if the mapping was never built or is older than the TTL.
+        """
+        refreshed_at = self.store.get(META_NAMESPACE, 'refreshed_at')
+        return refreshed_at is None or time.time() - refreshed_at > self.ttl
+
+    def refresh(self, okta_users):
+        """
+        Rebuilds the mapping from an iterable of Okta users (with profiles) and Slack's paginated users.list.
+        Returns the number of Okta users with a Slack account.
+        """
+        slack_ids_by_email = self.list_slack_users()
+        return sum(1 for _, identity in self.join(okta_users, slack_ids_by_email) if identity)
+
+    def list_slack_users(self):
+        """
+        Returns the Slack user ID of every active human member of the workspace, keyed by lowercase email.
+        """
+        slack_ids_by_email = {}
+        for member in self.slack_service.list_users():
+            email = member.get('profile', {}).get('email')
+            if email and not member.get('deleted') and not member.get('is_bot'):
+                slack_ids_by_email[email.lower()] = member['id']
+        return slack_ids_by_email
+
+    def join(self, okta_users, slack_ids_by_email):
+        """
+        Joins Okta users with the Slack directory on email as they arrive, yielding (okta_user_id, identity) for
+        each one, with identity None if they have no Slack account. Each identity is usable for lookups as soon as
+        it is yielded, so a run can start on the first page of Okta users. The mapping is persisted, replacing the
+        old one, once every Okta user has been seen.
+        DM channels already learned for a user are kept as long as their Slack user ID is unchanged.
+        """
+        self.ensure_loaded()
+        previous = dict(self.store.items(IDENTITY_NAMESPACE))
+        identities = {}
+        for user in okta_users:
+            email = (user.get('profile', {}).get('email') or '').lower()
+            slack_user_id = slack_ids_by_email.get(email)
+            if not slack_user_id:
+                yield user['id'], None
+                continue
+            dm_channel = previous.get(user['id'], {}).get('dm_channel')
+            if previous.get(user['id'], {}).get('slack_user_id') != slack_user_id:
+                dm_channel = None
+            identity = {'email': email, 'slack_user_id': slack_user_id, 'dm_channel': dm_channel,
+                        'time_zone': user.get('profile', {}).get('timeZone')}
+            identities[user['id']] = identity
+            with self.lock:
+                self.by_okta[user['id']] = identity
+                self.by_slack[slack_user_id] = user['id']
+            yield user['id'], identity
+        self.store.replace_namespace(IDENTITY_NAMESPACE, identities.items())
+        self.store.set(META_NAMESPACE, 'refreshed_at', time.time())
+        self.load()
+
+    def load(self):
+        """
+        Loads the persisted mapping into memory.
+        """
+        refreshed_at = self.store.get(META_NAMESPACE, 'refreshed_at')
+        identities = dict(self.store.items(IDENTITY_NAMESPACE))
+        by_slack = {identity['slack_user_id']: okta_user_id for okta_user_id, identity in identities.items()}
+        with self.lock:
+            self.by_okta = identities
+            self.by_slack = by_slack
+            self.loaded_at = refreshed_at
+
+    def ensure_loaded(self):
+        """
+        Loads the mapping on first use, and again after another process has refreshed it.
+        """
+        if self.by_okta is None or self.store.get(META_NAMESPACE, 'refreshed_at') != self.loaded_at:
+            self.load()
+
+    def get(self, okta_user_id):
+        """
+        Returns the identity of an Okta user (email, slack_user_id, dm_channel), or None.
+        """
+        self.ensure_loaded()
+        return self.by_okta.get(okta_user_id)
+
+    def all(self):
+        """
+        Returns every identity, keyed by Okta user ID.
+        """
+        self.ensure_loaded()
+        return dict(self.by_okta)
+
+    def channel(self, okta_user_id):
+        """
+        Returns the Slack channel to message an Okta user in: their DM channel once known, otherwise their
+        Slack user ID, which Slack resolves to the same DM. Returns None for users with no Slack account.
+        """
+        identity = self.get(okta_user_id)
+        if identity is None:
+            return None
+        return identity['dm_channel'] or identity['slack_user_id']
+
+    def okta_user_id(self, slack_user_id):
+        """
+        Returns the Okta user ID of a Slack user, or None.
+        """
+        self.ensure_loaded()
+        return self.by_slack.get(slack_user_id)
+
+    def remember_channel(self, slack_user_id, channel):
+        """
+        Records the DM channel a Slack user wrote to the bot from, so later messages go straight to it.
+        """
+        okta_user_id = self.okta_user_id(slack_user_id)
+        identity = self.by_okta.get(okta_user_id) if okta_user_id else None
+        if identity is None or identity['dm_channel'] == channel:
+            return
+        identity = dict(identity, dm_channel=channel)
+        with self.lock:
+            self.by_okta[okta_user_id] = identity
+        self.store.set(IDENTITY_NAMESPACE, okta_user_id, identity)
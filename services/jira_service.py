@@ -1,35 +1,69 @@
-import requests
+from services.approval import Approval
+from utils.http_session import default_pool
 
 class JiraService:
     """
     Service class for interacting with Jira to retrieve pending actions for the user,
     and to send approvals back to Jira.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None):
         self.config = config
+        self.session = (session_pool or default_pool).get_session(config['base_url'], {
+            "Authorization": f"Bearer {config['api_token']}"
+        }, name='jira')
 
     def get_pending_approvals(self, user_id):
         """
         Fetches pending approvals for a specific user from Jira.
         """
         url = f"{self.config['base_url']}/rest/api/2/search"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}"
-        }
         jql = f"assignee={user_id} AND status='Pending Approval'"
-        response = requests.get(url, headers=headers, params={"jql": jql})
+        response = self.session.get(url, params={"jql": jql})
+        response.raise_for_status()
+        return [self.normalize(issue) for issue in response.json()['issues']]
+
+    def get_all_pending_approvals(self):
+        """
+        Yields (assignee, issue) pairs for every pending approval in Jira, one page at a time.
+        Used by the bulk retrieval mode to replace one search per user with one paginated search per run.
+        """
+        start_at = 0
+        while start_at is not None:
+            pairs, start_at = self.get_pending_approvals_page(start_at)
+            yield from pairs
+
+    def get_pending_approvals_page(self, start_at):
+        """
+        Fetches one page of the bulk search. Returns its (assignee, approval) pairs and the startAt of the next
+        page, or None after the last page.
+        """
+        url = f"{self.config['base_url']}/rest/api/2/search"
+        jql = "status='Pending Approval' AND assignee is not EMPTY ORDER BY assignee"
+        page_size = self.config.get('page_size', 100)
+        response = self.session.get(url, params={"jql": jql, "startAt": start_at, "maxResults": page_size})
         response.raise_for_status()
-        return response.json()['issues']
+        page = response.json()
+        issues = page['issues']
+        pairs = [(issue['fields']['assignee']['name'], self.normalize(issue))
+                 for issue in issues if issue['fields'].get('assignee')]
+        start_at += len(issues)
+        if not issues or start_at >= page.get('total', 0):
+            return pairs, None
+        return pairs, start_at
+
+    def normalize(self, issue):
+        """
+        Converts a Jira issue into an Approval.
+        """
+        fields = issue.get('fields', {})
+        return Approval('jira', issue['id'], f"{issue['key']}: {fields.get('summary', '')}",
+                        (fields.get('created') or '')[:10], f"{self.config['base_url']}/browse/{issue['key']}")
 
     def send_approval(self, user_id, approval, comments):
         """
         Sends an approval back to Jira.
         """
-        url = f"{self.config['base_url']}/rest/api/2/issue/{approval['id']}/transitions"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}",
-            "Content-Type": "application/json"
-        }
+        url = f"{self.config['base_url']}/rest/api/2/issue/{approval.id}/transitions"
         data = {
             "transition": {
                 "id": "approve_transition_id"
@@ -42,5 +76,25 @@ class JiraService:
                 }
             }
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = self.session.post(url, json=data)
+        return response.json()
+
+    def send_rejection(self, user_id, approval, comments):
+        """
+        Sends a rejection back to Jira.
+        """
+        url = f"{self.config['base_url']}/rest/api/2/issue/{approval.id}/transitions"
+        data = {
+            "transition": {
+                "id": "reject_transition_id"
+            },
+            "fields": {
+                "comment": {
+                    "add": {
+                        "body": comments
+                    }
+                }
+            }
+        }
+        response = self.session.post(url, json=data)
         return response.json()
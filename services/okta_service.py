@@ -1,21 +1,37 @@
-import requests
+from utils.http_session import default_pool
 
 class OktaService:
     """
     Service class for interacting with Okta to retrieve the list of active users.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None):
         self.config = config
+        self.session = (session_pool or default_pool).get_session(config['base_url'], {
+            "Authorization": f"SSWS {config['api_token']}"
+        }, name='okta')
 
     def get_active_users(self):
         """
-        Fetches the list of active users from Okta.
+        Yields the IDs of active users from Okta as each page arrives.
+        """
+        for user in self.get_active_user_profiles():
+            yield user['id']
+
+    def get_active_user_profiles(self):
+        """
+        Yields active Okta users, with their profiles, as each page arrives.
+        The status filter is applied by Okta, and pages are followed through the Link: rel="next" header,
+        so only one page is held in memory at a time.
         """
         url = f"{self.config['base_url']}/api/v1/users"
-        headers = {
-            "Authorization": f"SSWS {self.config['api_token']}"
+        params = {
+            "filter": 'status eq "ACTIVE"',
+            "limit": self.config.get('page_size', 200)
         }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        users = response.json()
-        return [user['id'] for user in users if user['status'] == 'ACTIVE']
+        while url:
+            response = self.session.get(url, params=params)
+            response.raise_for_status()
+            yield from response.json()
+            # The next link already carries the filter and the pagination cursor.
+            url = response.links.get('next', {}).get('url')
+            params = None
@@ -0,0 +1,66 @@
+import importlib
+import threading
+
+class ServiceRegistry:
+    """
+    Central registry of approval system clients, shared by Picard.py and app.py.
+    Each client is created on first use with its config section and the shared session pool, then reused,
+    so approving an item builds no objects. New approval systems are plugged in by name, either through
+    Config.approval_systems or with register.
+    """
+    def __init__(self, config, session_pool=None):
+        self.config = config
+        self.session_pool = session_pool
+        self.factories = {}
+        self.services = {}
+        self.lock = threading.Lock()
+        for name, factory in getattr(config, 'approval_systems', {}).items():
+            self.register(name, factory)
+
+    def register(self, name, factory):
+        """
+        Registers an approval system. factory is a class or callable taking (config_section, session_pool),
+        or its dotted import path such as 'services.coupa_service.CoupaService'.
+        """
+        with self.lock:
+            self.factories[name] = factory
+            self.services.pop(name, None)
+
+    def get(self, name):
+        """
+        Returns the client for an approval system, creating it on first use.
+        """
+        service = self.services.get(name)
+        if service is not None:
+            return service
+        with self.lock:
+            if name not in self.services:
+                if name not in self.factories:
+                    raise KeyError(f"Unknown approval system: {name}")
+                self.services[name] = self.create(name, self.factories[name])
+            return self.services[name]
+
+    def create(self, name, factory):
+        """
+        Builds a client, resolving a dotted import path first. The config section is the Config attribute
+        named after the system, or the '<name>_secret' secret for systems Config does not define.
+        """
+        if isinstance(factory, str):
+            module_name, _, class_name = factory.rpartition('.')
+            factory = getattr(importlib.import_module(module_name), class_name)
+        section = getattr(self.config, name, None)
+        if section is None:
+            section = self.config.get_secret(f"{name}_secret")
+        return factory(section, self.session_pool)
+
+    def names(self):
+        """
+        Returns the names of the registered approval systems.
+        """
+        return list(self.factories)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __contains__(self, name):
+        return name in self.factories
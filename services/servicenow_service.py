@@ -1,37 +1,136 @@
-import requests
+import base64
+import json
+import uuid
+from services.approval import Approval
+from utils.http_session import default_pool
+
+# Requests per call to the ServiceNow Batch API.
+BATCH_SIZE = 50
+
+def field(record, name, part='value'):
+    """
+    Returns one part ('value' or 'display_value') of a ServiceNow field. With sysparm_display_value=all every field
+    is a dict of both parts, reference fields also carry a 'link'; without it, fields are plain strings.
+    """
+    value = record.get(name)
+    if isinstance(value, dict):
+        return value.get(part)
+    return value
 
 class ServiceNowService:
     """
     Service class for interacting with ServiceNow to retrieve open pending approvals,
     and to send approvals back to ServiceNow.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None):
         self.config = config
+        self.session = (session_pool or default_pool).get_session(config['base_url'], {
+            "Authorization": f"Bearer {config['api_token']}"
+        }, name='servicenow')
 
     def get_pending_approvals(self, user_id):
         """
         Fetches pending approvals for a specific user from ServiceNow.
         """
         url = f"{self.config['base_url']}/api/now/table/approval"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}"
+        params = {"assigned_to": user_id, "state": "pending", "sysparm_display_value": "all"}
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return [self.normalize(record) for record in response.json()['result']]
+
+    def get_all_pending_approvals(self):
+        """
+        Yields (assignee, approval) pairs for every pending approval in ServiceNow, one page at a time.
+        Used by the bulk retrieval mode to replace one query per user with one paginated query per run.
+        """
+        offset = 0
+        while offset is not None:
+            pairs, offset = self.get_pending_approvals_page(offset)
+            yield from pairs
+
+    def get_pending_approvals_page(self, offset):
+        """
+        Fetches one page of the bulk query. Returns its (assignee, approval) pairs and the offset of the next page,
+        or None after the last page.
+        """
+        url = f"{self.config['base_url']}/api/now/table/approval"
+        page_size = self.config.get('page_size', 1000)
+        params = {
+            "state": "pending",
+            "sysparm_query": "ORDERBYassigned_to",
+            "sysparm_display_value": "all",
+            "sysparm_exclude_reference_link": "true",
+            "sysparm_limit": page_size,
+            "sysparm_offset": offset
         }
-        response = requests.get(url, headers=headers, params={"assigned_to": user_id, "state": "pending"})
+        response = self.session.get(url, params=params)
         response.raise_for_status()
-        return response.json()['result']
+        records = response.json()['result']
+        pairs = [(field(record, 'assigned_to'), self.normalize(record)) for record in records
+                 if field(record, 'assigned_to')]
+        if len(records) < page_size:
+            return pairs, None
+        return pairs, offset + len(records)
+
+    def normalize(self, record):
+        """
+        Converts a ServiceNow approval record into an Approval. Approval records have no description of their own,
+        so the summary is the display value of the approved record (sysapproval).
+        """
+        sys_id = field(record, 'sys_id')
+        summary = field(record, 'sysapproval', 'display_value')
+        return Approval('servicenow', sys_id, summary, (field(record, 'sys_created_on') or '')[:10],
+                        f"{self.config['base_url']}/nav_to.do?uri=sysapproval_approver.do?sys_id={sys_id}")
 
     def send_approval(self, user_id, approval, comments):
         """
         Sends an approval back to ServiceNow.
         """
-        url = f"{self.config['base_url']}/api/now/table/approval/{approval['id']}"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}",
-            "Content-Type": "application/json"
-        }
+        url = f"{self.config['base_url']}/api/now/table/approval/{approval.id}"
         data = {
             "state": "approved",
             "comments": comments
         }
-        response = requests.patch(url, headers=headers, json=data)
+        response = self.session.patch(url, json=data)
         return response.json()
+
+    def send_rejection(self, user_id, approval, comments):
+        """
+        Sends a rejection back to ServiceNow.
+        """
+        url = f"{self.config['base_url']}/api/now/table/approval/{approval.id}"
+        data = {
+            "state": "rejected",
+            "comments": comments
+        }
+        response = self.session.patch(url, json=data)
+        return response.json()
+
+    def send_batch(self, user_id, approvals, action, comments):
+        """
+        Approves or rejects several approvals through the ServiceNow Batch API, BATCH_SIZE per request.
+        Returns one response per approval, in order, shaped like the send_approval response.
+        """
+        state = "approved" if action == "approve" else "rejected"
+        body = base64.b64encode(json.dumps({"state": state, "comments": comments}).encode()).decode()
+        statuses = {}
+        for start in range(0, len(approvals), BATCH_SIZE):
+            chunk = approvals[start:start + BATCH_SIZE]
+            data = {
+                "batch_request_id": uuid.uuid4().hex,
+                "rest_requests": [{
+                    "id": approval.id,
+                    "url": f"/api/now/table/approval/{approval.id}",
+                    "method": "PATCH",
+                    "headers": [
+                        {"name": "Content-Type", "value": "application/json"},
+                        {"name": "Accept", "value": "application/json"}
+                    ],
+                    "body": body
+                } for approval in chunk]
+            }
+            response = self.session.post(f"{self.config['base_url']}/api/now/v1/batch", json=data)
+            response.raise_for_status()
+            for serviced in response.json().get('serviced_requests', []):
+                statuses[serviced['id']] = 'success' if 200 <= serviced['status_code'] < 300 else 'failed'
+        return [{"status": statuses.get(approval.id, 'failed')} for approval in approvals]
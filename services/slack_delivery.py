@@ -0,0 +1,301 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from services.slack_service import SlackApiError, SlackRateLimitError, read_response
+from utils.http_session import record_request
+from utils.rate_limiter import TokenBucket, AsyncTokenBucket
+from utils.metrics import metrics
+
+# Requests per minute allowed by Slack's Web API rate limit tiers.
+SLACK_TIER_LIMITS = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# Tier of each Web API method the bot calls. chat.postMessage is not tiered: Slack allows about one message
+# per second per channel with bursts, and each user has their own DM channel.
+SLACK_METHOD_TIERS = {
+    'users.list': 2,
+    'users.lookupByEmail': 3,
+    'conversations.open': 3
+}
+DEFAULT_METHOD_LIMITS = {
+    'chat.postMessage': 300
+}
+
+def notify(callbacks, delivered, method, data, logger):
+    """
+    Calls the delivery callbacks of a call, logging their errors instead of letting them affect the delivery.
+    """
+    for on_done in callbacks:
+        try:
+            on_done(delivered)
+        except Exception as e:
+            logger.error(f"Callback for Slack {method} to {data.get('channel')} failed: {e}")
+
+def get_bucket(buckets, rate_limits, method, bucket_class):
+    """
+    Returns the token bucket for a Web API method from buckets, creating a bucket_class sized from its Slack tier.
+    """
+    bucket = buckets.get(method)
+    if bucket is None:
+        per_minute = rate_limits.get(method, SLACK_TIER_LIMITS[SLACK_METHOD_TIERS.get(method, 3)])
+        bucket = buckets[method] = bucket_class(per_minute / 60.0, max(1, per_minute // 10))
+    return bucket
+
+def is_permanent(error):
+    """
+    Returns whether a failed call would fail the same way if retried.
+    """
+    return isinstance(error, SlackApiError) and error.permanent
+
+class SlackDeliveryQueue:
+    """
+    Outbound Slack delivery subsystem. Messages are queued by the caller and sent by a pool of workers,
+    each Web API method is paced by a token bucket matching its Slack rate limit,
+    and 429 responses pause the bucket for the Retry-After period before the message is retried.
+    Messages with the same coalesce key replace each other while queued, so a user never gets several digests in a burst.
+    A replaced message keeps its callback, which reports the outcome of the message that replaced it.
+    """
+    def __init__(self, slack_service, workers=4, rate_limits=None, max_attempts=5):
+        self.slack_service = slack_service
+        self.workers = workers
+        self.rate_limits = dict(DEFAULT_METHOD_LIMITS, **(rate_limits or {}))
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger('Picard')
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.keys = itertools.count()
+        self.threads = []
+        self.stats = {'queued': 0, 'sent': 0, 'coalesced': 0, 'rate_limited': 0, 'failed': 0}
+        metrics.gauge('picard_slack_delivery_pending', lambda: len(self.pending))
+
+    def enqueue(self, method, data, coalesce_key=None, on_done=None):
+        """
+        Queues a Web API call. A queued call with the same coalesce key is replaced instead of sent twice.
+        on_done, if given, is called with True once the call is sent or with False once it is given up on.
+        """
+        key = coalesce_key if coalesce_key is not None else next(self.keys)
+        callbacks = [on_done] if on_done else []
+        with self.lock:
+            self.start()
+            if key in self.pending:
+                self.pending[key] = (method, data, 0, self.pending[key][3] + callbacks)
+                self.stats['coalesced'] += 1
+                return
+            self.pending[key] = (method, data, 0, callbacks)
+            self.stats['queued'] += 1
+        self.queue.put(key)
+
+    def start(self):
+        """
+        Starts the worker threads on first use.
+        """
+        if self.threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, name=f"slack-delivery-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def get_bucket(self, method):
+        """
+        Returns the token bucket for a Web API method, sized from its Slack tier.
+        """
+        with self.lock:
+            return get_bucket(self.buckets, self.rate_limits, method, TokenBucket)
+
+    def worker(self):
+        """
+        Drains the queue, sending each call once a token is available for its method.
+        """
+        while True:
+            key = self.queue.get()
+            try:
+                with self.lock:
+                    method, data, attempts, callbacks = self.pending.pop(key)
+                bucket = self.get_bucket(method)
+                bucket.acquire()
+                try:
+                    self.slack_service.call_api(method, data)
+                except SlackRateLimitError as e:
+                    bucket.pause(e.retry_after)
+                    self.retry(key, method, data, attempts + 1, callbacks, e)
+                except Exception as e:
+                    self.retry(key, method, data, attempts + 1, callbacks, e)
+                else:
+                    with self.lock:
+                        self.stats['sent'] += 1
+                    # Outside the try above: Slack has the message, so a failing callback must not resend it.
+                    notify(callbacks, True, method, data, self.logger)
+            finally:
+                self.queue.task_done()
+
+    def retry(self, key, method, data, attempts, callbacks, error):
+        """
+        Puts a failed call back on the queue unless it has used all its attempts, failed permanently
+        or a newer call replaced it. A replaced call hands its callbacks to the newer one.
+        """
+        with self.lock:
+            if isinstance(error, SlackRateLimitError):
+                self.stats['rate_limited'] += 1
+            gave_up = attempts >= self.max_attempts or is_permanent(error)
+            if gave_up:
+                self.stats['failed'] += 1
+                self.logger.error(f"Giving up on Slack {method} to {data.get('channel')}: {error}")
+            elif key not in self.pending:
+                self.pending[key] = (method, data, attempts, callbacks)
+                self.queue.put(key)
+            else:
+                newer = self.pending[key]
+                self.pending[key] = newer[:3] + (callbacks + newer[3],)
+        if gave_up:
+            notify(callbacks, False, method, data, self.logger)
+
+    def flush(self):
+        """
+        Blocks until every queued message has been sent or given up on, and returns the delivery statistics.
+        """
+        self.queue.join()
+        with self.lock:
+            return dict(self.stats)
+
+class AsyncSlackDelivery:
+    """
+    Outbound Slack delivery on an asyncio event loop, used by the ASGI server in asgi_app.py. It behaves like
+    SlackDeliveryQueue (per-method token buckets, Retry-After pauses, coalescing and retries), but every call is a
+    coroutine on one shared httpx.AsyncClient, so thousands of messages can be in flight without a thread each.
+    Calls to the same channel are sent one after another, so a user's replies arrive in the order they were queued.
+    enqueue may be called from any thread, e.g. the webhook job workers.
+    """
+    def __init__(self, slack_service, loop, rate_limits=None, max_attempts=5, max_in_flight=100, timeout=30):
+        self.slack_service = slack_service
+        self.loop = loop
+        self.rate_limits = dict(DEFAULT_METHOD_LIMITS, **(rate_limits or {}))
+        self.max_attempts = max_attempts
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.logger = logging.getLogger('Picard')
+        self.client = None
+        self.in_flight = None
+        self.pending = {}
+        # Keys of the calls queued for each channel, in order; a channel has one drain task while it has calls.
+        self.channels = {}
+        self.buckets = {}
+        self.keys = itertools.count()
+        self.stats = {'queued': 0, 'sent': 0, 'coalesced': 0, 'rate_limited': 0, 'failed': 0}
+        metrics.gauge('picard_slack_delivery_pending', lambda: len(self.pending))
+
+    def enqueue(self, method, data, coalesce_key=None, on_done=None):
+        """
+        Queues a Web API call. A queued call with the same coalesce key is replaced instead of sent twice.
+        on_done, if given, is called with True once the call is sent or with False once it is given up on.
+        """
+        self.loop.call_soon_threadsafe(self.schedule, method, data, coalesce_key, on_done)
+
+    def schedule(self, method, data, coalesce_key, on_done):
+        """
+        Records a call and queues it behind the earlier calls to its channel. Runs on the event loop.
+        A call replacing a queued one with the same coalesce key keeps that call's place and its callbacks.
+        """
+        key = coalesce_key if coalesce_key is not None else next(self.keys)
+        callbacks = [on_done] if on_done else []
+        if key in self.pending:
+            self.pending[key] = (method, data, self.pending[key][2] + callbacks)
+            self.stats['coalesced'] += 1
+            return
+        self.pending[key] = (method, data, callbacks)
+        self.stats['queued'] += 1
+        channel = data.get('channel')
+        if channel in self.channels:
+            self.channels[channel].append(key)
+        else:
+            self.channels[channel] = deque([key])
+            self.loop.create_task(self.drain(channel))
+
+    async def drain(self, channel):
+        """
+        Sends the calls queued for one channel one at a time, in order, until none are left.
+        """
+        keys = self.channels[channel]
+        while keys:
+            await self.deliver(keys[0])
+            keys.popleft()
+        del self.channels[channel]
+
+    def get_bucket(self, method):
+        """
+        Returns the token bucket for a Web API method, sized from its Slack tier.
+        """
+        return get_bucket(self.buckets, self.rate_limits, method, AsyncTokenBucket)
+
+    async def deliver(self, key):
+        """
+        Sends a queued call once a token is available, retrying on errors. The latest call queued under the key is
+        the one sent, and a retry is dropped, handing its callbacks over, if a newer call with the same key was
+        queued meanwhile.
+        """
+        bucket = self.get_bucket(self.pending[key][0])
+        attempts = 0
+        while True:
+            await bucket.acquire()
+            if attempts == 0:
+                method, data, callbacks = self.pending.pop(key)
+            elif key in self.pending:
+                newer = self.pending[key]
+                self.pending[key] = newer[:2] + (callbacks + newer[2],)
+                return
+            attempts += 1
+            try:
+                await self.call_api(method, data)
+            except SlackRateLimitError as e:
+                self.stats['rate_limited'] += 1
+                bucket.pause(e.retry_after)
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                self.stats['sent'] += 1
+                notify(callbacks, True, method, data, self.logger)
+                return
+            if attempts >= self.max_attempts or is_permanent(error):
+                self.stats['failed'] += 1
+                self.logger.error(f"Giving up on Slack {method} to {data.get('channel')}: {error}")
+                notify(callbacks, False, method, data, self.logger)
+                return
+
+    async def call_api(self, method, data):
+        """
+        Calls a Slack Web API method and returns the JSON response, raising SlackRateLimitError when rate limited
+        and SlackApiError when Slack reports the call failed.
+        """
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(
+                headers={"Authorization": f"Bearer {self.slack_service.config['api_token']}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight))
+            self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        url = f"{self.slack_service.api_url}/{method}"
+        status = 'error'
+        start = time.monotonic()
+        try:
+            async with self.in_flight:
+                response = await self.client.post(url, json=data)
+            status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            record_request('slack', 'POST', url, status, time.monotonic() - start)
+        return read_response(method, response)
+
+    async def close(self):
+        """
+        Closes the HTTP client.
+        """
+        if self.client is not None:
+            await self.client.aclose()
@@ -1,89 +1,230 @@
-import requests
 import json
+import time
 from datetime import datetime
 from threading import Timer
-from services.coupa_service import CoupaService
-from services.brex_service import BrexService
-from services.jira_service import JiraService
-from services.servicenow_service import ServiceNowService
-from services.workday_service import WorkdayService
+from services.approval import approvals_to_dicts, approvals_from_dicts
+from services.digest_renderer import DigestRenderer
+from services.digest_tracker import approval_key
+from services.bulk_actions import BulkActionRunner, parse_item_selection
+from services.conversation import ConversationManager, AWAITING_CONFIRMATION, AWAITING_COMMENT, EXPIRED
+from utils.http_session import default_pool
+from utils.state_store import StateMapping
+
+SLACK_API_URL = "https://slack.com/api"
+MAX_SEND_ATTEMPTS = 3
+SYSTEM_NAMES = {
+    'coupa': 'Coupa',
+    'brex': 'Brex',
+    'jira': 'Jira',
+    'servicenow': 'ServiceNow',
+    'workday': 'Workday'
+}
+
+class SlackRateLimitError(Exception):
+    """
+    Raised when Slack answers a Web API call with HTTP 429.
+    """
+    def __init__(self, method, retry_after):
+        super().__init__(f"Slack rate limited {method}, retry after {retry_after}s")
+        self.method = method
+        self.retry_after = retry_after
+
+# Slack errors that can succeed on retry; any other "ok": false error fails the same way every time.
+TRANSIENT_SLACK_ERRORS = {'internal_error', 'fatal_error', 'service_unavailable', 'request_timeout'}
+
+class SlackApiError(Exception):
+    """
+    Raised when Slack answers a Web API call with "ok": false, which it does with HTTP 200 for most failures
+    (channel_not_found, invalid_blocks, msg_too_long, account_inactive, ...).
+    """
+    def __init__(self, method, error):
+        super().__init__(f"Slack {method} failed: {error}")
+        self.method = method
+        self.error = error
+        self.permanent = error not in TRANSIENT_SLACK_ERRORS
+
+def read_response(method, response):
+    """
+    Returns the JSON body of a Slack Web API response (from requests or httpx). Raises SlackRateLimitError on
+    HTTP 429 or a "ratelimited" error, and SlackApiError when the body is not "ok".
+    """
+    if response.status_code == 429:
+        raise SlackRateLimitError(method, float(response.headers.get('Retry-After', 1)))
+    response.raise_for_status()
+    data = response.json()
+    if not data.get('ok'):
+        if data.get('error') == 'ratelimited':
+            raise SlackRateLimitError(method, float(response.headers.get('Retry-After', 1)))
+        raise SlackApiError(method, data.get('error'))
+    return data
 
 class SlackService:
     """
     Service class for interacting with Slack to send messages to users and receive their responses.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None, state_store=None, api_url=None, services=None):
         self.config = config
-        self.pending_approvals = {}
-        self.user_responses = {}
+        self.services = services
+        self.api_url = api_url or SLACK_API_URL
+        self.session_pool = session_pool or default_pool
+        self._session = None
+        self.delivery = None
+        self.identities = None
+        # Audit log (utils.database.Database) that approve/reject actions are recorded in.
+        self.audit = None
+        # Per-(user, system) approval cache (services.approval_cache.ApprovalCache) that 'list' is served from.
+        self.approval_cache = None
+        # With a state store, approval lists and conversations are shared by the daily run and every webhook worker.
+        if state_store:
+            self.pending_approvals = StateMapping(state_store, 'pending_approvals',
+                                                  encode=approvals_to_dicts, decode=approvals_from_dicts)
+            self.user_responses = StateMapping(state_store, 'conversations')
+        else:
+            self.pending_approvals = {}
+            self.user_responses = {}
+        self.conversations = ConversationManager(self.user_responses)
+        self.renderer = DigestRenderer(SYSTEM_NAMES)
+        self.bulk_actions = BulkActionRunner(services) if services is not None else None
+
+    @property
+    def session(self):
+        """
+        Returns the pooled Slack API session, created with the bot token on first use.
+        """
+        if self._session is None:
+            self._session = self.session_pool.get_session(self.api_url, {
+                "Authorization": f"Bearer {self.config['api_token']}"
+            }, name='slack')
+        return self._session
 
-    def send_approval_list(self, user_id, approvals):
+    def send_approval_list(self, user_id, approvals, on_done=None, unavailable=None):
         """
         Sends the list of pending approvals to a user via Slack.
+        unavailable names the systems that could not be reached, so the user knows the list is incomplete.
         """
-        user_email = self.get_user_email(user_id)
-        message = self.create_approval_message(approvals)
         self.pending_approvals[user_id] = approvals
-        self.send_message(user_email, message)
+        self.send_approval_page(user_id, approvals, 1, on_done, unavailable)
 
-    def get_user_email(self, user_id):
+    def send_approval_page(self, user_id, approvals, page, on_done=None, unavailable=None):
         """
-        Retrieves the user email from Okta or a mapping.
+        Sends one page of a user's approval list. Long lists are split into pages with previous/next buttons.
         """
-        # Implementation for retrieving user email from Okta or a mapping
-        return f"user_{user_id}@example.com"  # Placeholder
+        pages = self.create_approval_message(user_id, approvals, unavailable)
+        message = pages[min(max(page, 1), len(pages)) - 1]
+        # Digests are coalesced per user, so a queued digest is replaced instead of sent twice.
+        self.send_message(user_id, message['text'], coalesce_key=f"digest:{user_id}", on_done=on_done,
+                          blocks=message['blocks'])
 
-    def create_approval_message(self, approvals):
+    def send_approval_delta(self, user_id, approvals, added_keys, removed_keys, on_done=None):
         """
-        Creates the approval message to be sent to the user.
+        Sends only the approvals that are new since the user's last digest, numbered by their place in the full list.
         """
-        message = "You have pending approvals:\n"
-        for idx, approval in enumerate(approvals, 1):
-            message += f"{idx}. {approval['summary']} ({approval['date']}) - {approval['link']}\n"
-        message += "\nCommands:\n"
-        message += "1. 'list', 'approvals', 'list approvals' - Retrieve a list of currently pending approvals\n"
-        message += "2. 'help' - Display a list of commands and expected outcomes\n"
-        message += "3. 'approve N' - Approve the item with the number N\n"
-        message += "4. 'reject N' - Reject the item with the number N\n"
-        return message
+        message = self.renderer.render_delta(approvals, added_keys, len(removed_keys))
+        self.pending_approvals[user_id] = approvals
+        self.send_message(user_id, message['text'], coalesce_key=f"digest:{user_id}", on_done=on_done,
+                          blocks=message['blocks'])
 
-    def send_message(self, user_email, message):
+    def get_user_channel(self, user_id):
         """
-        Sends a message to the user in Slack.
+        Returns the Slack channel to message a user in, from the identity cache when one is attached.
+        IDs the cache does not know are used as the channel as they are.
+        """
+        channel = self.identities.channel(user_id) if self.identities else None
+        return channel or user_id
+
+    def list_users(self):
+        """
+        Yields every member of the Slack workspace, following users.list cursor pagination.
+        """
+        params = {'limit': self.config.get('users_page_size', 200)}
+        while True:
+            response = self.session.get(f"{self.api_url}/users.list", params=params)
+            try:
+                data = read_response('users.list', response)
+            except SlackRateLimitError as e:
+                time.sleep(e.retry_after)
+                continue
+            yield from data.get('members', [])
+            cursor = data.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return
+            params['cursor'] = cursor
+
+    def create_approval_message(self, user_id, approvals, unavailable=None):
+        """
+        Creates the pages of the approval message to be sent to the user, as Block Kit payloads.
+        Pages are cached by the renderer until the user's approvals change.
+        """
+        return self.renderer.render(user_id, approvals, unavailable)
+
+    def send_message(self, user_id, message, coalesce_key=None, on_done=None, blocks=None):
+        """
+        Sends a message to the user in Slack. With blocks, message is the notification fallback text.
+        When a delivery queue is attached, the message is queued and sent at the rate Slack allows;
+        otherwise it is posted immediately, waiting out any Retry-After from Slack.
+        on_done, if given, is called with True once the message is delivered.
         """
-        url = "https://slack.com/api/chat.postMessage"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}",
-            "Content-Type": "application/json"
-        }
         data = {
-            "channel": user_email,
+            "channel": self.get_user_channel(user_id),
             "text": message
         }
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
+        if blocks:
+            data["blocks"] = blocks
+        if self.delivery:
+            self.delivery.enqueue('chat.postMessage', data, coalesce_key, on_done)
+            return
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            try:
+                response = self.call_api('chat.postMessage', data)
+                if on_done:
+                    on_done(True)
+                return response
+            except SlackRateLimitError as e:
+                last_error = e
+                time.sleep(e.retry_after)
+        raise last_error
+
+    def call_api(self, method, data):
+        """
+        Calls a Slack Web API method and returns the JSON response.
+        Raises SlackRateLimitError when rate limited, so callers can honour the Retry-After header,
+        and SlackApiError when Slack reports the call failed.
+        """
+        response = self.session.post(f"{self.api_url}/{method}", json=data)
+        return read_response(method, response)
 
     def handle_user_commands(self, user_id, command):
         """
         Handles the user's commands and processes approvals or rejections accordingly.
         """
+        conversation = self.conversations.get(user_id)
+        if conversation:
+            if conversation['state'] != EXPIRED:
+                self.advance_conversation(user_id, conversation, command)
+                return
+            self.send_action_expired_message(user_id)
+
         command_parts = command.strip().lower().split()
         approvals = self.pending_approvals.get(user_id, [])
 
         if command in ['list', 'approvals', 'list approvals']:
-            self.send_approval_list(user_id, approvals)
+            if self.approval_cache:
+                approvals, unavailable = self.approval_cache.get(user_id)
+                self.send_approval_list(user_id, approvals, unavailable=unavailable)
+            else:
+                self.send_approval_list(user_id, approvals)
         elif command == 'help' or not command_parts[0] in ['approve', 'reject']:
             self.send_help_message(user_id)
         elif command_parts[0] in ['approve', 'reject']:
-            if len(command_parts) == 2 and command_parts[1].isdigit():
-                item_number = int(command_parts[1])
-                if 1 <= item_number <= len(approvals):
-                    approval = approvals[item_number - 1]
-                    self.confirm_action(user_id, command_parts[0], approval)
-                else:
-                    self.send_invalid_item_message(user_id)
-            else:
+            numbers = parse_item_selection(' '.join(command_parts[1:]), approvals)
+            if numbers is None:
                 self.send_invalid_command_message(user_id)
+            elif not numbers or not all(1 <= number <= len(approvals) for number in numbers):
+                self.send_invalid_item_message(user_id)
+            elif len(numbers) == 1:
+                self.confirm_action(user_id, command_parts[0], approvals[numbers[0] - 1])
+            else:
+                self.confirm_bulk_action(user_id, command_parts[0], [approvals[number - 1] for number in numbers])
 
     def send_help_message(self, user_id):
         """
@@ -93,7 +234,9 @@ class SlackService:
                    "1. 'list', 'approvals', 'list approvals' - Retrieve a list of currently pending approvals\n"
                    "2. 'help' - Display a list of commands and expected outcomes\n"
                    "3. 'approve N' - Approve the item with the number N\n"
-                   "4. 'reject N' - Reject the item with the number N\n")
+                   "4. 'reject N' - Reject the item with the number N\n"
+                   "5. 'approve 1-10', 'reject 3,5,7', 'approve all', 'approve all jira' - Approve or reject several items "
+                   "at once, with one confirmation and one comment\n")
         self.send_message(user_id, message)
 
     def send_invalid_command_message(self, user_id):
@@ -115,66 +258,146 @@ class SlackService:
         Confirms the user's action (approval or rejection) for the specified item.
         """
         action_text = "approve" if action == "approve" else "reject"
-        message = (f"Please confirm that you wish to {action_text} '{approval['summary']} ({approval['date']}) - {approval['link']}' "
+        message = (f"Please confirm that you wish to {action_text} '{approval.summary} ({approval.date}) - {approval.link}' "
                    f"by typing 'Y' or 'Yes'.")
-        self.user_responses[user_id] = {
-            'action': action,
-            'approval': approval
-        }
+        self.conversations.start(user_id, action, approval, AWAITING_CONFIRMATION)
         self.send_message(user_id, message)
 
+    def confirm_bulk_action(self, user_id, action, approvals):
+        """
+        Asks the user to confirm one action on several items at once.
+        """
+        lines = [f"Please confirm that you wish to {action} these {len(approvals)} items by typing 'Y' or 'Yes':"]
+        lines.extend(f"- {approval.summary} ({approval.date})" for approval in approvals[:10])
+        if len(approvals) > 10:
+            lines.append(f"...and {len(approvals) - 10} more.")
+        self.conversations.start(user_id, action, None, AWAITING_CONFIRMATION, approvals=approvals)
+        self.send_message(user_id, '\n'.join(lines))
+
+    def advance_conversation(self, user_id, conversation, text):
+        """
+        Advances the user's pending action with their reply: a confirmation moves on to the comment step,
+        and a comment completes the action in the downstream system.
+        """
+        if conversation['state'] == AWAITING_CONFIRMATION:
+            if text.strip().lower() in ['y', 'yes']:
+                self.conversations.advance(user_id, conversation, AWAITING_COMMENT)
+                self.request_user_comment(user_id, conversation['action'], conversation.get('approval'))
+            else:
+                self.conversations.finish(user_id)
+                self.send_action_cancelled_message(user_id)
+        elif conversation['state'] == AWAITING_COMMENT:
+            self.conversations.finish(user_id)
+            if conversation.get('approvals'):
+                self.process_bulk_action(user_id, conversation['action'], conversation['approvals'], text)
+            elif conversation['action'] == 'approve':
+                self.process_approval(user_id, conversation['approval'], text)
+            else:
+                self.process_rejection(user_id, conversation['approval'], text)
+
     def handle_interactive_message(self, user_id, action_id, value):
         """
         Handles interactive messages from Slack.
+        Approve/reject buttons carry the item's stable key, which is looked up in the user's current list.
         """
         if action_id in ['approve', 'reject']:
-            approvals = self.pending_approvals.get(user_id, [])
-            item_number = int(value)
-            approval = approvals[item_number - 1]
-            if action_id == 'approve':
-                self.process_approval(user_id, approval)
-            else:
-                self.process_rejection(user_id, approval)
+            approval = self.find_pending_approval(user_id, value)
+            if approval is None:
+                self.send_item_not_pending_message(user_id)
+                return
+            # The button click is the confirmation, so the conversation starts at the comment step.
+            self.conversations.start(user_id, action_id, approval, AWAITING_COMMENT)
+            self.request_user_comment(user_id, action_id, approval)
+        elif action_id in ['page_previous', 'page_next']:
+            self.send_approval_page(user_id, self.pending_approvals.get(user_id, []), int(value))
 
-    def process_approval(self, user_id, approval):
+    def find_pending_approval(self, user_id, key):
+        """
+        Returns the approval with the given stable key from the user's current list, or None if it is not there.
+        """
+        for approval in self.pending_approvals.get(user_id, []):
+            if approval_key(approval) == key:
+                return approval
+        return None
+
+    def process_approval(self, user_id, approval, comment):
         """
         Processes the user's approval and sends it to the downstream system.
         """
-        comment = self.get_user_comment(user_id)
-        system_service = self.get_system_service(approval['system'])
+        system_service = self.get_system_service(approval.system)
         response = system_service.send_approval(user_id, approval, comment)
+        self.record_action(user_id, 'approve', approval, response['status'] == 'success', comment)
         if response['status'] == 'success':
-            self.send_action_confirmation(user_id, 'approved', approval, comment)
+            self.send_action_confirmation(user_id, 'approve', approval, comment)
         else:
             self.send_action_failure(user_id, 'approve', approval)
 
-    def process_rejection(self, user_id, approval):
+    def process_rejection(self, user_id, approval, comment):
         """
         Processes the user's rejection and sends it to the downstream system.
         """
-        comment = self.get_user_comment(user_id)
-        system_service = self.get_system_service(approval['system'])
+        system_service = self.get_system_service(approval.system)
         response = system_service.send_rejection(user_id, approval, comment)
+        self.record_action(user_id, 'reject', approval, response['status'] == 'success', comment)
         if response['status'] == 'success':
-            self.send_action_confirmation(user_id, 'rejected', approval, comment)
+            self.send_action_confirmation(user_id, 'reject', approval, comment)
         else:
             self.send_action_failure(user_id, 'reject', approval)
 
-    def get_user_comment(self, user_id):
+    def process_bulk_action(self, user_id, action, approvals, comment):
+        """
+        Sends one action on several approvals to their downstream systems concurrently, batched where the system
+        supports it, and reports the outcome in a single message.
+        """
+        results = self.bulk_actions.run(user_id, action, approvals, comment)
+        for approval, succeeded in results:
+            self.record_action(user_id, action, approval, succeeded, comment)
+        self.send_bulk_action_result(user_id, action, results, comment)
+
+    def record_action(self, user_id, action, approval, succeeded, comment):
+        """
+        Records an approve/reject action and its outcome in the audit log, if one is configured.
+        Once the downstream system has the action, the item is dropped from the user's cached approvals.
+        """
+        if succeeded and self.approval_cache:
+            self.approval_cache.invalidate(user_id, approval.system, approval.id)
+        if self.audit:
+            self.audit.log_action(user_id, approval.system, approval.id, action,
+                                  'success' if succeeded else 'failed', comment)
+
+    def send_bulk_action_result(self, user_id, action, results, comment):
+        """
+        Sends one message summarizing a bulk action: how many items succeeded, and which ones failed.
+        """
+        action_text = "approved" if action == "approve" else "rejected"
+        failed = [approval for approval, succeeded in results if not succeeded]
+        lines = [f"Successfully {action_text} {len(results) - len(failed)} of {len(results)} items\n"
+                 f"User: {user_id}\n"
+                 f"Date/Time: {datetime.now()}\n"
+                 f"Comment: {comment}"]
+        if failed:
+            lines.append(f"Failed to {action} {len(failed)} items:")
+            lines.extend(f"- {approval.summary} ({approval.date}) - {approval.link}" for approval in failed)
+        self.send_message(user_id, '\n'.join(lines))
+
+    def request_user_comment(self, user_id, action=None, approval=None):
         """
-        Retrieves the user's comment from Slack.
+        Asks the user for a comment, naming the item the action applies to when there is a single one.
+        The reply is handled by advance_conversation when it arrives.
         """
-        self.send_message(user_id, "Please provide a comment for your action:")
-        while user_id not in self.user_responses or 'comment' not in self.user_responses[user_id]:
-            pass  # Wait for user response
-        return self.user_responses[user_id]['comment']
+        if approval is None:
+            self.send_message(user_id, "Please provide a comment for your action:")
+            return
+        action_text = "approve" if action == "approve" else "reject"
+        message = (f"Please provide a comment to {action_text} '{approval.summary} ({approval.date}) - {approval.link}':")
+        self.send_message(user_id, message)
 
     def send_action_confirmation(self, user_id, action, approval, comment):
         """
         Sends a confirmation message to the user after successfully processing the action.
         """
         action_text = "approved" if action == "approve" else "rejected"
-        message = (f"Successfully {action_text} '{approval['summary']} ({approval['date']}) - {approval['link']}'\n"
+        message = (f"Successfully {action_text} '{approval.summary} ({approval.date}) - {approval.link}'\n"
                    f"User: {user_id}\n"
                    f"Date/Time: {datetime.now()}\n"
                    f"Comment: {comment}")
@@ -185,7 +408,14 @@ class SlackService:
         Sends a failure message to the user if the action could not be processed.
         """
         action_text = "approve" if action == "approve" else "reject"
-        message = f"Failed to {action_text} '{approval['summary']} ({approval['date']}) - {approval['link']}'"
+        message = f"Failed to {action_text} '{approval.summary} ({approval.date}) - {approval.link}'"
+        self.send_message(user_id, message)
+
+    def send_item_not_pending_message(self, user_id):
+        """
+        Sends a message to the user indicating the item they clicked is no longer pending.
+        """
+        message = "This item is no longer pending. Type 'list' to see the list of pending approvals."
         self.send_message(user_id, message)
 
     def send_action_cancelled_message(self, user_id):
@@ -195,15 +425,15 @@ class SlackService:
         message = "Action cancelled."
         self.send_message(user_id, message)
 
+    def send_action_expired_message(self, user_id):
+        """
+        Sends a message to the user indicating their pending action expired before it was completed.
+        """
+        message = "Your pending action expired. Type 'list' to see the list of pending approvals and start again."
+        self.send_message(user_id, message)
+
     def get_system_service(self, system_name):
         """
-        Returns the service object for the specified system.
+        Returns the shared client for the specified system from the service registry.
         """
-        services = {
-            'coupa': CoupaService(self.config.coupa),
-            'brex': BrexService(self.config.brex),
-            'jira': JiraService(self.config.jira),
-            'servicenow': ServiceNowService(self.config.servicenow),
-            'workday': WorkdayService(self.config.workday)
-        }
-        return services[system_name]
+        return self.services[system_name]
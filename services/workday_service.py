@@ -1,38 +1,55 @@
-import requests
+from services.approval import Approval
+from utils.http_session import default_pool
 
 class WorkdayService:
     """
     Service class for interacting with Workday to retrieve open, pending approvals,
     and to send approvals back to Workday.
     """
-    def __init__(self, config):
+    def __init__(self, config, session_pool=None):
         self.config = config
+        self.session = (session_pool or default_pool).get_session(config['base_url'], {
+            "Authorization": f"Bearer {config['api_token']}"
+        }, name='workday')
 
     def get_pending_approvals(self, user_id):
         """
         Fetches pending approvals for a specific user from Workday.
         """
         url = f"{self.config['base_url']}/api/pending_approvals"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}"
-        }
-        response = requests.get(url, headers=headers, params={"user_id": user_id})
+        response = self.session.get(url, params={"user_id": user_id})
         response.raise_for_status()
-        return response.json()
+        return [self.normalize(record) for record in response.json()]
+
+    def normalize(self, record):
+        """
+        Converts a Workday inbox task into an Approval.
+        """
+        return Approval('workday', record['id'], record.get('descriptor'), (record.get('assigned') or '')[:10],
+                        record.get('href') or f"{self.config['base_url']}/tasks/{record['id']}")
 
     def send_approval(self, user_id, approval, comments):
         """
         Sends an approval back to Workday.
         """
         url = f"{self.config['base_url']}/api/approve"
-        headers = {
-            "Authorization": f"Bearer {self.config['api_token']}",
-            "Content-Type": "application/json"
+        data = {
+            "user_id": user_id,
+            "approval_id": approval.id,
+            "comments": comments
         }
+        response = self.session.post(url, json=data)
+        return response.json()
+
+    def send_rejection(self, user_id, approval, comments):
+        """
+        Sends a rejection back to Workday.
+        """
+        url = f"{self.config['base_url']}/api/reject"
         data = {
             "user_id": user_id,
-            "approval_id": approval['id'],
+            "approval_id": approval.id,
             "comments": comments
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = self.session.post(url, json=data)
         return response.json()
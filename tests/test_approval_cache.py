@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from services.approval import Approval
+from services.approval_cache import ApprovalCache, CACHE_NAMESPACE
+from utils.state_store import SQLiteStateStore
+
+class FakeService:
+    """
+    Returns a fixed list of approvals, optionally waiting on a gate or failing, and records each fetch.
+    """
+    def __init__(self, system, ids):
+        self.approvals = [Approval(system, approval_id, f"Item {approval_id}", '2024-01-01', '') for approval_id in ids]
+        self.calls = []
+        self.gate = None
+        self.error = None
+
+    def get_pending_approvals(self, user_id):
+        self.calls.append(user_id)
+        if self.gate:
+            self.gate.wait(5)
+        if self.error:
+            raise self.error
+        return list(self.approvals)
+
+class ApprovalCacheTest(unittest.TestCase):
+    """
+    Tests TTL expiry, stale-while-revalidate and invalidation of the approval cache.
+    """
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('services.approval_cache.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.jira = FakeService('jira', ['J1', 'J2'])
+        self.coupa = FakeService('coupa', ['C1'])
+        self.cache = ApprovalCache(SQLiteStateStore(':memory:'), {'jira': self.jira, 'coupa': self.coupa},
+                                   ['jira', 'coupa'], ttls={'coupa': 60}, default_ttl=300, max_stale=3600)
+        self.addCleanup(self.cache.executor.shutdown)
+
+    def ids(self, approvals):
+        return [approval.id for approval in approvals]
+
+    def wait_for_refreshes(self):
+        deadline = time.monotonic() + 5
+        while self.cache.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_miss_is_fetched_then_served_from_cache(self):
+        approvals, unavailable = self.cache.get('U1')
+        self.assertEqual(self.ids(approvals), ['J1', 'J2', 'C1'])
+        self.assertEqual(unavailable, [])
+        self.now += 59
+        self.assertEqual(self.ids(self.cache.get('U1')[0]), ['J1', 'J2', 'C1'])
+        self.assertEqual((len(self.jira.calls), len(self.coupa.calls)), (1, 1))
+
+    def test_expired_entry_is_served_while_refreshing(self):
+        self.cache.get('U1')
+        self.now += 61
+        self.coupa.approvals.append(Approval('coupa', 'C2', 'Item C2', '2024-01-02', ''))
+        self.coupa.gate = threading.Event()
+        approvals, unavailable = self.cache.get('U1')
+        # Only coupa is past its TTL; the stale list is returned without waiting for the refresh.
+        self.assertEqual(self.ids(approvals), ['J1', 'J2', 'C1'])
+        self.assertEqual(self.cache.get('U1')[0], approvals)
+        self.coupa.gate.set()
+        self.wait_for_refreshes()
+        self.assertEqual(self.ids(self.cache.get('U1')[0]), ['J1', 'J2', 'C1', 'C2'])
+        self.assertEqual((len(self.jira.calls), len(self.coupa.calls)), (1, 2))
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        self.cache.get('U1')
+        self.now += 301
+        self.jira.error = RuntimeError('jira is down')
+        self.assertEqual(self.ids(self.cache.get('U1')[0]), ['J1', 'J2', 'C1'])
+        self.wait_for_refreshes()
+        self.assertEqual(self.ids(self.cache.get('U1')[0]), ['J1', 'J2', 'C1'])
+
+    def test_entry_past_max_stale_is_fetched_now(self):
+        self.cache.get('U1')
+        self.now += 3601
+        self.jira.approvals.pop()
+        approvals, unavailable = self.cache.get('U1')
+        self.assertEqual(self.ids(approvals), ['J1', 'C1'])
+        self.assertEqual(len(self.jira.calls), 2)
+
+    def test_unreachable_system_is_reported(self):
+        self.jira.error = RuntimeError('jira is down')
+        approvals, unavailable = self.cache.get('U1')
+        self.assertEqual(self.ids(approvals), ['C1'])
+        self.assertEqual(unavailable, ['jira'])
+
+    def test_invalidate_drops_the_item_and_revalidates(self):
+        self.cache.get('U1')
+        self.jira.approvals.pop(0)
+        self.jira.gate = threading.Event()
+        self.cache.invalidate('U1', 'jira', 'J1')
+        self.assertEqual(self.ids(self.cache.get('U1')[0]), ['J2', 'C1'])
+        self.jira.gate.set()
+        self.wait_for_refreshes()
+        self.assertEqual(len(self.jira.calls), 2)
+        entry = self.cache.store.get(CACHE_NAMESPACE, ApprovalCache.key('U1', 'jira'))
+        self.assertNotIn('stale', entry)
+
+    def test_webhook_refreshes_cached_users_only(self):
+        self.cache.get('U1')
+        self.jira.approvals.append(Approval('jira', 'J3', 'Item J3', '2024-01-03', ''))
+        self.cache.item_changed('jira', 'J3', ['U1', 'U2', None, 'U1'])
+        self.assertEqual(self.jira.calls, ['U1', 'U1'])
+        self.assertIsNone(self.cache.store.get(CACHE_NAMESPACE, ApprovalCache.key('U2', 'jira')))
+        self.assertEqual(self.ids(self.cache.get('U1')[0]), ['J1', 'J2', 'J3', 'C1'])
+        self.assertEqual(len(self.jira.calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
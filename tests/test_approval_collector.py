@@ -0,0 +1,60 @@
+import time
+import unittest
+import requests
+from requests.adapters import BaseAdapter
+from services.approval_collector import ApprovalCollector
+from utils.adaptive_limiter import AdaptiveLimiter
+from utils.http_session import PooledSession
+
+class DelayedAdapter(BaseAdapter):
+    """
+    Transport adapter that answers every request with an empty JSON list after a delay.
+    """
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def send(self, request, **kwargs):
+        time.sleep(self.delay)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'[]'
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+class FakeService:
+    """
+    Service whose get_pending_approvals makes one request through its own pooled session.
+    """
+    def __init__(self, name, delay, limit):
+        self.session = PooledSession(name=name, limiter=AdaptiveLimiter(name, initial_limit=limit, min_limit=limit,
+                                                                        max_limit=limit))
+        self.session.mount('http://', DelayedAdapter(delay))
+
+    def get_pending_approvals(self, user_id):
+        return self.session.get(f"http://fake/{user_id}").json()
+
+class ApprovalCollectorTest(unittest.TestCase):
+    """
+    Tests that a throttled system cannot starve the others of the global cap.
+    """
+    def test_throttled_system_does_not_hold_global_slots(self):
+        services = {'slow': FakeService('slow', 0.3, 1), 'fast': FakeService('fast', 0, 4)}
+        collector = ApprovalCollector(services, max_concurrency=4)
+        try:
+            slow = [collector.executors['slow'].submit(collector.fetch, 'slow', f"u{i}") for i in range(4)]
+            time.sleep(0.05)
+            started = time.monotonic()
+            results, failures = collector.collect('u0', systems=['fast'])
+            self.assertEqual((results, failures), ({'fast': []}, {}))
+            self.assertLess(time.monotonic() - started, 0.2)
+            for future in slow:
+                self.assertEqual(future.result(), [])
+        finally:
+            collector.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from services.approval import Approval
+from services.bulk_actions import parse_item_selection
+
+class ParseItemSelectionTest(unittest.TestCase):
+    """
+    Tests for the item selectors accepted by 'approve' and 'reject'.
+    """
+    def setUp(self):
+        self.approvals = [
+            Approval('jira', 'J-1', 'Access request', '2024-01-01', 'https://jira/J-1'),
+            Approval('coupa', '17', 'Laptop order', '2024-01-02', 'https://coupa/17'),
+            Approval('jira', 'J-2', 'Budget change', '2024-01-03', 'https://jira/J-2'),
+            Approval('brex', '9', 'Team dinner', '2024-01-04', 'https://brex/9')
+        ]
+
+    def test_single_number(self):
+        self.assertEqual(parse_item_selection('2', self.approvals), [2])
+
+    def test_range(self):
+        self.assertEqual(parse_item_selection('1-3', self.approvals), [1, 2, 3])
+
+    def test_list_keeps_order_and_drops_duplicates(self):
+        self.assertEqual(parse_item_selection('3, 1,3', self.approvals), [3, 1])
+
+    def test_list_of_ranges(self):
+        self.assertEqual(parse_item_selection('1-2,2-4', self.approvals), [1, 2, 3, 4])
+
+    def test_reversed_range(self):
+        self.assertEqual(parse_item_selection('3-1', self.approvals), [1, 2, 3])
+
+    def test_all(self):
+        self.assertEqual(parse_item_selection('all', self.approvals), [1, 2, 3, 4])
+
+    def test_all_system(self):
+        self.assertEqual(parse_item_selection('all jira', self.approvals), [1, 3])
+        self.assertEqual(parse_item_selection('All Coupa', self.approvals), [2])
+
+    def test_all_unknown_system(self):
+        self.assertEqual(parse_item_selection('all workday', self.approvals), [])
+
+    def test_number_out_of_range(self):
+        self.assertEqual(parse_item_selection('5', self.approvals), [5])
+        self.assertEqual(parse_item_selection('0', self.approvals), [0])
+
+    def test_range_out_of_range_is_not_expanded(self):
+        self.assertEqual(parse_item_selection('1-300000000', self.approvals), [1, 300000000])
+        self.assertEqual(parse_item_selection('2,0-3', self.approvals), [2, 0, 3])
+
+    def test_invalid_selectors(self):
+        for selector in ['', 'one', '1-', '-1', '1--2', '1;2', 'all jira coupa', '1 2']:
+            self.assertIsNone(parse_item_selection(selector, self.approvals), selector)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from utils.database import Database
+
+class RecordingConnection:
+    """
+    Wraps the audit writer's connection, recording the size of each batch. The first batch waits for release,
+    so that the rows queued meanwhile are all waiting when the writer comes back for more.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def executemany(self, sql, rows):
+        self.batches.append(len(rows))
+        self.entered.set()
+        self.release.wait(5)
+        return self.conn.executemany(sql, rows)
+
+    def __enter__(self):
+        self.conn.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self.conn.__exit__(*args)
+
+    def close(self):
+        self.conn.close()
+
+class DatabaseTest(unittest.TestCase):
+    """
+    Base class creating a progress database in a temporary directory.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'progress.db')
+        self.databases = []
+
+    def tearDown(self):
+        for db in self.databases:
+            db.audit_writer.close()
+            db.conn.close()
+        shutil.rmtree(self.directory)
+
+    def database(self, name='progress.db', **kwargs):
+        db = Database(os.path.join(self.directory, name), **kwargs)
+        self.databases.append(db)
+        return db
+
+    def committed_count(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM progress').fetchone()[0]
+        finally:
+            conn.close()
+
+    def log(self, db, count, start=0):
+        for i in range(start, start + count):
+            db.log_action(f"U{i % 3}", 'jira', f"J-{i}", 'approve', 'success', timestamp=f"2024-01-01 00:00:{i:02d}")
+
+class AuditWriterTest(DatabaseTest):
+    """
+    Tests batching, interval commits and draining of the background audit writer.
+    """
+    def test_batches_are_limited_to_batch_size(self):
+        real_connect = sqlite3.connect
+        writer_connections = []
+
+        def connect(*args, **kwargs):
+            conn = real_connect(*args, **kwargs)
+            if threading.current_thread().name != 'picard-audit-writer':
+                return conn
+            writer_connections.append(RecordingConnection(conn))
+            return writer_connections[-1]
+
+        with mock.patch('utils.database.sqlite3.connect', connect):
+            db = self.database(batch_size=3, flush_interval=0.05)
+            self.log(db, 1)
+            while not writer_connections:
+                time.sleep(0.01)
+            writer_connections[0].entered.wait(5)
+            self.log(db, 6, start=1)
+            writer_connections[0].release.set()
+            db.flush_audit()
+        self.assertEqual(writer_connections[0].batches, [1, 3, 3])
+        self.assertEqual(self.committed_count(), 7)
+
+    def test_rows_are_committed_without_flush(self):
+        db = self.database(batch_size=500, flush_interval=0.05)
+        self.log(db, 2)
+        deadline = time.monotonic() + 5
+        while self.committed_count() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.committed_count(), 2)
+
+    def test_close_writes_every_queued_row(self):
+        db = self.database(batch_size=7, flush_interval=5)
+        self.log(db, 50)
+        db.audit_writer.close()
+        self.assertFalse(db.audit_writer.thread.is_alive())
+        self.assertEqual(self.committed_count(), 50)
+
+class IterActionsTest(DatabaseTest):
+    """
+    Tests the paged reads of iter_actions.
+    """
+    def test_pages(self):
+        for count in [0, 2, 3, 4, 6, 7]:
+            with self.subTest(count=count):
+                db = self.database(f"pages-{count}.db")
+                self.log(db, count)
+                rows = list(db.iter_actions(page_size=3))
+                self.assertEqual([row[4] for row in rows], [f"J-{i}" for i in range(count)])
+
+    def test_time_range_across_pages(self):
+        db = self.database()
+        self.log(db, 10)
+        rows = list(db.iter_actions(since='2024-01-01 00:00:02', until='2024-01-01 00:00:08', page_size=2))
+        self.assertEqual([row[4] for row in rows], [f"J-{i}" for i in range(2, 8)])
+
+    def test_export(self):
+        db = self.database()
+        self.log(db, 5)
+        path = os.path.join(self.directory, 'audit.csv')
+        self.assertEqual(db.export_actions(path), 5)
+        with open(path) as f:
+            self.assertEqual(len(f.read().splitlines()), 6)
+
+if __name__ == '__main__':
+    unittest.main()
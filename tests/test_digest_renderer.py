@@ -0,0 +1,33 @@
+import unittest
+from services.approval import Approval
+from services.digest_renderer import DigestRenderer
+
+class ItemBlocksTest(unittest.TestCase):
+    """
+    Tests that vendor-supplied text is escaped in the mrkdwn of digest items.
+    """
+    def item_text(self, approval):
+        return DigestRenderer({'jira': 'Jira'}).item_blocks(1, approval)[0]['text']['text']
+
+    def test_linked_summary(self):
+        approval = Approval('jira', 'J-1', 'Access request', '2024-01-01', 'https://jira/J-1')
+        self.assertEqual(self.item_text(approval), "*1.* <https://jira/J-1|Access request>\nJira · 2024-01-01")
+
+    def test_summary_is_escaped(self):
+        approval = Approval('jira', 'J-1', 'Budget > $10k & <https://evil|click> | R&D', '2024-01-01',
+                            'https://jira/J-1')
+        self.assertEqual(self.item_text(approval),
+                         "*1.* <https://jira/J-1|Budget &gt; $10k &amp; &lt;https://evilclick&gt;  R&amp;D>\n"
+                         "Jira · 2024-01-01")
+
+    def test_link_is_escaped(self):
+        approval = Approval('jira', 'J-1', 'Access request', '2024-01-01', 'https://jira/browse?a=1&b=x|y>z')
+        self.assertEqual(self.item_text(approval),
+                         "*1.* <https://jira/browse?a=1&amp;b=x%7Cy&gt;z|Access request>\nJira · 2024-01-01")
+
+    def test_no_link(self):
+        approval = Approval('jira', 'J-1', 'Budget > $10k | Q3', '2024-01-01', '')
+        self.assertEqual(self.item_text(approval), "*1.* Budget &gt; $10k | Q3\nJira · 2024-01-01")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from services.approval import Approval
+from services.digest_tracker import keep_numbering
+
+class KeepNumberingTest(unittest.TestCase):
+    """
+    Tests that delta and skipped digests never renumber the list the user last saw.
+    """
+    def setUp(self):
+        self.a = Approval('jira', 'J-1', 'Access request', '2024-01-01', 'https://jira/J-1')
+        self.b = Approval('coupa', '17', 'Laptop order', '2024-01-02', 'https://coupa/17')
+        self.c = Approval('jira', 'J-2', 'Budget change', '2024-01-03', 'https://jira/J-2')
+        self.d = Approval('brex', '9', 'Team dinner', '2024-01-04', 'https://brex/9')
+
+    def test_unchanged(self):
+        self.assertEqual(keep_numbering([self.a, self.b], [self.a, self.b]), [self.a, self.b])
+
+    def test_new_items_go_last(self):
+        self.assertEqual(keep_numbering([self.a, self.d, self.b], [self.a, self.b]), [self.a, self.b, self.d])
+
+    def test_reordered_list_keeps_old_order(self):
+        self.assertEqual(keep_numbering([self.c, self.a, self.b], [self.a, self.b, self.c]), [self.a, self.b, self.c])
+
+    def test_removed_item(self):
+        self.assertIsNone(keep_numbering([self.a, self.c], [self.a, self.b, self.c]))
+
+    def test_current_versions_are_kept(self):
+        renamed = Approval('jira', 'J-1', 'Access request (updated)', '2024-01-01', 'https://jira/J-1')
+        self.assertEqual(keep_numbering([self.b, renamed], [self.a, self.b])[0].summary, 'Access request (updated)')
+
+    def test_nothing_numbered_yet(self):
+        self.assertEqual(keep_numbering([self.b, self.a], []), [self.b, self.a])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from services.identity_resolver import IdentityResolver
+from utils.state_store import SQLiteStateStore
+
+class FakeSlack:
+    """
+    Stands in for SlackService.list_users.
+    """
+    def __init__(self, members):
+        self.members = members
+
+    def list_users(self):
+        return iter(self.members)
+
+def okta_user(user_id, email):
+    return {'id': user_id, 'profile': {'email': email, 'timeZone': 'Europe/Paris'}}
+
+class IdentityJoinTest(unittest.TestCase):
+    """
+    Tests the streaming Okta-to-Slack join.
+    """
+    def setUp(self):
+        members = [{'id': 'S1', 'profile': {'email': 'Ann@example.com'}},
+                   {'id': 'S2', 'profile': {'email': 'bob@example.com'}, 'deleted': True},
+                   {'id': 'B1', 'profile': {'email': 'bot@example.com'}, 'is_bot': True}]
+        self.identities = IdentityResolver(SQLiteStateStore(':memory:'), FakeSlack(members))
+
+    def test_refresh(self):
+        users = [okta_user('O1', 'ann@example.com'), okta_user('O2', 'bob@example.com')]
+        self.assertEqual(self.identities.refresh(users), 1)
+        self.assertFalse(self.identities.is_stale())
+        self.assertEqual(self.identities.channel('O1'), 'S1')
+        self.assertEqual(self.identities.okta_user_id('S1'), 'O1')
+        self.assertIsNone(self.identities.get('O2'))
+
+    def test_identities_usable_before_the_join_finishes(self):
+        def users():
+            yield okta_user('O1', 'ann@example.com')
+            self.assertEqual(self.identities.channel('O1'), 'S1')
+            self.assertTrue(self.identities.is_stale())
+            yield okta_user('O3', 'carol@example.com')
+
+        joined = list(self.identities.join(users(), self.identities.list_slack_users()))
+        self.assertEqual([user_id for user_id, _ in joined], ['O1', 'O3'])
+        self.assertIsNone(joined[1][1])
+        self.assertFalse(self.identities.is_stale())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from utils.job_queue import JobQueue
+from utils.state_store import SQLiteStateStore, CachedStateStore
+
+class JobQueueDedupeTest(unittest.TestCase):
+    """
+    Tests that jobs with a dedupe key run once, within one process and across processes sharing a state store.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'state.db')
+        self.runs = []
+        self.done = threading.Event()
+
+    def job(self, name):
+        self.runs.append(name)
+        self.done.set()
+
+    def store(self):
+        # Each worker process has its own connection to the shared database.
+        store = SQLiteStateStore(self.path)
+        self.addCleanup(store.conn.close)
+        return CachedStateStore(store)
+
+    def test_duplicate_in_one_process(self):
+        jobs = JobQueue(workers=2)
+        self.assertTrue(jobs.submit(self.job, 'first', dedupe_key='Ev1'))
+        self.assertFalse(jobs.submit(self.job, 'retry', dedupe_key='Ev1'))
+        self.done.wait(5)
+        self.assertEqual(self.runs, ['first'])
+        self.assertEqual(jobs.stats()['duplicates'], 1)
+
+    def test_duplicate_across_processes(self):
+        first, second = JobQueue(workers=2, store=self.store()), JobQueue(workers=2, store=self.store())
+        self.assertTrue(first.submit(self.job, 'first', dedupe_key='Ev1'))
+        self.assertFalse(second.submit(self.job, 'retry', dedupe_key='Ev1'))
+        self.assertTrue(second.submit(self.job, 'other', dedupe_key='Ev2'))
+        self.assertEqual(second.stats()['duplicates'], 1)
+
+    def test_jobs_without_dedupe_key_always_run(self):
+        jobs = JobQueue(workers=1, store=self.store())
+        self.assertTrue(jobs.submit(self.job, 'a'))
+        self.assertTrue(jobs.submit(self.job, 'b'))
+
+    def test_claims_expire(self):
+        now = [1000.0]
+        with mock.patch('utils.state_store.time.time', lambda: now[0]):
+            first, second = self.store(), self.store()
+            self.assertTrue(first.claim('job_dedupe', 'Ev1', 60))
+            now[0] += 59
+            self.assertFalse(second.claim('job_dedupe', 'Ev1', 60))
+            now[0] += 2
+            self.assertTrue(second.claim('job_dedupe', 'Ev1', 60))
+
+    def test_store_failure_does_not_drop_jobs(self):
+        store = mock.Mock()
+        store.claim.side_effect = RuntimeError('database is locked')
+        jobs = JobQueue(workers=1, store=store)
+        self.assertTrue(jobs.submit(self.job, 'first', dedupe_key='Ev1'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from utils.metrics import MetricsRegistry
+
+class MetricsSummaryTest(unittest.TestCase):
+    """
+    Tests per-run summaries of the process-wide metrics registry.
+    """
+    def test_summary_since_snapshot(self):
+        registry = MetricsRegistry()
+        registry.observe('request_seconds', 2.0, system='jira')
+        registry.increment('errors_total', system='jira')
+        since = registry.snapshot()
+        registry.observe('request_seconds', 0.01, system='jira')
+        registry.observe('request_seconds', 0.01, system='coupa')
+        registry.increment('errors_total', system='coupa')
+        summary = registry.summary('request_seconds', 'system', errors_name='errors_total', since=since)
+        self.assertEqual({system: (row['count'], row['errors']) for system, row in summary.items()},
+                         {'jira': (1, 0), 'coupa': (1, 1)})
+        self.assertAlmostEqual(summary['jira']['mean'], 0.01)
+        self.assertLess(summary['jira']['p99'], 1.0)
+
+    def test_systems_without_new_calls_are_left_out(self):
+        registry = MetricsRegistry()
+        registry.observe('request_seconds', 0.5, system='okta')
+        since = registry.snapshot()
+        self.assertEqual(registry.summary('request_seconds', 'system', since=since), {})
+        self.assertEqual(registry.summary('request_seconds', 'system')['okta']['count'], 1)
+
+    def test_totals_since_snapshot(self):
+        registry = MetricsRegistry()
+        registry.increment('requests_total', system='jira', status='200')
+        since = registry.snapshot()
+        registry.increment('requests_total', system='jira', status='200')
+        registry.increment('requests_total', system='jira', status='503')
+        registry.increment('requests_total', system='slack', status='200')
+        self.assertEqual(registry.totals('requests_total', 'system', since=since), {'jira': 2, 'slack': 1})
+        self.assertEqual(registry.totals('requests_total', 'system'), {'jira': 3, 'slack': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from Picard import Picard
+from services.approval import Approval
+from services.approval_index import ApprovalIndex
+from services.digest_tracker import FULL
+from utils.database import Database
+from utils.http_session import record_request
+from utils.metrics import metrics
+from utils.run_ledger import RunLedger, FAILED
+
+class FakeCollector:
+    """
+    Returns queued per-user fetch results, recording the systems each user was fetched from.
+    """
+    def __init__(self, results, failures=None):
+        self.results = results
+        self.failures = failures or {}
+        self.systems = {}
+
+    def collect_many(self, user_ids, systems_for_user=None):
+        for user_id in user_ids:
+            systems = systems_for_user(user_id)
+            self.systems[user_id] = systems
+            results = {system: approvals for system, approvals in self.results.items() if system in systems}
+            failures = {system: error for system, error in self.failures.items() if system in systems}
+            yield user_id, results, failures
+
+class FakeDelivery:
+    def flush(self):
+        return {'queued': 0, 'sent': 0, 'coalesced': 0, 'rate_limited': 0, 'failed': 0}
+
+class FakeSlackService:
+    delivery = FakeDelivery()
+
+class FakeApprovalCache:
+    def put(self, user_id, system, approvals):
+        pass
+
+class FakeDigestTracker:
+    def flush(self, force=True):
+        pass
+
+class ResumeTest(unittest.TestCase):
+    """
+    Tests that a resumed run combines what the earlier attempt fetched with what it fetches itself.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.directory, 'progress.db'))
+        self.jira = Approval('jira', 'J1', 'Access request', '2024-01-01', 'https://jira/J1')
+        self.coupa = Approval('coupa', '1', 'Laptop order', '2024-01-02', 'https://coupa/1')
+        self.workday = Approval('workday', 'W1', 'Time off', '2024-01-03', 'https://workday/W1')
+        self.digests = {}
+
+    def tearDown(self):
+        self.db.audit_writer.close()
+        self.db.conn.close()
+        shutil.rmtree(self.directory)
+
+    def picard(self, collector):
+        picard = Picard.__new__(Picard)
+        picard.logger = logging.getLogger('Picard')
+        picard.approval_services = {'jira': None, 'coupa': None, 'workday': None}
+        picard.ledger = RunLedger(self.db)
+        picard.collector = collector
+        picard.slack_service = FakeSlackService()
+        picard.approval_cache = FakeApprovalCache()
+        picard.digest_tracker = FakeDigestTracker()
+        picard.send_digest = self.send_digest
+        return picard
+
+    def send_digest(self, user_id, approvals, unavailable=None):
+        self.digests[user_id] = approvals
+        return FULL
+
+    def test_resume_after_bulk_fallback_does_not_duplicate(self):
+        # The first attempt's bulk Jira fetch failed, so Jira was fetched per user; Workday failed.
+        first = self.picard(FakeCollector({'jira': [self.jira], 'coupa': [self.coupa]}, {'workday': 'timeout'}))
+        first.ledger.start(prefix='run-')
+        first.process_users(['U1'], index=ApprovalIndex())
+        first.ledger.mark_user('U1', FAILED)
+        first.ledger.flush()
+
+        # The resumed attempt gets Jira from the bulk index and only needs Workday per user.
+        collector = FakeCollector({'workday': [self.workday]})
+        resumed = self.picard(collector)
+        run_id, was_resumed = resumed.ledger.start(resume=True, prefix='run-')
+        self.assertTrue(was_resumed)
+        self.digests.clear()
+        index = ApprovalIndex()
+        index.add_system('jira', [('U1', self.jira)])
+        resumed.process_users(['U1'], index=index)
+        self.assertEqual(collector.systems['U1'], ['workday'])
+        self.assertEqual([(a.system, a.id) for a in self.digests['U1']],
+                         [('coupa', '1'), ('workday', 'W1'), ('jira', 'J1')])
+
+class RunReportTest(unittest.TestCase):
+    """
+    Tests the throughput figures of the run report.
+    """
+    def test_system_calls_are_counted_from_requests(self):
+        picard = Picard.__new__(Picard)
+        picard.approval_services = {'jira': None, 'coupa': None}
+        since = metrics.snapshot()
+        for system in ['jira', 'jira', 'coupa', 'okta', 'slack']:
+            record_request(system, 'GET', 'https://example.com/api', '200', 0.01)
+        self.assertEqual(picard.count_system_calls(since), 3)
+
+if __name__ == '__main__':
+    unittest.main()
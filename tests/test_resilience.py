@@ -0,0 +1,75 @@
+import unittest
+import requests
+from utils.resilience import ResilientService, CircuitOpenError, OPEN, CLOSED
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+class FakeService:
+    """
+    Service whose per-user and paged bulk fetches fail with queued errors before succeeding.
+    """
+    def __init__(self, errors=None, page_errors=None):
+        self.errors = list(errors or [])
+        self.page_errors = page_errors or {}
+        self.page_calls = []
+
+    def get_pending_approvals(self, user_id):
+        if self.errors:
+            raise self.errors.pop(0)
+        return [user_id]
+
+    def get_pending_approvals_page(self, cursor):
+        self.page_calls.append(cursor)
+        errors = self.page_errors.get(cursor)
+        if errors:
+            raise errors.pop(0)
+        return [(f"user{cursor}", cursor)], (cursor + 1 if cursor < 2 else None)
+
+class ResilientServiceTest(unittest.TestCase):
+    """
+    Tests retries, the circuit breaker and paged bulk fetches.
+    """
+    def wrap(self, service):
+        return ResilientService('test', service, retries=2, backoff=0, failure_threshold=3)
+
+    def test_transient_errors_are_retried(self):
+        service = self.wrap(FakeService(errors=[http_error(503), requests.ConnectionError()]))
+        self.assertEqual(service.get_pending_approvals('u1'), ['u1'])
+        self.assertEqual(service.breaker.state, CLOSED)
+
+    def test_transient_errors_open_the_breaker(self):
+        service = self.wrap(FakeService(errors=[http_error(503)] * 3))
+        with self.assertRaises(requests.HTTPError):
+            service.get_pending_approvals('u1')
+        self.assertEqual(service.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            service.get_pending_approvals('u2')
+
+    def test_request_errors_do_not_open_the_breaker(self):
+        service = self.wrap(FakeService(errors=[http_error(404), KeyError('id'), http_error(400), http_error(404)]))
+        for _ in range(4):
+            with self.assertRaises((requests.HTTPError, KeyError)):
+                service.get_pending_approvals('u1')
+        self.assertEqual(service.breaker.state, CLOSED)
+        self.assertEqual(service.get_pending_approvals('u1'), ['u1'])
+
+    def test_bulk_fetch_retries_only_the_failed_page(self):
+        fake = FakeService(page_errors={1: [http_error(502)]})
+        service = self.wrap(fake)
+        self.assertEqual(list(service.get_all_pending_approvals()), [('user0', 0), ('user1', 1), ('user2', 2)])
+        self.assertEqual(fake.page_calls, [0, 1, 1, 2])
+
+    def test_bulk_fetch_streams(self):
+        fake = FakeService()
+        pairs = self.wrap(fake).get_all_pending_approvals()
+        next(pairs)
+        self.assertEqual(fake.page_calls, [0])
+
+    def test_bulk_fetch_needs_a_paged_service(self):
+        self.assertFalse(hasattr(self.wrap(object()), 'get_all_pending_approvals'))
+
+if __name__ == '__main__':
+    unittest.main()
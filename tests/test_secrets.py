@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from config.secrets import AWSSecretsProvider, LocalFileProvider, SecretsLoader, BATCH_SIZE
+
+class FakeProvider:
+    """
+    Returns versioned secrets and records every batch it was asked for.
+    """
+    def __init__(self):
+        self.batches = []
+        self.version = 1
+
+    def get_many(self, secret_names):
+        secret_names = list(secret_names)
+        self.batches.append(secret_names)
+        return {name: {'name': name, 'version': self.version} for name in secret_names}
+
+class FakeSecretsManager:
+    """
+    Stands in for the boto3 Secrets Manager client, paging BatchGetSecretValue results two at a time.
+    """
+    def __init__(self, batch_errors=None):
+        self.batch_requests = []
+        self.get_requests = []
+        self.batch_errors = batch_errors
+
+    def batch_get_secret_value(self, SecretIdList, NextToken=None):
+        self.batch_requests.append((list(SecretIdList), NextToken))
+        if self.batch_errors:
+            raise self.batch_errors
+        start = int(NextToken or 0)
+        names = SecretIdList[start:start + 2]
+        response = {'SecretValues': [{'Name': name, 'SecretString': json.dumps({'name': name})} for name in names]}
+        if start + 2 < len(SecretIdList):
+            response['NextToken'] = str(start + 2)
+        return response
+
+    def get_secret_value(self, SecretId):
+        self.get_requests.append(SecretId)
+        return {'SecretString': json.dumps({'name': SecretId})}
+
+class SecretsLoaderTest(unittest.TestCase):
+    """
+    Tests the TTL cache and batched prefetch of the secrets loader.
+    """
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('config.secrets.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.provider = FakeProvider()
+        self.loader = SecretsLoader(self.provider, ttl=60)
+
+    def test_secret_is_cached_for_its_ttl(self):
+        self.assertEqual(self.loader.get('slack_secret')['version'], 1)
+        self.provider.version = 2
+        self.now += 59
+        self.assertEqual(self.loader.get('slack_secret')['version'], 1)
+        self.now += 1
+        self.assertEqual(self.loader.get('slack_secret')['version'], 2)
+        self.assertEqual(self.provider.batches, [['slack_secret'], ['slack_secret']])
+
+    def test_prefetch_fetches_missing_and_expired_secrets_in_one_batch(self):
+        self.loader.get('okta_secret')
+        self.now += 30
+        self.loader.get('slack_secret')
+        self.now += 31
+        self.loader.prefetch(['okta_secret', 'slack_secret', 'jira_secret'])
+        self.assertEqual(self.provider.batches[-1], ['okta_secret', 'jira_secret'])
+        for name in ['okta_secret', 'slack_secret', 'jira_secret']:
+            self.loader.get(name)
+        self.assertEqual(len(self.provider.batches), 3)
+
+    def test_prefetch_of_cached_secrets_makes_no_call(self):
+        self.loader.prefetch(['okta_secret', 'slack_secret'])
+        self.loader.prefetch(['slack_secret', 'okta_secret'])
+        self.assertEqual(self.provider.batches, [['okta_secret', 'slack_secret']])
+
+class AWSSecretsProviderTest(unittest.TestCase):
+    """
+    Tests that several secrets are fetched with BatchGetSecretValue, BATCH_SIZE at a time.
+    """
+    def provider(self, client):
+        provider = AWSSecretsProvider()
+        provider._client = client
+        return provider
+
+    def test_batches_and_pages(self):
+        client = FakeSecretsManager()
+        names = [f"secret{i}" for i in range(BATCH_SIZE + 3)]
+        secrets = self.provider(client).get_many(names)
+        self.assertEqual(secrets, {name: {'name': name} for name in names})
+        self.assertEqual([len(ids) for ids, token in client.batch_requests if token is None], [BATCH_SIZE, 3])
+        self.assertEqual(client.get_requests, [])
+
+    def test_single_secret_uses_get_secret_value(self):
+        client = FakeSecretsManager()
+        self.assertEqual(self.provider(client).get_many(['slack_secret']), {'slack_secret': {'name': 'slack_secret'}})
+        self.assertEqual(client.batch_requests, [])
+
+    def test_falls_back_to_concurrent_gets(self):
+        client = FakeSecretsManager(batch_errors=Exception('AccessDenied'))
+        names = ['okta_secret', 'slack_secret', 'jira_secret']
+        self.assertEqual(self.provider(client).get_many(names), {name: {'name': name} for name in names})
+        self.assertEqual(sorted(client.get_requests), sorted(names))
+
+class LocalFileProviderTest(unittest.TestCase):
+    """
+    Tests reading secrets from a local JSON file.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'secrets.json')
+        with open(self.path, 'w') as f:
+            json.dump({'slack_secret': {'api_token': 'xoxb-1'}, 'jira_secret': {'base_url': 'https://jira'}}, f)
+
+    def test_get_and_get_many(self):
+        provider = LocalFileProvider(self.path)
+        self.assertEqual(provider.get('slack_secret'), {'api_token': 'xoxb-1'})
+        self.assertEqual(provider.get_many(['jira_secret']), {'jira_secret': {'base_url': 'https://jira'}})
+
+    def test_file_is_read_once(self):
+        provider = LocalFileProvider(self.path)
+        provider.get('slack_secret')
+        os.remove(self.path)
+        self.assertEqual(provider.get('jira_secret'), {'base_url': 'https://jira'})
+
+    def test_missing_secret(self):
+        with self.assertRaises(KeyError):
+            LocalFileProvider(self.path).get('okta_secret')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from services.servicenow_service import ServiceNowService
+
+BASE_URL = 'https://example.service-now.com'
+
+# An approval record as returned by the per-user query, with sysparm_display_value=all.
+PER_USER_RECORD = {
+    'sys_id': {'display_value': 'a1b2c3', 'value': 'a1b2c3'},
+    'sys_created_on': {'display_value': '01/01/2024 09:30:00', 'value': '2024-01-01 17:30:00'},
+    'state': {'display_value': 'Requested', 'value': 'requested'},
+    'assigned_to': {'display_value': 'Ada Lovelace', 'value': '6816f79c',
+                    'link': f"{BASE_URL}/api/now/table/sys_user/6816f79c"},
+    'sysapproval': {'display_value': 'RITM0010001', 'value': '9d8e7f',
+                    'link': f"{BASE_URL}/api/now/table/task/9d8e7f"}
+}
+
+# The same record on a bulk page, which also sets sysparm_exclude_reference_link=true.
+BULK_RECORD = {
+    'sys_id': {'display_value': 'a1b2c3', 'value': 'a1b2c3'},
+    'sys_created_on': {'display_value': '01/01/2024 09:30:00', 'value': '2024-01-01 17:30:00'},
+    'state': {'display_value': 'Requested', 'value': 'requested'},
+    'assigned_to': {'display_value': 'Ada Lovelace', 'value': '6816f79c'},
+    'sysapproval': {'display_value': 'RITM0010001', 'value': '9d8e7f'}
+}
+
+# The record without sysparm_display_value: references are {link, value} or, without links, sys_id strings.
+RAW_RECORD = {
+    'sys_id': 'a1b2c3',
+    'sys_created_on': '2024-01-01 17:30:00',
+    'state': 'requested',
+    'assigned_to': {'link': f"{BASE_URL}/api/now/table/sys_user/6816f79c", 'value': '6816f79c'},
+    'sysapproval': '9d8e7f'
+}
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+class FakeSession:
+    """
+    Records the query parameters of each GET and returns the queued result pages.
+    """
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.params = []
+
+    def get(self, url, params=None):
+        self.params.append(params)
+        return FakeResponse({'result': self.pages.pop(0)})
+
+class FakePool:
+    def __init__(self, session):
+        self.session = session
+
+    def get_session(self, base_url, headers=None, name=None):
+        return self.session
+
+class ServiceNowServiceTest(unittest.TestCase):
+    """
+    Tests that ServiceNow approval records are normalized from the shapes the Table API returns.
+    """
+    def service(self, pages):
+        self.session = FakeSession(pages)
+        return ServiceNowService({'base_url': BASE_URL, 'api_token': 'token', 'page_size': 2}, FakePool(self.session))
+
+    def assert_approval(self, approval):
+        self.assertEqual(approval.id, 'a1b2c3')
+        self.assertEqual(approval.summary, 'RITM0010001')
+        self.assertEqual(approval.date, '2024-01-01')
+        self.assertTrue(approval.link.endswith('sys_id=a1b2c3'))
+
+    def test_per_user_records(self):
+        service = self.service([[PER_USER_RECORD]])
+        [approval] = service.get_pending_approvals('6816f79c')
+        self.assert_approval(approval)
+        self.assertEqual(self.session.params[0]['sysparm_display_value'], 'all')
+
+    def test_bulk_pages(self):
+        service = self.service([[BULK_RECORD, BULK_RECORD], [BULK_RECORD]])
+        pairs = list(service.get_all_pending_approvals())
+        self.assertEqual([user_id for user_id, approval in pairs], ['6816f79c'] * 3)
+        for user_id, approval in pairs:
+            self.assert_approval(approval)
+        self.assertEqual([params['sysparm_offset'] for params in self.session.params], [0, 2])
+        self.assertEqual(self.session.params[0]['sysparm_display_value'], 'all')
+
+    def test_raw_records(self):
+        service = self.service([[RAW_RECORD]])
+        [(user_id, approval)] = service.get_pending_approvals_page(0)[0]
+        self.assertEqual(user_id, '6816f79c')
+        self.assertEqual(approval.id, 'a1b2c3')
+        self.assertEqual(approval.date, '2024-01-01')
+
+    def test_unassigned_records_are_skipped(self):
+        record = dict(BULK_RECORD, assigned_to={'display_value': '', 'value': ''})
+        service = self.service([[record]])
+        self.assertEqual(service.get_pending_approvals_page(0), ([], None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import unittest
+from services.slack_delivery import AsyncSlackDelivery, SlackDeliveryQueue
+from services.slack_service import SlackApiError
+
+class RecordingDelivery(AsyncSlackDelivery):
+    """
+    AsyncSlackDelivery that records calls instead of sending them, taking longer for earlier calls.
+    """
+    def __init__(self, loop, errors=None):
+        super().__init__(None, loop, rate_limits={'chat.postMessage': 6000})
+        self.sent = []
+        self.errors = list(errors or [])
+
+    async def call_api(self, method, data):
+        await asyncio.sleep(data.get('delay', 0))
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((data['channel'], data['text']))
+        return {'ok': True}
+
+class RecordingSlackService:
+    """
+    Stands in for SlackService, recording each Web API call.
+    """
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = list(errors or [])
+
+    def call_api(self, method, data):
+        self.calls.append((method, data['text']))
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'ok': True}
+
+def failing_callback(delivered):
+    raise RuntimeError('ledger unavailable')
+
+async def deliver_all(calls, on_done=None, errors=None):
+    delivery = RecordingDelivery(asyncio.get_running_loop(), errors)
+    for data, coalesce_key in calls:
+        delivery.schedule('chat.postMessage', data, coalesce_key, on_done)
+    while delivery.pending or delivery.channels:
+        await asyncio.sleep(0.01)
+    return delivery
+
+class AsyncSlackDeliveryTest(unittest.TestCase):
+    """
+    Tests ordering and coalescing of the async Slack delivery.
+    """
+    def test_replies_to_one_channel_arrive_in_order(self):
+        delivery = asyncio.run(deliver_all([
+            ({'channel': 'D1', 'text': 'first', 'delay': 0.05}, None),
+            ({'channel': 'D2', 'text': 'other', 'delay': 0}, None),
+            ({'channel': 'D1', 'text': 'second', 'delay': 0}, None),
+            ({'channel': 'D1', 'text': 'third', 'delay': 0.02}, None)
+        ]))
+        self.assertEqual([text for channel, text in delivery.sent if channel == 'D1'], ['first', 'second', 'third'])
+        self.assertEqual(delivery.sent[0], ('D2', 'other'))
+        self.assertEqual(delivery.stats['sent'], 4)
+
+    def test_coalesced_call_keeps_its_place(self):
+        delivery = asyncio.run(deliver_all([
+            ({'channel': 'D1', 'text': 'reply', 'delay': 0.02}, None),
+            ({'channel': 'D1', 'text': 'digest v1'}, 'digest:U1'),
+            ({'channel': 'D1', 'text': 'later reply'}, None),
+            ({'channel': 'D1', 'text': 'digest v2'}, 'digest:U1')
+        ]))
+        self.assertEqual(delivery.sent, [('D1', 'reply'), ('D1', 'digest v2'), ('D1', 'later reply')])
+        self.assertEqual(delivery.stats['coalesced'], 1)
+
+    def test_failing_callback_does_not_resend(self):
+        delivery = asyncio.run(deliver_all([({'channel': 'D1', 'text': 'digest'}, 'digest:U1')], failing_callback))
+        self.assertEqual(delivery.sent, [('D1', 'digest')])
+        self.assertEqual(delivery.stats['sent'], 1)
+        self.assertEqual(delivery.stats['failed'], 0)
+
+    def test_permanent_error_is_not_retried(self):
+        results = []
+        delivery = asyncio.run(deliver_all([({'channel': 'D1', 'text': 'digest'}, None)], results.append,
+                                           [SlackApiError('chat.postMessage', 'channel_not_found')]))
+        self.assertEqual(delivery.sent, [])
+        self.assertEqual(results, [False])
+        self.assertEqual(delivery.stats['failed'], 1)
+
+    def test_transient_error_is_retried(self):
+        results = []
+        delivery = asyncio.run(deliver_all([({'channel': 'D1', 'text': 'digest'}, None)], results.append,
+                                           [SlackApiError('chat.postMessage', 'internal_error')]))
+        self.assertEqual(delivery.sent, [('D1', 'digest')])
+        self.assertEqual(results, [True])
+
+    def test_replaced_call_reports_the_outcome_of_the_newer_one(self):
+        results = []
+
+        async def deliver():
+            delivery = RecordingDelivery(asyncio.get_running_loop())
+            delivery.schedule('chat.postMessage', {'channel': 'D1', 'text': 'reply', 'delay': 0.02}, None, None)
+            delivery.schedule('chat.postMessage', {'channel': 'D1', 'text': 'digest v1'}, 'digest:U1',
+                              lambda delivered: results.append(('v1', delivered)))
+            delivery.schedule('chat.postMessage', {'channel': 'D1', 'text': 'digest v2'}, 'digest:U1',
+                              lambda delivered: results.append(('v2', delivered)))
+            while delivery.pending or delivery.channels:
+                await asyncio.sleep(0.01)
+            return delivery
+
+        delivery = asyncio.run(deliver())
+        self.assertEqual(delivery.sent, [('D1', 'reply'), ('D1', 'digest v2')])
+        self.assertEqual(results, [('v1', True), ('v2', True)])
+
+    def test_retry_replaced_meanwhile_hands_over_its_callback(self):
+        results = []
+
+        async def deliver():
+            errors = [SlackApiError('chat.postMessage', 'internal_error')]
+            delivery = RecordingDelivery(asyncio.get_running_loop(), errors)
+            delivery.schedule('chat.postMessage', {'channel': 'D1', 'text': 'digest v1', 'delay': 0.05}, 'digest:U1',
+                              lambda delivered: results.append(('v1', delivered)))
+            await asyncio.sleep(0.02)
+            delivery.schedule('chat.postMessage', {'channel': 'D1', 'text': 'digest v2'}, 'digest:U1',
+                              lambda delivered: results.append(('v2', delivered)))
+            while delivery.pending or delivery.channels:
+                await asyncio.sleep(0.01)
+            return delivery
+
+        delivery = asyncio.run(deliver())
+        self.assertEqual(delivery.sent, [('D1', 'digest v2')])
+        self.assertEqual(results, [('v1', True), ('v2', True)])
+
+class SlackDeliveryQueueTest(unittest.TestCase):
+    """
+    Tests the threaded Slack delivery queue.
+    """
+    def test_failing_callback_does_not_resend(self):
+        slack_service = RecordingSlackService()
+        delivery = SlackDeliveryQueue(slack_service, workers=1)
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'digest'}, 'digest:U1', failing_callback)
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'reply'})
+        stats = delivery.flush()
+        self.assertEqual(slack_service.calls, [('chat.postMessage', 'digest'), ('chat.postMessage', 'reply')])
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(stats['failed'], 0)
+
+    def test_permanent_error_is_not_retried(self):
+        slack_service = RecordingSlackService([SlackApiError('chat.postMessage', 'account_inactive')])
+        delivery = SlackDeliveryQueue(slack_service, workers=1)
+        results = []
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'digest'}, on_done=results.append)
+        stats = delivery.flush()
+        self.assertEqual(len(slack_service.calls), 1)
+        self.assertEqual(results, [False])
+        self.assertEqual((stats['sent'], stats['failed']), (0, 1))
+
+    def test_transient_error_is_retried(self):
+        slack_service = RecordingSlackService([SlackApiError('chat.postMessage', 'service_unavailable')])
+        delivery = SlackDeliveryQueue(slack_service, workers=1)
+        results = []
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'digest'}, on_done=results.append)
+        stats = delivery.flush()
+        self.assertEqual(len(slack_service.calls), 2)
+        self.assertEqual(results, [True])
+        self.assertEqual((stats['sent'], stats['failed']), (1, 0))
+
+    def test_replaced_call_reports_the_outcome_of_the_newer_one(self):
+        slack_service = RecordingSlackService()
+        release = threading.Event()
+        call_api = slack_service.call_api
+        slack_service.call_api = lambda method, data: release.wait(5) and call_api(method, data)
+        delivery = SlackDeliveryQueue(slack_service, workers=1)
+        results = []
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'reply'})
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'digest v1'}, 'digest:U1',
+                         lambda delivered: results.append(('v1', delivered)))
+        delivery.enqueue('chat.postMessage', {'channel': 'D1', 'text': 'digest v2'}, 'digest:U1',
+                         lambda delivered: results.append(('v2', delivered)))
+        release.set()
+        stats = delivery.flush()
+        self.assertEqual(slack_service.calls, [('chat.postMessage', 'reply'), ('chat.postMessage', 'digest v2')])
+        self.assertEqual(results, [('v1', True), ('v2', True)])
+        self.assertEqual(stats['coalesced'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from services.approval import Approval
+from services.conversation import AWAITING_COMMENT
+from services.digest_tracker import approval_key
+from services.slack_service import SlackApiError, SlackRateLimitError, SlackService, read_response
+from utils.state_store import SQLiteStateStore
+
+class RecordingSlackService(SlackService):
+    """
+    SlackService that records messages instead of sending them.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+
+    def send_message(self, user_id, message, coalesce_key=None, on_done=None, blocks=None):
+        self.sent.append((user_id, message, blocks))
+
+class FakeResponse:
+    def __init__(self, status_code, payload, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self.payload
+
+class ReadResponseTest(unittest.TestCase):
+    """
+    Tests that Slack errors reported in the response body are raised.
+    """
+    def test_ok(self):
+        self.assertEqual(read_response('chat.postMessage', FakeResponse(200, {'ok': True, 'ts': '1'})),
+                         {'ok': True, 'ts': '1'})
+
+    def test_error_in_body(self):
+        with self.assertRaises(SlackApiError) as raised:
+            read_response('chat.postMessage', FakeResponse(200, {'ok': False, 'error': 'channel_not_found'}))
+        self.assertEqual(raised.exception.error, 'channel_not_found')
+        self.assertTrue(raised.exception.permanent)
+
+    def test_transient_error_in_body(self):
+        with self.assertRaises(SlackApiError) as raised:
+            read_response('chat.postMessage', FakeResponse(200, {'ok': False, 'error': 'internal_error'}))
+        self.assertFalse(raised.exception.permanent)
+
+    def test_rate_limited(self):
+        for response in [FakeResponse(429, {}, {'Retry-After': '3'}),
+                         FakeResponse(200, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': '3'})]:
+            with self.assertRaises(SlackRateLimitError) as raised:
+                read_response('chat.postMessage', response)
+            self.assertEqual(raised.exception.retry_after, 3)
+
+class ApprovalButtonTest(unittest.TestCase):
+    """
+    Tests that digest buttons keep acting on the item they were shown next to.
+    """
+    def setUp(self):
+        self.slack = RecordingSlackService({}, state_store=SQLiteStateStore(':memory:'))
+        self.a = Approval('jira', 'J-1', 'Access request', '2024-01-01', 'https://jira/J-1')
+        self.b = Approval('coupa', '17', 'Laptop order', '2024-01-02', 'https://coupa/17')
+        self.c = Approval('jira', 'J-2', 'Budget change', '2024-01-03', 'https://jira/J-2')
+
+    def buttons(self, blocks):
+        return [element for block in blocks if block['type'] == 'actions' for element in block['elements']
+                if element['action_id'] in ['approve', 'reject']]
+
+    def test_buttons_carry_stable_keys(self):
+        self.slack.send_approval_list('U1', [self.a, self.b, self.c])
+        values = [button['value'] for button in self.buttons(self.slack.sent[-1][2])]
+        self.assertEqual(values, ['jira:J-1', 'jira:J-1', 'coupa:17', 'coupa:17', 'jira:J-2', 'jira:J-2'])
+
+    def test_click_after_renumbering_acts_on_the_same_item(self):
+        self.slack.send_approval_list('U1', [self.a, self.b, self.c])
+        self.slack.pending_approvals['U1'] = [self.a, self.c]
+        self.slack.handle_interactive_message('U1', 'approve', approval_key(self.c))
+        conversation = self.slack.conversations.get('U1')
+        self.assertEqual(conversation['state'], AWAITING_COMMENT)
+        self.assertEqual(conversation['approval'], self.c)
+        self.assertIn('Budget change', self.slack.sent[-1][1])
+
+    def test_click_on_item_no_longer_pending(self):
+        self.slack.send_approval_list('U1', [self.a, self.b, self.c])
+        self.slack.pending_approvals['U1'] = [self.a, self.c]
+        self.slack.handle_interactive_message('U1', 'reject', approval_key(self.b))
+        self.assertIsNone(self.slack.conversations.get('U1'))
+        self.assertIn('no longer pending', self.slack.sent[-1][1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import threading
+import time
+
+class AdaptiveLimiter:
+    """
+    Thread-safe adaptive limit on the requests in flight to one downstream system (AIMD).
+    Each fast, successful response raises the limit additively, by about one per limit's worth of responses.
+    A 429/503, a timeout or a connection error halves it, and smoothed latency above tolerance times the baseline
+    (the lowest smoothed latency seen) trims it, so the limit stops growing once requests start to queue.
+    At most one decrease happens per round trip: responses to requests sent before the last decrease are ignored.
+    """
+    def __init__(self, name, initial_limit=4, min_limit=1, max_limit=32, backoff_ratio=0.5,
+                 latency_backoff_ratio=0.9, tolerance=2.0):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_backoff_ratio = latency_backoff_ratio
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.smoothed = None
+        self.baseline = None
+        self.decreased_at = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Waits until a request may be sent and returns its start time, to be passed to release.
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started_at, overloaded=False):
+        """
+        Frees the request's slot and adjusts the limit from its outcome and latency.
+        """
+        now = time.monotonic()
+        latency = now - started_at
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.decrease(started_at, now, self.backoff_ratio)
+            else:
+                self.smoothed = latency if self.smoothed is None else self.smoothed + (latency - self.smoothed) * 0.1
+                # The baseline follows the lowest smoothed latency and drifts up slowly to track a changing system.
+                if self.baseline is None or self.smoothed < self.baseline:
+                    self.baseline = self.smoothed
+                else:
+                    self.baseline += (self.smoothed - self.baseline) * 0.01
+                if self.smoothed > self.tolerance * self.baseline:
+                    self.decrease(started_at, now, self.latency_backoff_ratio)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def decrease(self, started_at, now, ratio):
+        """
+        Multiplies the limit by ratio, unless the request was sent before the last decrease.
+        Called with the condition held.
+        """
+        if started_at < self.decreased_at:
+            return
+        self.limit = max(self.min_limit, self.limit * ratio)
+        self.decreased_at = now
@@ -1,40 +1,290 @@
+import atexit
+import csv
+import json
+import logging
+import queue
 import sqlite3
+import threading
+from datetime import datetime
+
+AUDIT_COLUMNS = ['id', 'timestamp', 'user_id', 'system', 'approval_id', 'action', 'status', 'comments']
+
+class AuditWriter:
+    """
+    Background writer for the audit log. Rows are queued by any thread and written by one thread with its own
+    connection, up to batch_size rows per transaction, so callers never wait on a commit.
+    """
+    def __init__(self, db_uri, batch_size=500, flush_interval=0.5):
+        self.db_uri = db_uri
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = queue.Queue()
+        self.logger = logging.getLogger('Picard')
+        self.thread = threading.Thread(target=self.run, name='picard-audit-writer', daemon=True)
+        self.thread.start()
+        # Rows still queued at interpreter exit are written before the process ends.
+        atexit.register(self.close)
+
+    def write(self, row):
+        """
+        Queues one row for the next batch.
+        """
+        self.rows.put(row)
+
+    def flush(self):
+        """
+        Waits until every queued row has been committed.
+        """
+        self.rows.join()
+
+    def close(self):
+        """
+        Writes the remaining rows and stops the writer thread.
+        """
+        if self.thread.is_alive():
+            self.rows.put(None)
+            self.thread.join()
+
+    def run(self):
+        """
+        Writes queued rows in batches until close is called. A batch is committed as soon as the queue is drained,
+        so rows are written within one flush_interval under light load and in large transactions under heavy load.
+        """
+        conn = sqlite3.connect(self.db_uri, timeout=30)
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.rows.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.rows.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            stopping = len(rows) < len(batch)
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany('''INSERT INTO progress (timestamp, user_id, system, approval_id, action, status, comments)
+                                             VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+            except sqlite3.Error as e:
+                self.logger.error(f"Failed to write {len(rows)} audit rows: {e}")
+            finally:
+                for _ in batch:
+                    self.rows.task_done()
+        conn.close()
 
 class Database:
     """
     Manages interactions with a static database for tracking progress.
+    The database runs in WAL mode, so the daily run and the webhook workers can read it while another process writes.
     """
-    def __init__(self, db_uri):
-        self.conn = sqlite3.connect(db_uri)
+    def __init__(self, db_uri, batch_size=500, flush_interval=0.5):
+        # Shard processes share the database file, so wait for locks instead of failing.
+        self.conn = sqlite3.connect(db_uri, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
         self.create_table()
+        self.audit_writer = AuditWriter(db_uri, batch_size, flush_interval)
 
     def create_table(self):
         """
-        Creates a table for logging progress.
+        Creates the tables for the audit log, tracking the last digest sent to each user, and the run ledger.
         """
-        with self.conn:
+        with self.lock, self.conn:
             self.conn.execute('''CREATE TABLE IF NOT EXISTS progress (
                                     id INTEGER PRIMARY KEY,
                                     user_id TEXT,
                                     approval_id TEXT,
                                     status TEXT,
                                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                                    comments TEXT
+                                    comments TEXT,
+                                    system TEXT,
+                                    action TEXT
                                  )''')
+            # Databases created before the audit log recorded the system and action get the new columns.
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(progress)')}
+            for column in ['system', 'action']:
+                if column not in columns:
+                    self.conn.execute(f'ALTER TABLE progress ADD COLUMN {column} TEXT')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS progress_user_id ON progress (user_id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS progress_approval_id ON progress (approval_id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS progress_timestamp ON progress (timestamp)')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS digests (
+                                    user_id TEXT PRIMARY KEY,
+                                    fingerprint TEXT,
+                                    items TEXT,
+                                    sent_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                                 )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+                                    run_id TEXT PRIMARY KEY,
+                                    status TEXT,
+                                    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                    finished_at DATETIME
+                                 )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS run_users (
+                                    run_id TEXT,
+                                    user_id TEXT,
+                                    status TEXT,
+                                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                    PRIMARY KEY (run_id, user_id)
+                                 ) WITHOUT ROWID''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS run_fetches (
+                                    run_id TEXT,
+                                    user_id TEXT,
+                                    system TEXT,
+                                    status TEXT,
+                                    error TEXT,
+                                    approvals TEXT,
+                                    PRIMARY KEY (run_id, user_id, system)
+                                 ) WITHOUT ROWID''')
+
+    def log_action(self, user_id, system, approval_id, action, status, comments=None, timestamp=None):
+        """
+        Queues an audit row for an action ('approve', 'reject', ...) a user took on an approval and its outcome.
+        The row is committed by the background writer in the next batch.
+        """
+        timestamp = timestamp or datetime.utcnow().isoformat(sep=' ', timespec='milliseconds')
+        self.audit_writer.write((timestamp, user_id, system, approval_id, action, status, comments))
 
-    def log_approval(self, user_id, approval_id, timestamp, comments):
+    def flush_audit(self):
         """
-        Logs the approval details into the database.
+        Waits until every queued audit row has been committed.
         """
-        with self.conn:
-            self.conn.execute('''INSERT INTO progress (user_id, approval_id, status, timestamp, comments)
-                                 VALUES (?, ?, ?, ?, ?)''', 
-                                 (user_id, approval_id, 'approved', timestamp, comments))
+        self.audit_writer.flush()
 
     def get_approval(self, approval_id):
         """
-        Retrieves the approval details from the database.
+        Retrieves the latest audit row recorded for an approval, including rows still queued for writing.
         """
-        with self.conn:
-            cursor = self.conn.execute('''SELECT * FROM progress WHERE approval_id=?''', (approval_id,))
+        self.flush_audit()
+        with self.lock:
+            cursor = self.conn.execute(f'''SELECT {', '.join(AUDIT_COLUMNS)} FROM progress WHERE approval_id=?
+                                          ORDER BY id DESC LIMIT 1''', (approval_id,))
             return cursor.fetchone()
+
+    def get_user_actions(self, user_id, limit=100):
+        """
+        Retrieves a user's most recent audit rows, newest first.
+        """
+        self.flush_audit()
+        with self.lock:
+            cursor = self.conn.execute(f'''SELECT {', '.join(AUDIT_COLUMNS)} FROM progress WHERE user_id=?
+                                          ORDER BY id DESC LIMIT ?''', (user_id, limit))
+            return cursor.fetchall()
+
+    def iter_actions(self, since=None, until=None, page_size=5000):
+        """
+        Yields audit rows in insertion order, optionally limited to timestamps in [since, until).
+        Rows are read a page at a time by primary key, so exporting millions of rows takes constant memory
+        and never holds the connection between pages.
+        """
+        self.flush_audit()
+        conditions = ['id > ?']
+        params = []
+        if since:
+            conditions.append('timestamp >= ?')
+            params.append(str(since))
+        if until:
+            conditions.append('timestamp < ?')
+            params.append(str(until))
+        query = (f"SELECT {', '.join(AUDIT_COLUMNS)} FROM progress WHERE {' AND '.join(conditions)} "
+                 f"ORDER BY id LIMIT ?")
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(query, [last_id] + params + [page_size]).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def export_actions(self, path, since=None, until=None):
+        """
+        Writes audit rows to a CSV file with a header row and returns the number of rows written.
+        """
+        count = 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(AUDIT_COLUMNS)
+            for row in self.iter_actions(since, until):
+                writer.writerow(row)
+                count += 1
+        return count
+
+    def get_digest(self, user_id):
+        """
+        Retrieves the fingerprint and item keys of the last digest sent to a user.
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute('''SELECT fingerprint, items FROM digests WHERE user_id=?''', (user_id,))
+            return cursor.fetchone()
+
+    def get_digest_sizes(self):
+        """
+        Retrieves the number of items in the last digest sent to each user, keyed by user ID.
+        """
+        with self.lock, self.conn:
+            rows = self.conn.execute('''SELECT user_id, items FROM digests''').fetchall()
+        return {user_id: len(json.loads(items)) for user_id, items in rows}
+
+    def save_digests(self, digests):
+        """
+        Records the fingerprint and item keys of the digests sent to many users in one transaction.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany('''INSERT OR REPLACE INTO digests (user_id, fingerprint, items, sent_at)
+                                     VALUES (?, ?, ?, CURRENT_TIMESTAMP)''', digests)
+
+    def start_run(self, run_id):
+        """
+        Records the start of a daily run in the run ledger.
+        """
+        with self.lock, self.conn:
+            self.conn.execute('''INSERT OR IGNORE INTO runs (run_id, status) VALUES (?, 'running')''', (run_id,))
+
+    def finish_run(self, run_id, status):
+        """
+        Records the end of a daily run.
+        """
+        with self.lock, self.conn:
+            self.conn.execute('''UPDATE runs SET status=?, finished_at=CURRENT_TIMESTAMP WHERE run_id=?''', (status, run_id))
+
+    def get_unfinished_run(self, prefix=''):
+        """
+        Retrieves the ID of the most recent run that did not finish, limited to run IDs starting with prefix.
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute('''SELECT run_id FROM runs WHERE status='running' AND run_id LIKE ?
+                                          ORDER BY started_at DESC, run_id DESC LIMIT 1''', (prefix + '%',))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def save_run_progress(self, user_rows, fetch_rows):
+        """
+        Records per-user statuses and per-system fetch outcomes for a run in one transaction.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany('''INSERT OR REPLACE INTO run_users (run_id, user_id, status, updated_at)
+                                     VALUES (?, ?, ?, CURRENT_TIMESTAMP)''', user_rows)
+            self.conn.executemany('''INSERT OR REPLACE INTO run_fetches (run_id, user_id, system, status, error, approvals)
+                                     VALUES (?, ?, ?, ?, ?, ?)''', fetch_rows)
+
+    def get_run_users(self, run_id):
+        """
+        Retrieves the user IDs and statuses recorded for a run.
+        """
+        with self.lock, self.conn:
+            return self.conn.execute('''SELECT user_id, status FROM run_users WHERE run_id=?''', (run_id,)).fetchall()
+
+    def get_run_fetches(self, run_id, status):
+        """
+        Retrieves the per-system fetch outcomes of the users with a given status in a run.
+        """
+        with self.lock, self.conn:
+            return self.conn.execute('''SELECT f.user_id, f.system, f.status, f.approvals FROM run_fetches f
+                                         JOIN run_users u ON u.run_id = f.run_id AND u.user_id = f.user_id
+                                         WHERE f.run_id=? AND u.status=?''', (run_id, status)).fetchall()
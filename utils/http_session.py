@@ -0,0 +1,121 @@
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from utils.adaptive_limiter import AdaptiveLimiter
+from utils.metrics import metrics, normalize_endpoint
+
+# Responses that tell the adaptive limiter the system is overloaded.
+OVERLOAD_STATUSES = (429, 503)
+
+class PooledSession(requests.Session):
+    """
+    A requests session that applies a default timeout to every request and, when it has an adaptive limiter,
+    holds a limiter slot for the duration of each request. Every request is counted and timed in the metrics
+    registry by system, endpoint and status.
+    global_limit, if set, is a semaphore shared with other sessions (the collector's cap on requests in flight
+    across all systems). It is taken only once the limiter slot is held, so a request waiting on its own system's
+    limit never keeps other systems from their share of the cap.
+    """
+    def __init__(self, timeout=None, limiter=None, name=None):
+        super().__init__()
+        self.timeout = timeout
+        self.limiter = limiter
+        self.name = name
+        self.global_limit = None
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started_at = self.limiter.acquire() if self.limiter else time.monotonic()
+        if self.global_limit:
+            self.global_limit.acquire()
+            # The wait for the shared cap is not the system's latency.
+            started_at = time.monotonic()
+        # Timeouts and connection errors count as overload too.
+        overloaded = True
+        status = 'error'
+        try:
+            response = super().request(method, url, **kwargs)
+            overloaded = response.status_code in OVERLOAD_STATUSES
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            if self.global_limit:
+                self.global_limit.release()
+            if self.limiter:
+                self.limiter.release(started_at, overloaded)
+            self.record(method, url, status, time.monotonic() - started_at)
+
+    def record(self, method, url, status, elapsed):
+        """
+        Records one outbound call in the metrics registry.
+        """
+        record_request(self.name, method, url, status, elapsed)
+
+def record_request(system, method, url, status, elapsed):
+    """
+    Records one outbound call to a system in the metrics registry. status is the HTTP status code as a string,
+    or the exception name if the call failed without a response.
+    """
+    endpoint = normalize_endpoint(method.upper(), urlparse(url).path)
+    metrics.increment('picard_http_requests_total', system=system, endpoint=endpoint, status=status)
+    metrics.observe('picard_http_request_seconds', elapsed, system=system, endpoint=endpoint)
+    if not status.isdigit() or int(status) >= 400:
+        metrics.increment('picard_http_errors_total', system=system, endpoint=endpoint)
+
+class SessionPool:
+    """
+    Shared transport layer for the service classes. Keeps one keep-alive session per base URL,
+    so TCP/TLS connections and Authorization headers are reused across calls instead of rebuilt each time.
+    With adaptive_concurrency (AdaptiveLimiter settings), each session also gets its own adaptive in-flight limit,
+    so every downstream system is driven as hard as it allows.
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=32, connect_timeout=5, read_timeout=30,
+                 adaptive_concurrency=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.adaptive_concurrency = adaptive_concurrency
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, base_url, headers=None, name=None):
+        """
+        Returns the session for a base URL, creating it with the given headers on first use.
+        name labels the session's calls in the metrics (the host name by default).
+        """
+        with self.lock:
+            session = self.sessions.get(base_url)
+            if session is None:
+                limiter = AdaptiveLimiter(base_url, **self.adaptive_concurrency) if self.adaptive_concurrency else None
+                session = PooledSession(self.timeout, limiter, name or urlparse(base_url).hostname)
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                if headers:
+                    session.headers.update(headers)
+                self.sessions[base_url] = session
+            return session
+
+    def limits(self):
+        """
+        Returns the current adaptive in-flight limit of each session, keyed by base URL.
+        """
+        with self.lock:
+            return {base_url: session.limiter.limit for base_url, session in self.sessions.items() if session.limiter}
+
+    def close(self):
+        """
+        Closes every session and its connection pool.
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+# Used by service classes that are not given a pool explicitly.
+default_pool = SessionPool()
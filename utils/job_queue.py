@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from utils.metrics import metrics
+
+DEDUPE_NAMESPACE = 'job_dedupe'
+
+class JobQueue:
+    """
+    In-process job queue drained by a pool of worker threads.
+    Lets webhook handlers acknowledge Slack immediately and run the downstream work in the background.
+    Jobs submitted with a dedupe key that was already seen (e.g. a Slack event_id on a retried delivery) are dropped,
+    and jobs sharing an order key (e.g. a Slack user ID) run one at a time in submission order.
+    With a state store, dedupe keys are also claimed there for dedupe_ttl seconds, so a retry that lands on another
+    server process is dropped too.
+    """
+    def __init__(self, workers=8, dedupe_size=10000, latency_window=1000, store=None, dedupe_ttl=60 * 60):
+        self.workers = workers
+        self.dedupe_size = dedupe_size
+        self.store = store
+        self.dedupe_ttl = dedupe_ttl
+        self.logger = logging.getLogger('Picard')
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.next_queue = 0
+        self.seen_keys = OrderedDict()
+        self.latencies = deque(maxlen=latency_window)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.counts = {'submitted': 0, 'completed': 0, 'failed': 0, 'duplicates': 0, 'in_flight': 0}
+        metrics.gauge('picard_job_queue_depth', lambda: sum(jobs.qsize() for jobs in self.queues))
+        metrics.gauge('picard_job_queue_in_flight', lambda: self.counts['in_flight'])
+
+    def submit(self, func, *args, dedupe_key=None, order_key=None):
+        """
+        Queues func(*args) for a worker. Returns False if the job was dropped as a duplicate.
+        """
+        if dedupe_key is not None and self.is_duplicate(dedupe_key):
+            with self.lock:
+                self.counts['duplicates'] += 1
+            return False
+        with self.lock:
+            self.start()
+            self.counts['submitted'] += 1
+            if order_key is None:
+                index = self.next_queue
+                self.next_queue = (self.next_queue + 1) % self.workers
+            else:
+                index = hash(order_key) % self.workers
+        self.queues[index].put((time.monotonic(), func, args))
+        return True
+
+    def is_duplicate(self, dedupe_key):
+        """
+        Records a dedupe key and returns True if it was seen before, by this process or, through the state store,
+        by another one.
+        """
+        with self.lock:
+            if dedupe_key in self.seen_keys:
+                return True
+            self.seen_keys[dedupe_key] = True
+            if len(self.seen_keys) > self.dedupe_size:
+                self.seen_keys.popitem(last=False)
+        if self.store is None:
+            return False
+        try:
+            return not self.store.claim(DEDUPE_NAMESPACE, str(dedupe_key), self.dedupe_ttl)
+        except Exception as e:
+            # Running a job twice is better than dropping it when the store is unavailable.
+            self.logger.error(f"Failed to record dedupe key {dedupe_key}: {e}")
+            return False
+
+    def start(self):
+        """
+        Starts the worker threads on first use.
+        """
+        if self.threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, args=(self.queues[i],), name=f"picard-job-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def worker(self, jobs):
+        """
+        Runs jobs from one queue, recording the time from submission to completion of each one.
+        """
+        while True:
+            submitted_at, func, args = jobs.get()
+            with self.lock:
+                self.counts['in_flight'] += 1
+            outcome = 'completed'
+            try:
+                func(*args)
+            except Exception:
+                outcome = 'failed'
+                self.logger.exception(f"Background job {getattr(func, '__name__', func)} failed")
+            finally:
+                latency = time.monotonic() - submitted_at
+                with self.lock:
+                    self.counts['in_flight'] -= 1
+                    self.counts[outcome] += 1
+                    self.latencies.append(latency)
+                metrics.observe('picard_job_seconds', latency, job=getattr(func, '__name__', 'job'), outcome=outcome)
+                jobs.task_done()
+
+    def stats(self):
+        """
+        Returns the queue depth, job counts and recent job latency percentiles in milliseconds.
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counts)
+        stats['depth'] = sum(jobs.qsize() for jobs in self.queues)
+        for name, fraction in [('p50', 0.50), ('p95', 0.95), ('p99', 0.99)]:
+            stats[f"latency_{name}_ms"] = (
+                round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 1) if latencies else None
+            )
+        return stats
@@ -0,0 +1,198 @@
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram buckets in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def normalize_endpoint(method, path):
+    """
+    Returns a low-cardinality endpoint label such as 'POST /rest/api/2/issue/:id/transitions'.
+    Path segments with digits (record IDs, issue keys) are collapsed to ':id'; short ones like 'v1' or '2' are
+    API versions and are kept.
+    """
+    segments = [':id' if len(segment) > 2 and re.search(r"\d", segment) else segment for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of observations, with its sum and count.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Records one observation.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction of observations.
+        """
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters, gauges and latency histograms, keyed by metric name and labels.
+    Rendered in the Prometheus text format for /metrics and summarized at the end of each run.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        """
+        Adds value to a counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Records one observation in a histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, read, **labels):
+        """
+        Registers a gauge whose value is read by calling read() whenever metrics are rendered.
+        """
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = read
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the duration of the with block in a histogram.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            gauges = sorted(self.gauges.items(), key=lambda item: item[0])
+        lines = []
+        for (name, labels), value in counters:
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), read in gauges:
+            try:
+                lines.append(f"{name}{format_labels(labels)} {read()}")
+            except Exception:
+                continue
+        for (name, labels), histogram in histograms:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        Returns a copy of every counter and histogram, for summarizing only what happened after it.
+        """
+        with self.lock:
+            histograms = {key: (list(histogram.counts), histogram.sum, histogram.count)
+                          for key, histogram in self.histograms.items()}
+            return {'counters': dict(self.counters), 'histograms': histograms}
+
+    def totals(self, name, group_by, since=None):
+        """
+        Returns the total of a counter per value of one label, merged across the other labels.
+        If since is a snapshot, only the increments made after it are counted.
+        """
+        since = since or {'counters': {}, 'histograms': {}}
+        totals = {}
+        with self.lock:
+            for key, value in self.counters.items():
+                if key[0] == name:
+                    group = dict(key[1]).get(group_by)
+                    totals[group] = totals.get(group, 0) + value - since['counters'].get(key, 0)
+        return {group: total for group, total in totals.items() if total}
+
+    def summary(self, name, group_by, errors_name=None, since=None):
+        """
+        Summarizes a histogram per value of one label: count, error count (from the errors_name counter, if given),
+        mean and bucketed p50/p95/p99 latency, merged across the other labels.
+        If since is a snapshot, only the observations made after it are summarized.
+        """
+        since = since or {'counters': {}, 'histograms': {}}
+        merged = {}
+        with self.lock:
+            for key, histogram in self.histograms.items():
+                if key[0] != name:
+                    continue
+                counts, total_sum, count = since['histograms'].get(key, ([0] * len(histogram.counts), 0.0, 0))
+                if histogram.count == count:
+                    continue
+                group = dict(key[1]).get(group_by)
+                total = merged.setdefault(group, Histogram(histogram.buckets))
+                total.counts = [a + b - c for a, b, c in zip(total.counts, histogram.counts, counts)]
+                total.sum += histogram.sum - total_sum
+                total.count += histogram.count - count
+            errors = {}
+            for key, value in self.counters.items():
+                if key[0] == errors_name:
+                    group = dict(key[1]).get(group_by)
+                    errors[group] = errors.get(group, 0) + value - since['counters'].get(key, 0)
+        return {
+            group: {
+                'count': histogram.count,
+                'errors': errors.get(group, 0),
+                'mean': histogram.sum / histogram.count if histogram.count else None,
+                'p50': histogram.percentile(0.50),
+                'p95': histogram.percentile(0.95),
+                'p99': histogram.percentile(0.99)
+            }
+            for group, histogram in merged.items()
+        }
+
+def format_labels(labels):
+    """
+    Formats label pairs as {name="value",...}.
+    """
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+# Process-wide registry used by the HTTP layer, the collector, the job queues and Picard.run.
+metrics = MetricsRegistry()
@@ -0,0 +1,70 @@
+import collections
+import os
+import sys
+import threading
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler. A background thread snapshots the stack of every other thread each interval,
+    so the report shows where the run spends its wall-clock time, including time spent waiting on vendors.
+    Stacks are written in the collapsed format read by flamegraph tools.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts sampling in a daemon thread.
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample, name='picard-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampling thread to exit.
+        """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+    def sample(self):
+        """
+        Records the stack of every thread but this one until stopped.
+        """
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, 'thread').rstrip('0123456789_-'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, limit=15):
+        """
+        Returns the functions most often at the top of a stack, as (function, share of samples) pairs.
+        """
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(function, count / total) for function, count in leaves.most_common(limit)]
+
+    def write(self, path):
+        """
+        Writes the collapsed stacks, one 'frame;frame;frame count' line per distinct stack.
+        """
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
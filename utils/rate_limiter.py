@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill at a fixed rate up to the bucket capacity,
+    and callers block in acquire until a token is available.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, sleeping until one is available and any pause has ended.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for the given number of seconds, e.g. after a Retry-After response.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class AsyncTokenBucket:
+    """
+    Token bucket for coroutines on one event loop. Same behavior as TokenBucket, but acquire awaits instead of
+    blocking a thread.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        """
+        Takes one token, waiting until one is available and any pause has ended.
+        """
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(max(self.paused_until - now, (1 - self.tokens) / self.rate))
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for the given number of seconds, e.g. after a Retry-After response.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
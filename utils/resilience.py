@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a system whose circuit breaker is open.
+    """
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for one system. After failure_threshold consecutive failures the circuit opens
+    and calls fail fast for reset_timeout seconds. Then a single trial call is let through: success closes
+    the circuit again, failure reopens it.
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call must not be made.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            raise CircuitOpenError(self.name, max(retry_in, 0))
+
+    def record_success(self):
+        """
+        Closes the circuit after a successful call.
+        """
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Counts a failed call, opening the circuit once the threshold is reached or a trial call fails.
+        """
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+def is_transient(error):
+    """
+    Returns True for errors worth retrying: connection errors, timeouts, HTTP 429 and 5xx.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+class ResilientService:
+    """
+    Wraps a service class so its read calls (get_pending_approvals, get_all_pending_approvals) get a per-system
+    timeout, retries with jittered exponential backoff, and a circuit breaker. Only transient errors count towards
+    the breaker; an error about one request, such as a 404 for a user with no account in the system, does not.
+    Every other attribute, including the send_* actions, is passed through to the wrapped service unchanged.
+    """
+    READ_METHODS = ('get_pending_approvals', 'get_all_pending_approvals')
+
+    def __init__(self, name, service, timeout=None, retries=2, backoff=0.5, max_backoff=5.0,
+                 failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.service = service
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        if timeout and hasattr(service, 'session'):
+            service.session.timeout = timeout
+
+    def __getattr__(self, name):
+        if name == 'get_all_pending_approvals':
+            # Bulk fetches are paginated through the service's get_pending_approvals_page, so each page is retried
+            # on its own and the pages still stream into the index.
+            fetch_page = getattr(self.service, 'get_pending_approvals_page')
+            return lambda: self.paginate(fetch_page)
+        attribute = getattr(self.service, name)
+        if name in self.READ_METHODS:
+            return lambda *args, **kwargs: self.call(lambda: attribute(*args, **kwargs))
+        return attribute
+
+    def call(self, func):
+        """
+        Calls func through the circuit breaker, retrying transient errors with full-jitter backoff.
+        """
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                result = func()
+            except Exception as e:
+                if not is_transient(e):
+                    # The system answered; the error is about this request, not the system's health.
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def paginate(self, fetch_page):
+        """
+        Yields the pairs of a paginated bulk fetch, calling fetch_page(cursor) for one page at a time through call.
+        fetch_page returns the page's pairs and the cursor of the next page, or None after the last one.
+        """
+        cursor = 0
+        while cursor is not None:
+            pairs, cursor = self.call(lambda: fetch_page(cursor))
+            yield from pairs
@@ -0,0 +1,98 @@
+import json
+import threading
+import uuid
+from datetime import datetime
+from services.approval import approvals_to_dicts, approvals_from_dicts
+
+DONE = 'done'
+FAILED = 'failed'
+UNDELIVERED = 'undelivered'
+
+class RunLedger:
+    """
+    Checkpoints a daily run in the progress database: the run ID, each user's status and the outcome of
+    each (user, system) fetch. Rows are buffered and written in bulk transactions.
+    A resumed run skips users already marked done and retries only the systems that failed for the others.
+    """
+    def __init__(self, db, batch_size=100):
+        self.db = db
+        self.batch_size = batch_size
+        self.run_id = None
+        self.completed = set()
+        self.partial_results = {}
+        self.user_rows = []
+        self.fetch_rows = []
+        self.lock = threading.Lock()
+
+    def start(self, resume=False, prefix=''):
+        """
+        Starts a new run, or picks up the most recent unfinished run when resuming.
+        The prefix keeps the runs of each shard apart. Returns the run ID and whether an earlier run was resumed.
+        """
+        run_id = self.db.get_unfinished_run(prefix) if resume else None
+        resumed = run_id is not None
+        self.completed = set()
+        self.partial_results = {}
+        if resumed:
+            for user_id, status in self.db.get_run_users(run_id):
+                if status == DONE:
+                    self.completed.add(user_id)
+            for user_id, system, status, approvals in self.db.get_run_fetches(run_id, FAILED):
+                results = self.partial_results.setdefault(user_id, {})
+                if status == 'ok':
+                    results[system] = approvals_from_dicts(json.loads(approvals))
+        else:
+            run_id = f"{prefix}{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+            self.db.start_run(run_id)
+        self.run_id = run_id
+        return run_id, resumed
+
+    def is_completed(self, user_id):
+        """
+        Returns True if the user was already fully processed in this run.
+        """
+        return user_id in self.completed
+
+    def previous_results(self, user_id):
+        """
+        Returns the approvals fetched earlier in this run for a user whose other fetches failed, keyed by system.
+        """
+        return self.partial_results.get(user_id)
+
+    def record_fetches(self, user_id, results, failures):
+        """
+        Buffers the outcome of each system fetched for a user. Approvals are only kept for users with failures,
+        since those are the only users a resumed run will need them for.
+        """
+        keep = bool(failures)
+        with self.lock:
+            for system, approvals in results.items():
+                self.fetch_rows.append((self.run_id, user_id, system, 'ok', None, json.dumps(approvals_to_dicts(approvals)) if keep else None))
+            for system, error in failures.items():
+                self.fetch_rows.append((self.run_id, user_id, system, 'failed', str(error), None))
+
+    def mark_user(self, user_id, status):
+        """
+        Buffers a user's status. Safe to call from Slack delivery worker threads.
+        """
+        with self.lock:
+            self.user_rows.append((self.run_id, user_id, status))
+
+    def flush(self, force=True):
+        """
+        Writes buffered rows in one transaction. Without force, only writes once a full batch is buffered.
+        """
+        with self.lock:
+            if not force and len(self.user_rows) < self.batch_size:
+                return
+            user_rows, fetch_rows = self.user_rows, self.fetch_rows
+            self.user_rows, self.fetch_rows = [], []
+        if user_rows or fetch_rows:
+            self.db.save_run_progress(user_rows, fetch_rows)
+
+    def finish(self, status='completed'):
+        """
+        Flushes the ledger and marks the run finished.
+        """
+        self.flush()
+        self.db.finish_run(self.run_id, status)
@@ -0,0 +1,67 @@
+import hashlib
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# State store namespace holding the local date of the last digest scheduled for each user.
+SCHEDULE_NAMESPACE = 'schedule'
+
+def stable_order(user_id):
+    """
+    Returns a sort key that orders users the same way in every process, to break priority ties.
+    """
+    return hashlib.md5(user_id.encode()).hexdigest()
+
+class DeliverySchedule:
+    """
+    Plans when each user's daily digest is sent: at local_time in the user's own time zone, with the users of each
+    time zone spread evenly across the window that starts then, so vendors and Slack see a steady rate instead of
+    one spike. Within a time zone, users with a higher priority get the earlier slots.
+    """
+    def __init__(self, local_time='15:00', window_minutes=60, default_timezone='America/Los_Angeles'):
+        hour, minute = (int(part) for part in local_time.split(':'))
+        self.local_time = time(hour, minute)
+        self.window = timedelta(minutes=window_minutes)
+        self.default_timezone = default_timezone
+
+    def zone(self, name):
+        """
+        Returns the time zone with the given IANA name, or the default time zone if it is missing or unknown.
+        """
+        try:
+            return ZoneInfo(name or self.default_timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            return ZoneInfo(self.default_timezone)
+
+    def plan(self, users, now, priorities=None, last_sent=None):
+        """
+        Returns (due_at, user_id, local_date) for every user, sorted by due time. due_at is the Unix time of the
+        user's next slot that has not been sent yet, and local_date is the user's local date it belongs to.
+        users is an iterable of (user_id, time_zone) pairs, priorities maps user IDs to a number (higher goes
+        first) and last_sent maps user IDs to the local date of the last digest scheduled for them.
+        A slot missed by less than the window, e.g. after a restart, is due right away; older ones move to the next day.
+        """
+        priorities = priorities or {}
+        last_sent = last_sent or {}
+        users_by_zone = defaultdict(list)
+        for user_id, time_zone in users:
+            users_by_zone[self.zone(time_zone).key].append(user_id)
+        plan = []
+        for zone_name, user_ids in users_by_zone.items():
+            zone = ZoneInfo(zone_name)
+            user_ids.sort(key=lambda user_id: (-priorities.get(user_id, 0), stable_order(user_id)))
+            step = self.window / len(user_ids)
+            local_now = datetime.fromtimestamp(now, zone)
+            for rank, user_id in enumerate(user_ids):
+                for day in [local_now.date(), local_now.date() + timedelta(days=1)]:
+                    if last_sent.get(user_id) == day.isoformat():
+                        continue
+                    slot = datetime.combine(day, self.local_time, tzinfo=zone) + step * rank
+                    window_end = datetime.combine(day, self.local_time, tzinfo=zone) + self.window
+                    if window_end <= local_now:
+                        continue
+                    plan.append((max(slot.timestamp(), now), user_id, day.isoformat()))
+                    break
+        # Slots that are already due (catch-up after a restart) keep their priority order.
+        plan.sort(key=lambda entry: (entry[0], -priorities.get(entry[1], 0)))
+        return plan
@@ -0,0 +1,40 @@
+import bisect
+import hashlib
+
+class HashRing:
+    """
+    Consistent hash ring that assigns each user to exactly one shard.
+    Each shard owns many virtual nodes on the ring so users spread evenly, and the hash is stable
+    across processes and hosts, so separate shards never notify the same user.
+    """
+    def __init__(self, shard_count, vnodes=128):
+        self.shard_count = shard_count
+        self.ring = sorted(
+            (self.hash(f"shard-{shard}-{vnode}"), shard)
+            for shard in range(shard_count)
+            for vnode in range(vnodes)
+        )
+        self.points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def hash(key):
+        """
+        Returns a stable 64-bit hash of a key.
+        """
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def shard_for(self, key):
+        """
+        Returns the shard that owns a key.
+        """
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+def parse_shard(text):
+    """
+    Parses a shard given as 'i/N' into (i, N).
+    """
+    index, count = (int(part) for part in text.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}: {text}")
+    return index, count
@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Expired claims of a namespace are deleted once every this many claims.
+PRUNE_EVERY = 1000
+
+class SQLiteStateStore:
+    """
+    Key/value state store backed by SQLite in WAL mode, so the daily run and every webhook worker
+    can read and write the same state. Values are stored as JSON, indexed by (namespace, key).
+    """
+    def __init__(self, db_uri):
+        self.conn = sqlite3.connect(db_uri, timeout=30, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.claims = 0
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS state (
+                                    namespace TEXT NOT NULL,
+                                    key TEXT NOT NULL,
+                                    value TEXT NOT NULL,
+                                    updated_at REAL NOT NULL,
+                                    PRIMARY KEY (namespace, key)
+                                 ) WITHOUT ROWID''')
+
+    def get(self, namespace, key):
+        """
+        Returns the value stored under a key, or None.
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM state WHERE namespace=? AND key=?', (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value):
+        """
+        Stores a value under a key, replacing any existing value.
+        """
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)',
+                              (namespace, key, json.dumps(value), time.time()))
+
+    def delete(self, namespace, key):
+        """
+        Removes a key.
+        """
+        with self.lock:
+            self.conn.execute('DELETE FROM state WHERE namespace=? AND key=?', (namespace, key))
+
+    def claim(self, namespace, key, ttl):
+        """
+        Records a key unless it was already recorded in the last ttl seconds, atomically across processes.
+        Returns True if this call recorded it, False if it was already claimed.
+        """
+        now = time.time()
+        with self.lock:
+            self.claims += 1
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self.claims % PRUNE_EVERY == 0:
+                    self.conn.execute('DELETE FROM state WHERE namespace=? AND updated_at<?', (namespace, now - ttl))
+                else:
+                    self.conn.execute('DELETE FROM state WHERE namespace=? AND key=? AND updated_at<?',
+                                      (namespace, key, now - ttl))
+                cursor = self.conn.execute('INSERT OR IGNORE INTO state (namespace, key, value, updated_at) '
+                                           'VALUES (?, ?, ?, ?)', (namespace, key, 'true', now))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return cursor.rowcount == 1
+
+    def items(self, namespace):
+        """
+        Returns every (key, value) pair in a namespace.
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT key, value FROM state WHERE namespace=?', (namespace,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def replace_namespace(self, namespace, items):
+        """
+        Replaces the whole contents of a namespace with the given (key, value) pairs in one transaction.
+        """
+        now = time.time()
+        rows = [(namespace, key, json.dumps(value), now) for key, value in items]
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.execute('DELETE FROM state WHERE namespace=?', (namespace,))
+                self.conn.executemany('INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)', rows)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def version(self):
+        """
+        Returns SQLite's data version, which changes whenever another connection commits to the database.
+        """
+        with self.lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+class CachedStateStore:
+    """
+    In-memory LRU front for a state store backend. The cache is dropped whenever the backend reports
+    that another process or worker has written to it, so every reader sees the latest state.
+    Values returned from the cache are shared, so callers must set a value again after changing it.
+    """
+    def __init__(self, backend, cache_size=4096):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_version = None
+        self.lock = threading.Lock()
+
+    def validate(self):
+        """
+        Clears the cache if the backend was changed by someone else since the last check.
+        """
+        version = self.backend.version()
+        if version != self.cache_version:
+            self.cache.clear()
+            self.cache_version = version
+
+    def get(self, namespace, key):
+        """
+        Returns the value stored under a key, or None, serving it from the cache when possible.
+        """
+        with self.lock:
+            self.validate()
+            if (namespace, key) in self.cache:
+                self.cache.move_to_end((namespace, key))
+                return self.cache[(namespace, key)]
+        value = self.backend.get(namespace, key)
+        with self.lock:
+            self.remember(namespace, key, value)
+        return value
+
+    def set(self, namespace, key, value):
+        """
+        Stores a value in the backend and the cache.
+        """
+        self.backend.set(namespace, key, value)
+        with self.lock:
+            self.remember(namespace, key, value)
+
+    def delete(self, namespace, key):
+        """
+        Removes a key from the backend and the cache.
+        """
+        self.backend.delete(namespace, key)
+        with self.lock:
+            self.cache.pop((namespace, key), None)
+
+    def claim(self, namespace, key, ttl):
+        """
+        Claims a key in the backend; claims are never cached, since other processes make them too.
+        """
+        return self.backend.claim(namespace, key, ttl)
+
+    def items(self, namespace):
+        """
+        Returns every (key, value) pair in a namespace, read from the backend.
+        """
+        return self.backend.items(namespace)
+
+    def replace_namespace(self, namespace, items):
+        """
+        Replaces the whole contents of a namespace in the backend and drops the namespace from the cache.
+        """
+        self.backend.replace_namespace(namespace, items)
+        with self.lock:
+            for cached in [cached for cached in self.cache if cached[0] == namespace]:
+                del self.cache[cached]
+
+    def remember(self, namespace, key, value):
+        """
+        Adds a value to the cache, evicting the least recently used entry when full.
+        """
+        self.cache[(namespace, key)] = value
+        self.cache.move_to_end((namespace, key))
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+class StateMapping:
+    """
+    Dict-like view of one namespace of a state store, so existing dict-based state can move into the store unchanged.
+    Values that are not JSON-serializable are stored through the optional encode and decode functions.
+    """
+    def __init__(self, store, namespace, encode=None, decode=None):
+        self.store = store
+        self.namespace = namespace
+        self.encode = encode
+        self.decode = decode
+
+    def load(self, key):
+        value = self.store.get(self.namespace, key)
+        return self.decode(value) if value is not None and self.decode else value
+
+    def get(self, key, default=None):
+        value = self.load(key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.load(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.namespace, key, self.encode(value) if self.encode else value)
+
+    def __contains__(self, key):
+        return self.store.get(self.namespace, key) is not None
+
+    def pop(self, key, default=None):
+        value = self.load(key)
+        self.store.delete(self.namespace, key)
+        return default if value is None else value